@@ -163,7 +163,7 @@ class RtdFigure(object):
 
 		if not self.attached:
 			return 
-		dataCom = self.dataCom
+		dataCom = self.dataCom.latest
 		
 		##
 		# if igure has been close we need to build a new one
@@ -201,7 +201,7 @@ class RtdFigure(object):
 			return 
 
 				
-		dataCom = self.dataCom
+		dataCom = self.dataCom.latest
 		## No new data exit 
 		if self.lastDataCounter == dataCom.permanentData["COUNTER.DATA"]:			
 			return False
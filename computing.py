@@ -1,8 +1,10 @@
 import numpy as np
+import weakref
 ##
 # import some constant 
 from .mapping import WIN, T1, T2, BASE, PHI, POL, VIS
 from . import config
+from . import fftbackend
 
 ## for python3
 try:
@@ -10,66 +12,567 @@ try:
 except NameError:
     basestring = (str,bytes)
 
-WIDIM = 0
-OPDIM = 1
+## dimensions are counted from the end so a stack of scans 
+## (K, nWin, nOpd) can be given as well as one scan (nWin, nOpd)
+WIDIM = -2
+OPDIM = -1
 
+## bits of the scan quality flags (see computeScanQuality)
+QUALITY_SATURATED = 1          # too many saturated samples 
+QUALITY_NOT_FINITE = 2         # NaN or inf in the scan 
+QUALITY_OPD_NOT_MONOTONIC = 4  # the opd goes back and forth 
+QUALITY_OPD_STEP = 8           # opd step far from the median step (dropped frames)
+QUALITY_OPD_FROZEN = 16        # the opd does not move
 
-def computeDataCmd(data, opd, map, which=slice(0,None)):
+
+def _takeOpl(a, order):
+    """ return a[..., order] where order has one opl index array per row """
+    index = np.ix_(*[np.arange(n) for n in order.shape[:-1]])
+    return a[tuple(i[...,None] for i in index)+(order,)]
+
+
+def _gatherOpl(a, order):
+    """ same as _takeOpl but order is broadcasted to the rows of a """
+    order = np.broadcast_to(order, a.shape[:-1]+order.shape[-1:])
+    return _takeOpl(a, order)
+
+
+def _emptyOut(out, shape, dtype):
+    """ return out seen with shape or a new array if out is None """
+    if out is None:
+        return np.empty(shape, dtype)
+    return out.reshape(shape)
+
+
+class BufferArena(object):
+    """ Reusable arrays for the per scan products 
+
+    The arrays are handed out by name and kept for the next scans, so the
+    computing functions can write in them (their `out` arguments) instead
+    of allocating new arrays at each scan. 
+    
+    The arena is made for one scan shape, the `key`. The arrays of a 
+    scan are reused `generations` scans later (call next() at each new 
+    scan), the products of the previous scans stay valid until then.
+    The readers (e.g. the snapshots of the scan) registered with lend() 
+    keep their arrays: if one of them is still alive when its array set
+    comes back, a new set is allocated.
+
+    Parameters
+    ----------
+    key : tuple
+        (nWinSci, nOpl, dtype) of the scans 
+    generations : int, optional
+        number of array sets used in turn 
+
+    Example
+    -------
+        >>> arena = BufferArena( (24, 512, np.dtype(float)) )
+        >>> psd = arena.get("PSD", (6,512), float)
+    """
+    def __init__(self, key, generations=2):
+        self.key = key 
+        self.generations = max(int(generations), 1)
+        self.pools = [{} for i in range(self.generations)]
+        self.owners = [[] for i in range(self.generations)]
+        self.generation = 0
+
+    def next(self):
+        """ switch to the array set of the next scan """
+        self.generation = (self.generation+1) % self.generations
+        owners = self.owners[self.generation]
+        if any(owner() is not None for owner in owners):
+            ## still read, the arrays are left to their owners 
+            self.pools[self.generation] = {}
+        del owners[:]
+
+    def lend(self, owner):
+        """ the arrays of the current scan are read by owner until it is deleted 
+
+        owner must accept weak references  
+        """
+        self.owners[self.generation].append(weakref.ref(owner))
+
+    def get(self, name, shape, dtype=float):
+        """ return the array `name` of the current scan 
+
+        A new array is allocated the first time or if shape/dtype has 
+        changed. The content is undefined.  
+        """
+        pool = self.pools[self.generation]
+        shape, dtype = tuple(shape), np.dtype(dtype)
+        buffer = pool.get(name, None)
+        if (buffer is None) or (buffer.shape!=shape) or (buffer.dtype!=dtype):
+            buffer = np.empty(shape, dtype)
+            pool[name] = buffer
+        ## a published (read only) array of an old scan no one reads anymore
+        buffer.flags.writeable = True
+        return buffer
+
+
+def splitScan(rawData, nTel, nSciWin, sciType=None, out=None, block=256):
+    """ split a received scan in window-major opd, science and dark arrays 
+
+    The scan is received as (nOpd, nData). If rawData.T is already 
+    contiguous (and no type change) the outputs are views of it, otherwise 
+    each part is transposed in one pass, by blocks of `block` opd, into 
+    contiguous arrays. 
+
+    Parameters
+    ----------
+    rawData : array (nOpd, nData)
+        the nTel opd first, then the nSciWin science windows and the dark 
+        windows 
+    nTel, nSciWin : int
+    sciType : dtype, optional
+        type of the science and dark windows, default is rawData type. 
+        The opd keep the rawData type 
+    out : tuple, optional
+        (opd, sci, dark) contiguous arrays where the parts are written, 
+        dark is ignored if there is no dark window
+    block : int, optional
+        number of opd transposed at once 
+
+    Outputs
+    -------
+    opd : array (nTel, nOpd)
+    sci : array (nSciWin, nOpd)
+    dark : array (nDarkWin, nOpd) or 0.0 if there is no dark window 
+    """
+    nOpd, nData = rawData.shape
+    sciType = rawData.dtype if sciType is None else np.dtype(sciType)
+    parts = [slice(0,nTel), slice(nTel,nTel+nSciWin), slice(nTel+nSciWin,nData)]
+    types = [rawData.dtype, sciType, sciType]
+    hasDark = nData > nTel+nSciWin 
+
+    if (out is None) and rawData.T.flags.c_contiguous and (sciType == rawData.dtype):
+        opd, sci, dark = [rawData.T[part] for part in parts]
+        return opd, sci, (dark if hasDark else 0.0)
+
+    if out is None:
+        out = [np.empty( (part.stop-part.start, nOpd), dtype) for part, dtype in zip(parts, types)]
+    for part, target in list(zip(parts, out))[0:3 if hasDark else 2]:
+        for start in range(0, nOpd, block):
+            target[:,start:start+block] = rawData[start:start+block, part].T
+
+    opd, sci, dark = out
+    return opd, sci, (dark if hasDark else 0.0)
+
+
+def computeScanQuality(data, opd, saturation=None, maxSaturated=0, 
+                       stepTolerance=1.0, maxBadSteps=0.1, start=0):
+    """ compute the quality flags of a raw scan 
+
+    Parameters
+    ----------
+    data : array (nWin, nOpd) or (K, nWin, nOpd)
+        the raw data 
+    opd : array (nTel, nOpd) or (K, nTel, nOpd)
+        the raw opd of each telescope 
+    saturation : float, optional
+        saturation level of the data, not checked if None 
+    maxSaturated : int, optional
+        number of saturated samples allowed per window 
+    stepTolerance : float, optional
+        opd steps further than stepTolerance*median step from the median
+        step are outliers 
+    maxBadSteps : float, optional
+        fraction of the opd steps allowed to be outliers or in the wrong
+        direction (metrology jitter) before the telescope is flagged 
+    start : int, optional
+        index of the first sample checked (first samples are cleaned)
+
+    Outputs
+    -------
+    qualityWin : uint8 array (nWin,) or (K, nWin)
+        QUALITY_SATURATED, QUALITY_NOT_FINITE bits of each window 
+    qualityTel : uint8 array (nTel,) or (K, nTel)
+        QUALITY_NOT_FINITE, QUALITY_OPD_* bits of each telescope 
+    quality : uint8 or array (K,)
+        the bits of all windows and telescopes, QUALITY_OPD_FROZEN is set 
+        only if all the telescopes are frozen 
+    """
+    data = data[...,start:]
+    opd = opd[...,start:]
+
+    qualityWin = np.zeros(data.shape[:-1], np.uint8)
+    if saturation is not None:
+        nSaturated = (data>=saturation).sum(axis=-1)
+        qualityWin[nSaturated>maxSaturated] |= QUALITY_SATURATED
+    qualityWin[~np.isfinite(data).all(axis=-1)] |= QUALITY_NOT_FINITE
+
+    qualityTel = np.zeros(opd.shape[:-1], np.uint8)
+    qualityTel[~np.isfinite(opd).all(axis=-1)] |= QUALITY_NOT_FINITE
+
+    steps = np.diff(opd, axis=-1)
+    medianStep = np.median(steps, axis=-1)[...,None]
+    frozen = (steps==0.0).all(axis=-1)
+    qualityTel[frozen] |= QUALITY_OPD_FROZEN
+    notMonotonic = ((steps*np.sign(medianStep) < 0.0).mean(axis=-1) > maxBadSteps) & ~frozen
+    qualityTel[notMonotonic] |= QUALITY_OPD_NOT_MONOTONIC
+    outliers = ((np.abs(steps-medianStep) > stepTolerance*np.abs(medianStep)).mean(axis=-1) > maxBadSteps) & ~frozen
+    qualityTel[outliers] |= QUALITY_OPD_STEP
+
+    quality = np.bitwise_or.reduce(qualityWin, axis=-1) |\
+              np.bitwise_or.reduce(qualityTel & ~np.uint8(QUALITY_OPD_FROZEN), axis=-1)
+    quality = quality | (frozen.all(axis=-1)*QUALITY_OPD_FROZEN).astype(np.uint8)
+    return qualityWin, qualityTel, quality
+
+
+def computeOversamplingFactor(opd, fltIn, minSampling=3.5, current=None, hysteresis=0.25):
+    """ estimate how much the scans are oversampled 
+
+    Parameters
+    ----------
+    opd : array (nTel, nOpd)
+        the opd of each telescope (micron)
+    fltIn : array (2,)
+        start/end of the filter where the signal is (wave number) 
+    minSampling : float, optional
+        minimum number of samples per fringe to keep 
+    current : int, optional
+        the factor in use. It is kept as long as the estimated 
+        sampling/minSampling ratio is within hysteresis of 
+        [current, current+1[, so a scan speed jitter does not change it
+    hysteresis : float, optional
+        see current 
+
+    Outputs
+    -------
+    factor : int 
+        the decimation factor (>=1) keeping at least minSampling samples 
+        per fringe on the fastest base 
+    """
+    nOpd = opd.shape[OPDIM]
+    # mean opd step of each telescope 
+    dx = (opd[...,-1] - opd[...,0]) / (nOpd-1)
+    # the fastest base 
+    maxStep = np.max(np.abs(dx[:,None] - dx[None,:]))
+    if maxStep<=0.0:
+        return 1 if current is None else current
+
+    ratio = 1.0 / np.mean(fltIn) / maxStep / minSampling
+    if (current is not None) and (current-hysteresis <= ratio < current+1+hysteresis):
+        return current
+    return max( int(ratio), 1)
+
+
+def computeDecimationFilter(factor, nPhase=7):
+    """ compute the polyphase low-pass filter for decimateData 
+
+    Parameters
+    ----------
+    factor : int 
+        decimation factor 
+    nPhase : int, optional
+        number of taps per phase, must be odd 
+
+    Outputs
+    -------
+    polyphase : array (nPhase, factor) 
+        the windowed sinc filter of nPhase*factor taps, cut at the new 
+        Nyquist frequency, one row per phase 
+    """
+    nTap = nPhase*factor
+    t = np.arange(nTap) - (nTap-1)/2.0
+    h = np.sinc(t/factor) * np.hamming(nTap)
+    return (h/h.sum()).reshape( (nPhase, factor) )
+
+
+def decimateData(data, polyphase):
+    """ low-pass filter and decimate the data along the opd axis 
+
+    The output sample m is centered on the input samples [m*factor, 
+    (m+1)*factor[, the scan is extended by repeating its edges. 
+
+    Parameters
+    ----------
+    data : array (?, nOpd)
+        scans, nOpd is truncated to a multiple of factor 
+    polyphase : array (nPhase, factor)
+        as returned by computeDecimationFilter
+
+    Outputs
+    -------
+    decimated : array (?, nOpd//factor)
+    """
+    nPhase, factor = polyphase.shape
+    nOut = data.shape[OPDIM] // factor
+    half = nPhase//2
+
+    ## one row per output sample and one column per phase 
+    blocks = data[...,0:nOut*factor].reshape( data.shape[:-1]+(nOut, factor) )
+    edgeShape = data.shape[:-1]+(half, factor)
+    blocks = np.concatenate( (np.broadcast_to(blocks[...,0:1,0:1], edgeShape), 
+                              blocks, 
+                              np.broadcast_to(blocks[...,-1:,-1:], edgeShape)
+                             ), axis=-2)
+
+    polyphase = polyphase.astype(data.dtype, copy=False)
+    decimated = np.zeros( data.shape[:-1]+(nOut,), dtype=data.dtype)
+    for p in range(nPhase):
+        decimated += np.dot(blocks[...,p:p+nOut,:], polyphase[p])
+    return decimated
+
+
+class BackgroundModel(object):
+    """ per window and per sample mean of background scans 
+
+    The mean and the variance are updated in place with the Welford 
+    algorithm, averaging more scans does not cost memory. 
+
+    Parameters
+    ----------
+    shape : tuple
+        shape of one scan (nWin, nOpd)
+    size : int or None, optional
+        number of scans to average, None for no limit 
+
+    Attributes
+    ----------
+    mean : array (nWin, nOpd)
+        mean of the background scans 
+    count : int
+        number of background scans averaged 
+    """
+    def __init__(self, shape, size=None):
+        self.shape = tuple(shape)
+        self.size = size
+        self.count = 0
+        self.mean = np.zeros(self.shape, float)
+        self.m2 = np.zeros(self.shape, float)
+        self._delta = np.zeros(self.shape, float)
+
+    def isComplete(self):
+        """ True if `size` scans have been averaged """
+        return (self.size is not None) and (self.count >= self.size)
+
+    def push(self, scan):
+        """ add one background scan to the mean 
+
+        Parameters
+        ----------
+        scan : array (nWin, nOpd)
+
+        Outputs
+        -------
+        test : bool
+            False if the model was already complete (scan ignored)
+        """
+        if self.isComplete():
+            return False
+        self.count += 1
+        delta = self._delta
+        np.subtract(scan, self.mean, out=delta)
+        self.mean += delta/self.count
+        # m2 += delta * (scan - new mean)
+        delta *= scan - self.mean
+        self.m2 += delta
+        return True
+
+    @property
+    def variance(self):
+        """ variance of the background scans per window and sample """
+        if self.count<2:
+            return np.zeros(self.shape, float)
+        return self.m2/(self.count-1)
+
+    def subtract(self, scan):
+        """ subtract the mean to scan in place and return it """
+        scan -= self.mean
+        return scan
+
+
+def computeResampleOperator(opd, map):
+    """ compute the operator that resample the scans on a uniform opd grid 
+
+    The opd of each telescope is replaced by its linear fit along the scan, 
+    so the opd of every base is uniform. The windows of each base are then 
+    linearly interpolated from their measured opd to this uniform grid. 
+    The operator is a 2 points interpolation (a sparse matrix) stored 
+    as index and weight arrays. 
+
+    Parameters
+    ----------
+    opd : array (nTel, nOpd)
+        the measured opd of each telescope 
+    map : PndrsMappingArray or recarray (nWin,)
+        the IOBC mapping array
+
+    Outputs
+    -------
+    index : int array (2, nWin, nOpd)
+        the two measured points used for each resampled point 
+    weight : array (nWin, nOpd)
+        weight of the second point, the first one has 1-weight 
+    opdLinear : array (nTel, nOpd)
+        the uniform opd of each telescope  
+    """
+    nOpd = opd.shape[OPDIM]
+    
+    ##
+    # linear fit of each telescope opd 
+    j = np.arange(nOpd) - (nOpd-1)/2.0
+    opdMean = opd.mean(axis=-1, keepdims=True)
+    slope = ((opd-opdMean)*j).sum(axis=-1, keepdims=True) / (j*j).sum()
+    opdLinear = opdMean + slope*j
+
+    ##
+    # interpolation for each window from its base opd 
+    t1, t2 = map[T1]-1, map[T2]-1
+    x = opd[t2] - opd[t1]
+    grid = opdLinear[t2] - opdLinear[t1]
+
+    order = np.argsort(x, axis=-1, kind="mergesort")
+    xs = _takeOpl(x, order)
+    pos = np.empty(grid.shape, dtype=int)
+    for i in range(len(xs)):
+        pos[i] = np.searchsorted(xs[i], grid[i]) - 1
+    pos = np.clip(pos, 0, nOpd-2)
+
+    x0 = _takeOpl(xs, pos)
+    x1 = _takeOpl(xs, pos+1)
+    dx = x1 - x0
+    weight = np.clip( (grid - x0) / np.where(dx==0, 1.0, dx), 0.0, 1.0)
+
+    index = np.array( [_takeOpl(order, pos), _takeOpl(order, pos+1)] )
+    return index, weight, opdLinear
+
+
+def computeResampledData(data, index, weight):
+    """ resample the data with the operator of computeResampleOperator 
+
+    Parameters
+    ----------
+    data : array (nWin, nOpd) or (K, nWin, nOpd)
+        scan per window
+    index, weight : array 
+        as returned by computeResampleOperator
+
+    Outputs
+    -------
+    resampled : array same shape than data 
+    """
+    d0 = _gatherOpl(data, index[0])
+    d1 = _gatherOpl(data, index[1])
+    return d0 + (d1-d0)*weight.astype(data.dtype, copy=False)
+
+
+def computeCombinationMatrix(map, nOpl, which=slice(0,None), dtype=complex):
+    """ compute the matrices needed to combine data with one matrix product 
+
+    computeDataCmd combines all the bases with one product by cmbMatrix 
+    and reads the backward scans through oplOrder instead of looping on 
+    the windows.
+
+    Parameters
+    ----------
+    map : PndrsMappingArray or recarray
+        of dimension nWin
+    nOpl : int 
+        number of opl per scan 
+    which : slice, optional
+        windows to use inside each base 
+    dtype : dtype, optional
+        type of cmbMatrix, np.complex64 to combine float32 data 
+
+    Outputs
+    -------
+    cmbMatrix : complex array (nBase, nWin)
+        weight (vis*exp(i*phi)) of each window for each base 
+    cmbTels : int array (2, nBase)
+        T1, T2 telescope indices (starting from 0) of each base
+    oplOrder : int array (2, nOpl)
+        opl indices for the forward (0) and backward (1) scan
+    """
+    if map is None:
+        raise RuntimeError("map is None, cannot combine data")
+
+    nBase = np.max(map[BASE])
+    nWin = len(map)
+    cmbMatrix = np.zeros( (nBase,nWin), dtype=dtype )
+    cmbTels = np.zeros( (2,nBase), dtype=int )
+
+    for baseIndex, base in enumerate(range(1,nBase+1)):
+        id = np.where(map[BASE]==base)[0][which]
+        # yorick ( data(order,id) * (map(id).vis * exp(1.i*map(id).phi))(-,) )(,sum);
+        cmbMatrix[baseIndex, id] = map[id][VIS] * np.exp( 1j*map[id][PHI] )
+        cmbTels[:,baseIndex] = map[id[0]][T1]-1, map[id[0]][T2]-1
+
+    u = np.arange(nOpl)
+    oplOrder = np.array([u, u[::-1]])
+    return cmbMatrix, cmbTels, oplOrder
+
+
+def computeDataCmd(data, opd, map, which=slice(0,None), 
+                   cmbMatrix=None, cmbTels=None, oplOrder=None, out=None):
     """ compute and return the combined data 
 
     Parameters
     ----------
     
     data : array
-        the data of shape (nWin, nopd)
+        the data of shape (nWin, nopd) or a stack of scans (K, nWin, nOpd)
     opd : array 
-        array of opd value     
+        array of opd value (nTel, nOpd) or (K, nTel, nOpd)
     map : PndrsMappingArray or recarray
         of dimension nWin
+    which : slice, optional
+        windows to use inside each base 
+    cmbMatrix, cmbTels, oplOrder : array, optional
+        as returned by computeCombinationMatrix. 
+        If not given they are computed from map 
+    out : tuple, optional
+        (dataCmb, opdCmb) arrays where the results are written. 
+        oplOrder must then be the one of computeCombinationMatrix
     
     Outputs
     -------
     opdCmb : array 
           combined opd (reversed if in the other way)
     dataCmb : array 
-          combined data of shape (nBase, nOpd)
+          combined data of shape (nBase, nOpd) or (K, nBase, nOpd)
     """
-    s1 = np.zeros( (3,), dtype=float)
-    s2 = np.zeros( (3,), dtype=float)
-    
-    if map is None:
-        raise RuntimeError("map is None, cannot combine data")
-    
-    nBase = np.max(map[BASE])
-    nRead = data.shape[OPDIM] 
-    dataCmb = np.ndarray( (nBase,nRead), dtype=np.complex )
-    opdCmb  = np.ndarray( (nBase,nRead), dtype=float )
+    if cmbMatrix is None or cmbTels is None or oplOrder is None:
+        cmbMatrix, cmbTels, oplOrder = computeCombinationMatrix(map, 
+                                            data.shape[OPDIM], which)
+    if out is not None:
+        return _computeDataCmdOut(data, opd, cmbMatrix, cmbTels, out)
 
-    ## Build the combined data
-    for baseIndex, base in enumerate(range(1,nBase+1)):
-        id = np.where(map[BASE]==base)[0][which]
-        
+    dx = opd[...,cmbTels[1],:] - opd[...,cmbTels[0],:]
 
-        dx = opd[ map[id[0]][T2]-1 ] - opd[ map[id[0]][T1]-1 ]
-        
-        if dx[1]>dx[0]:
-            order = slice(0,None,1)
-        else:
-            order = slice(-1,None,-1)
-            
-        # yorick ( data(order,id) * (map(id).vis * exp(1.i*map(id).phi))(-,) )(,sum);
-            
-        v = 0.0
-        for i in id:
-            v +=  data[i,order] * (map[i][VIS] * np.exp( 1j*map[i][PHI] ))        
-        dataCmb[baseIndex,:] = v
-        opdCmb[baseIndex,:]  = dx[order]
+    ## 
+    # pick the forward or backward opl order for each base
+    backward = (dx[...,1] <= dx[...,0]).astype(int)
+    order = oplOrder[backward]
+
+    dataCmb = _takeOpl(np.matmul(cmbMatrix, data), order)
+    opdCmb  = _takeOpl(dx, order)
             
     return dataCmb, opdCmb
 
 
+def _computeDataCmdOut(data, opd, cmbMatrix, cmbTels, out):
+    """ computeDataCmd written in out, the backward bases are reversed in place """
+    dataCmb, opdCmb = out
+    np.matmul(cmbMatrix, data, out=dataCmb)
+    for b, (t1, t2) in enumerate(cmbTels.T):
+        np.subtract(opd[...,t2,:], opd[...,t1,:], out=opdCmb[...,b,:])
+
+    backward = opdCmb[...,1] <= opdCmb[...,0]
+    if np.any(backward):
+        dataRow = np.empty(dataCmb.shape[OPDIM], dataCmb.dtype)
+        opdRow = np.empty(opdCmb.shape[OPDIM], opdCmb.dtype)
+        for index in zip(*np.nonzero(backward)):
+            dataRow[...] = dataCmb[index][::-1]
+            dataCmb[index] = dataRow
+            opdRow[...] = opdCmb[index][::-1]
+            opdCmb[index] = opdRow
+    return dataCmb, opdCmb
+
+
 
-def computeDataFFT(data, opd=None, inverse=False):
+def computeDataFFT(data, opd=None, inverse=False, real=False, size=None, out=None):
     """" Compute the FFT of data 
 
     Parameters
@@ -77,10 +580,21 @@ def computeDataFFT(data, opd=None, inverse=False):
     data : array
         the prepared data of shape (nWin, nopd) 
         or the combined data of shape (nBase, nOpd)
+        or a stack of them (K, nWin, nOpd)
     opd : array 
         array of opd value     
     inverse : bool, optional
         If True compute the backward fft 
+    real : bool, optional
+        If True, data are real and only the non-redundant half spectrum
+        (nOpd//2+1 frequencies) is computed. 
+        With inverse=True, data is such a half spectrum and the real 
+        signal of length `size` is returned
+    size : int, optional
+        length of the real signal for real inverse fft. 
+        Default is 2*(nFrequencies-1)
+    out : array or tuple, optional
+        array where the fft is written, or (fftCmb, sigCmb) if opd is given 
 
     Outputs
     -------
@@ -91,27 +605,63 @@ def computeDataFFT(data, opd=None, inverse=False):
     """
         
     nRead = data.shape[OPDIM]
-    
-    if inverse:
-        fft = np.fft.ifftn
+    backend = fftbackend.getBackend()
+    if opd is None or out is None:
+        fftOut, sigOut = out, None
     else:
-        fft = np.fft.fftn    
+        fftOut, sigOut = out
     
-    fftCmb = fft(data, axes=[OPDIM]) / np.sqrt(nRead)
+    if real and inverse:
+        nRead = 2*(nRead-1) if size is None else size
+        fftCmb = backend.irfft(data, nRead, axis=OPDIM, out=fftOut)
+    elif real:
+        fftCmb = backend.rfft(data, axis=OPDIM, out=fftOut)
+    else:
+        if inverse:
+            fft = backend.ifft
+        else:
+            fft = backend.fft
+        fftCmb = fft(data, axis=OPDIM, out=fftOut)
+    # in place to keep the single precision
+    fftCmb *= 1.0/np.sqrt(nRead)
 
     if opd is None:
         return fftCmb
 
-    dxs = opd[:,-2] - opd[:,-3]
-    
-    v = np.linspace(0,1,nRead)
-    sigCmb = np.array([v/dx for dx in dxs])
-
+    if sigOut is None:
+        sigCmb = computeDataSigma(opd, nRead)[...,0:fftCmb.shape[OPDIM]]
+    else:
+        sigCmb = computeDataSigma(opd, nRead, out=sigOut)
     return fftCmb, sigCmb
 
 
+def computeDataSigma(opd, nRead=None, out=None):
+    """ Compute the spectral frequencies of the fft of a scan 
 
-def scaleFilter(fre, flt):
+    Parameters
+    ----------
+    opd : array (?, nOpd)
+        array of opd value
+    nRead : int, optional 
+        length of the fft, default is nOpd 
+    out : array (?, n), optional
+        array where the n first frequencies are written 
+
+    Outputs
+    -------
+    sigCmb : array (?, nRead)
+        the sigma array as returned by computeDataFFT
+    """
+    nRead = opd.shape[OPDIM] if nRead is None else nRead
+    dxs = opd[...,-2] - opd[...,-3]
+    
+    v = np.linspace(0,1,nRead)
+    if out is None:
+        return v/dxs[...,None]
+    return np.divide(v[0:out.shape[OPDIM]], dxs[...,None], out=out)
+
+
+def scaleFilter(fre, flt, turbulenceStrength=None):
     """ Scale the filter according to scaning frequencies
     
     small frequencies will
@@ -119,32 +669,404 @@ def scaleFilter(fre, flt):
     
     Parameters
     ----------
-    fre : array 
+    fre : array (nBase, nOpd) or (K, nBase, nOpd)
         Spectral frequencies 
     flt : array like 
          start,end of the filter        
+    turbulenceStrength : float, optional
+        default is config.defaults["STRENGTH.TURBULENCE"]
+
+    Outputs
+    -------
+    newFlt : array (nBase, 2) or (K, nBase, 2)
+        start,end of the filter for each base 
     """
-    turbulenceStrength = config.defaults["STRENGTH.TURBULENCE"]
+    if turbulenceStrength is None:
+        turbulenceStrength = config.defaults["STRENGTH.TURBULENCE"]
 
-    power = np.abs(fre)[:,-1]/np.abs(fre)[:,-1].min() -1
+    absFre = np.abs(fre)
+    power = absFre[...,-1]/absFre[...,-1].min(axis=-1, keepdims=True) -1
 
     norm = np.array([-1,+1])
-    newFlt = np.ndarray( (power.size,2), dtype=float )
-    freMax = np.max(np.abs(fre))
+    freMax = absFre.max(axis=-1).max(axis=-1)
+
+    newFlt = np.asarray(flt) * (1+turbulenceStrength*norm)**power[...,None]
+    return np.clip(newFlt, 0.0, np.asarray(freMax)[...,None,None])
+
+
+def computeFilterMasks(fre, fltIn, fltOut, turbulenceStrength=None):
+    """ Build the in/out filter masks 
+
+    The masks are given to computeOpdIota and computeFiltered, and to 
+    computeBandIndexes for the band limited computations.
+
+    Parameters
+    ----------
+    fre : array (nBase, nOpd) or (K, nBase, nOpd)
+        Spectral frequencies 
+    fltIn: array (2,) 
+        start/end of the filter where the signal should be.
+    fltOut: array (2,)
+        start/end of the filter without signal.
+    turbulenceStrength : float, optional
+        default is config.defaults["STRENGTH.TURBULENCE"]
+
+    Outputs
+    -------
+    filterInRescaled : array (nBase,2)
+        The filter rescaled for each base
+    maskIn : bool array same shape than fre
+        True inside the rescaled fltIn 
+    maskOut : bool array same shape than fre
+        True inside the rescaled fltOut but outside maskIn 
+    """
+    fltIn  = scaleFilter(fre, fltIn, turbulenceStrength)
+    fltOut = scaleFilter(fre, fltOut, turbulenceStrength)
+
+    #/* build the filter as 0,1 mask */
+    absFre = np.abs(fre)
+    maskIn  = (absFre>fltIn[...,0:1]) & (absFre<fltIn[...,1:2])
+    maskOut = (absFre>fltOut[...,0:1]) & (absFre<fltOut[...,1:2]) & (~maskIn)
+    return fltIn, maskIn, maskOut
+
+
+def computeBandIndexes(maskIn, maskOut):
+    """ Build the index of the bins inside the filter masks 
+
+    computeOpdIota can then work only on the in-band and out-band bins 
+    instead of the full spectrum. Each base has its own number of bins, 
+    index are padded to the largest band with a 0.0 weight.
+
+    Parameters
+    ----------
+    maskIn : bool array (nBase, nOpd) or (K, nBase, nOpd)
+        as returned by computeFilterMasks
+    maskOut : bool array same shape than maskIn
+        as returned by computeFilterMasks
+
+    Outputs
+    -------
+    bands : tuple of 6 arrays (..., nBase, nBin) 
+        (indexIn, weightIn, indexPair, weightPair, indexOut, weightOut)
+        indexPair are the in-band bins followed by an in-band bin, they 
+        are in [0, nOpd-2] so indexPair+1 is always a valid bin  
+    """
+    maskIn = np.asarray(maskIn, dtype=bool)
+    maskOut = np.asarray(maskOut, dtype=bool)
+    maskPair = np.zeros_like(maskIn)
+    maskPair[...,0:-1] = maskIn[...,0:-1] & maskIn[...,1:]
+    nOpd = maskIn.shape[-1]
+
+    bands = []
+    for mask, last in [(maskIn, nOpd-1), (maskPair, nOpd-2), (maskOut, nOpd-1)]:
+        nBin = max(mask.sum(axis=-1).max(), 1)
+        # a stable sort put the True bins first and in order
+        index = np.argsort(~mask, axis=-1, kind="mergesort")[...,0:nBin]
+        # padded index (0 weight) can be anything, keep them in range 
+        index = np.clip(index, 0, max(last, 0))
+        bands.extend( [index, _takeOpl(mask, index).astype(float)] )
+    return tuple(bands)
+
+
+class PsdBuffer(object):
+    """ Ring buffer of psd keeping the running sum of its content 
+
+    Pushing a psd removes the oldest one from the sum and add the new one, 
+    the mean psd is therefore updated without summing the whole buffer. 
+    The sum is recomputed from the buffer each time the ring wraps around
+    to avoid the accumulation of rounding errors. 
+
+    Parameters
+    ----------
+    size : int
+        number of psd in the ring 
+    shape : tuple
+        shape of one psd (nBase, nOpd)
+    dtype : dtype, optional
+        type of the psd 
+
+    Attributes
+    ----------
+    buffer : array (size, nBase, nOpd)
+        the last `size` psd, unfilled slots are 0.0 
+    sum : array (nBase, nOpd)
+        the sum of buffer along the first axis 
+    mean : array (nBase, nOpd)
+        the mean psd, after the first push it is the first psd
+    id : int
+        buffer array index of the last psd 
+    """
+    def __init__(self, size, shape, dtype=float):
+        self.size = size 
+        self.shape = tuple(shape)
+        self.buffer = np.zeros( (size,)+self.shape, dtype)
+        self.sum = np.zeros(self.shape, dtype)
+        self.mean = np.zeros(self.shape, dtype)
+        self.id = -1
+
+    def push(self, psd, out=None):
+        """ Push psd in the ring buffer and return the buffer mean 
+
+        Parameters
+        ----------
+        psd : array (nBase, nOpd) or (K, nBase, nOpd)
+            one psd or a stack of K psd to push in order 
+        out : array same shape than psd, optional
+            array where the means are written 
+
+        Outputs
+        -------
+        meanPsd : array same shape than psd 
+            the buffer mean right after each psd has been pushed
+        """
+        stack = psd.reshape( (-1,)+self.shape )
+        meanPsd = _emptyOut(out, stack.shape, self.mean.dtype)
+        for k, p in enumerate(stack):
+            self.id += 1
+            slot = self.id % self.size
+
+            if slot == self.size-1:
+                self.buffer[slot] = p
+                self.sum[...] = self.buffer.sum(axis=0)
+            else:
+                self.sum -= self.buffer[slot]
+                self.sum += p
+                self.buffer[slot] = p
+
+            if self.id == 0:
+                self.mean[...] = p
+            else:
+                np.divide(self.sum, self.size, out=self.mean)
+            meanPsd[k] = self.mean
+        return meanPsd.reshape(psd.shape)
+
+
+class PsdEma(object):
+    """ Exponentially weighted mean of psd 
+
+    Same interface than PsdBuffer, the mean is updated in place as  
+        mean += (psd - mean)/scans  
+    so the memory does not depend on the averaging time. 
+
+    Parameters
+    ----------
+    scans : float
+        time constant of the average in number of scans (>=1)
+    shape : tuple
+        shape of one psd (nBase, nOpd)
+    dtype : dtype, optional
+        type of the psd 
+
+    Attributes
+    ----------
+    mean : array (nBase, nOpd)
+        the mean psd, after the first push it is the first psd
+    id : int
+        number of psd pushed minus one 
+    """
+    def __init__(self, scans, shape, dtype=float):
+        self.scans = scans
+        self.shape = tuple(shape)
+        self.mean = np.zeros(self.shape, dtype)
+        self.id = -1
+
+    def push(self, psd, out=None):
+        """ Push psd in the average and return the mean 
+
+        Parameters
+        ----------
+        psd : array (nBase, nOpd) or (K, nBase, nOpd)
+            one psd or a stack of K psd to push in order 
+        out : array same shape than psd, optional
+            array where the means are written 
+
+        Outputs
+        -------
+        meanPsd : array same shape than psd 
+            the mean right after each psd has been pushed
+        """
+        stack = psd.reshape( (-1,)+self.shape )
+        meanPsd = _emptyOut(out, stack.shape, self.mean.dtype)
+        weight = 1.0/max(self.scans, 1.0)
+        for k, p in enumerate(stack):
+            self.id += 1
+            if self.id == 0:
+                self.mean[...] = p
+            else:
+                self.mean *= 1.0-weight
+                self.mean += weight*p
+            meanPsd[k] = self.mean
+        return meanPsd.reshape(psd.shape)
+
+    def resize(self, shape):
+        """ interpolate the mean on a new number of frequencies 
+
+        The psd are expected in the FFT order (see numpy.fft.fftfreq) and
+        the same scan step, the mean is interpolated on the new normalized
+        frequencies. Only the last dimension can change. 
+        """
+        shape = tuple(shape)
+        if shape[:-1] != self.shape[:-1]:
+            raise ValueError("Cannot resize a psd of shape %r to %r"%(self.shape, shape))
+        nOld, nNew = self.shape[-1], shape[-1]
+        freOld = np.fft.fftfreq(nOld)
+        order = np.argsort(freOld)
+        freNew = np.fft.fftfreq(nNew)
 
-    for i,p in enumerate(power):
-        newFlt[i] = flt* (1+turbulenceStrength*norm)**p
-        newFlt[i,0] = max(newFlt[i,0], 0.0)
-        newFlt[i,1] = max(newFlt[i,1], 0.0)
-        newFlt[i,0] = min(newFlt[i,0], freMax)
-        newFlt[i,1] = min(newFlt[i,1], freMax)
-    return newFlt
+        flat = self.mean.reshape( (-1,nOld) )
+        mean = np.empty( (len(flat),nNew), self.mean.dtype)
+        for i, m in enumerate(flat):
+            mean[i] = np.interp(freNew, freOld[order], m[order])
+        self.mean = mean.reshape(shape)
+        self.shape = shape
+
+
+def updatePsdBuffer(psd, psdBuffer=None, out=None):
+    """ Push psd in the ring buffer and return the buffer mean 
+
+    If config.defaults["PSD.AVERAGE"] is 'ema' the buffer is a PsdEma 
+    with a time constant of config.defaults["PSD.EMA.SCANS"] scans. It is 
+    rescaled, and not reset, when only the number of frequencies changes. 
+
+    Parameters
+    ----------
+    psd : array (nBase, nOpd) or (K, nBase, nOpd)
+        one psd or a stack of K psd to push in order 
+    psdBuffer : None or PsdBuffer or PsdEma
+        buffer where to save psd.
+        If None (or with the wrong size/shape) it will be constructed 
+    out : array same shape than psd, optional
+        array where the means are written 
+
+    Outputs
+    -------
+    meanPsd : array same shape than psd 
+        the buffer mean right after each psd has been pushed
+    psdBuffer : PsdBuffer or PsdEma
+        The updated buffer 
+    """
+    shape = psd.shape[-2:]
+
+    if config.defaults.get("PSD.AVERAGE", "ring") == "ema":
+        scans = config.defaults["PSD.EMA.SCANS"]
+        if isinstance(psdBuffer, PsdEma) and (psdBuffer.shape!=shape) and\
+           (psdBuffer.shape[:-1]==shape[:-1]):
+            psdBuffer.resize(shape)
+        if (not isinstance(psdBuffer, PsdEma)) or (psdBuffer.shape!=shape):
+            psdBuffer = PsdEma(scans, shape, psd.dtype)
+        psdBuffer.scans = scans 
+    else:
+        psdBufferSize = config.defaults["SIZE.PSD.BUFFER"]
+        # create the buffer if new or if the buffer does not have the
+        # right size 
+        if (not isinstance(psdBuffer, PsdBuffer)) or (psdBuffer.size!=psdBufferSize) or (psdBuffer.shape!=shape):
+            psdBuffer = PsdBuffer(psdBufferSize, shape, psd.dtype)
+
+    meanPsd = psdBuffer.push(psd, out=out)
+    return meanPsd, psdBuffer
+
+
+def computePsdIota(ft, psdBuffer=None, out=None):
+    """ Compute the psd of the fourier coefficients and push it in the buffer
+
+    Parameters
+    ----------
+    ft : array (nBase, nOpd) or (K, nBase, nOpd)
+        Fourier Transform
+    psdBuffer : None or PsdBuffer or PsdEma
+        buffer where to save psd (see updatePsdBuffer)
+    out : tuple, optional
+        (psd, meanPsd) real arrays of the ft shape where the psd and the 
+        mean psd are written 
+
+    Outputs
+    -------
+    psd : array same shape than ft 
+        |ft|**2
+    meanPsd : array same shape than ft 
+        the buffer mean after the psd has been pushed 
+    psdBuffer : PsdBuffer or PsdEma
+        The updated buffer 
+    """
+    if out is None:
+        psd = np.abs(ft)**2.0
+        meanPsd, psdBuffer = updatePsdBuffer(psd, psdBuffer)
+    else:
+        psd = np.abs(ft, out=out[0])
+        np.square(psd, out=psd)
+        meanPsd, psdBuffer = updatePsdBuffer(psd, psdBuffer, out=out[1])
+    return psd, meanPsd, psdBuffer
+
+
+def computePosIota(ft, fre, maskIn, bands=None):
+    """ Compute the fringe position from the phasor of adjacent in-band bins
+
+    Parameters
+    ----------
+    ft : array (nBase, nOpd) or (K, nBase, nOpd)
+        Fourier Transform
+    fre : array (nBase, nOpd) or (K, nBase, nOpd)
+        Spectral frequencies 
+    maskIn : array (nBase, nOpd)
+        the in-band mask of computeFilterMasks
+    bands : tuple, optional
+        the band index of computeBandIndexes, see computeOpdIota 
+
+    Outputs
+    -------
+    pos : array (nBase,) 
+        position in units of 1./fre, 0 beeing the center of the scan
+    """
+    df = fre[...,-2] - fre[...,-3]
+    if bands is None:
+        # filter fft 
+        fftIn = ft*maskIn
+        #YOrick pha = -(fftIn(1:-1,) * conj(fftIn(2:0,)))(sum,);
+        pha = -( fftIn[...,0:-1] * np.conj(fftIn[...,1:])).sum(axis=-1)
+    else:
+        indexPair, weightPair = bands[2:4]
+        pha = -( _gatherOpl(ft, indexPair) * np.conj(_gatherOpl(ft, indexPair+1)) * weightPair).sum(axis=-1)
+    # Convert phasor in piston
+    return np.arctan2(pha.imag, pha.real) / (2.*np.pi *df)
+
+
+def computeSnrIota(psd, noisePsd, maskIn, maskOut, bands=None):
+    """ Compute the IOTA SNR: in-band power of psd over the out-band noise 
+
+    The noise is the out-band power of noisePsd scaled to the in-band 
+    width. computeOpdIota gives SNR.BASE with the psd of the scan and 
+    SNR.BASE.MEAN with the buffer mean psd, both against the mean psd 
+    noise.
+
+    Parameters
+    ----------
+    psd : array (nBase, nOpd) or (K, nBase, nOpd)
+        psd where the signal is taken 
+    noisePsd : array same shape than psd 
+        psd where the noise is taken 
+    maskIn, maskOut : array (nBase, nOpd)
+        masks of computeFilterMasks
+    bands : tuple, optional
+        the band index of computeBandIndexes, see computeOpdIota 
+
+    Outputs
+    -------
+    snr : array (nBase,)
+    """
+    if bands is None:
+        noise = (noisePsd*maskOut).sum(axis=-1) * maskIn.sum(axis=-1) / (maskOut.sum(axis=-1) + 1e-10)
+        return (psd*maskIn).sum(axis=-1) / noise
+    indexIn, weightIn, _, _, indexOut, weightOut = bands
+    noise = (_gatherOpl(noisePsd, indexOut)*weightOut).sum(axis=-1) * weightIn.sum(axis=-1) / (weightOut.sum(axis=-1) + 1e-10)
+    return (_gatherOpl(psd, indexIn)*weightIn).sum(axis=-1) / noise
 
 
 def computeOpdIota(ft, fre, fltIn=None, 
                             fltOut=None, 
                             psdBuffer=None, 
-                            psdBufferId=0
+                            masks=None, 
+                            bands=None, 
+                            out=None
                    ):
     """ 
     Compute the fringe position with the IOTA method.
@@ -154,14 +1076,18 @@ def computeOpdIota(ft, fre, fltIn=None,
     The SNR is computed as the ratio between the averaged power
     in fltIn and in fltOut. Filters are given is units of fre.
 
-    The psd is computed and stored in the in/out psdBuffer array 
+    The psd is computed and pushed in the in/out psdBuffer, the SNR.MEAN
+    is computed from the buffer mean psd 
+
+    A stack of K scans can be given, the psd of each scan are pushed
+    in order in the buffer and all outputs get a leading K dimension. 
 
 
     Parameters
     ----------    
-    ft: array (nBase, nOpd)
+    ft: array (nBase, nOpd) or (K, nBase, nOpd)
          Fourier Transform
-    fre: array (nOpd,)
+    fre: array (nBase, nOpd) or (K, nBase, nOpd)
         Spectral frequencies
     fltIn: array (2,) 
         start/end of the filter where the signal should be.
@@ -169,12 +1095,19 @@ def computeOpdIota(ft, fre, fltIn=None,
     fltOut: array (2,)
         start/end of the filter without signal.
         default is config.filterOut
-    psdBuffer : None or array (config["SIZE.PSD.BUFFER"], nBase, nOpd)
+    psdBuffer : None or PsdBuffer
         buffer where to save psd.
         If None it will be constructed 
-    psdBufferId : int
-        Id of the current psd in buffer.
-        The computed psd will be stored in (psdBufferId+1)%config["SIZE.PSD.BUFFER"]
+    masks : tuple, optional
+        (filterInRescaled, maskIn, maskOut) as returned by computeFilterMasks.
+        If given fltIn and fltOut are ignored
+    bands : tuple, optional
+        the band index as returned by computeBandIndexes(maskIn, maskOut).
+        If given the phasor and the SNR are computed only on the 
+        in-band and out-band bins 
+    out : tuple, optional
+        (psd, meanPsd) real arrays of the ft shape where the psd and the 
+        mean psd are written 
     
     Outputs:
     --------
@@ -185,69 +1118,147 @@ def computeOpdIota(ft, fre, fltIn=None,
     snrMean : array (nBase,)
         The SNR computed from the PSD buffer ring 
         The number of ellements 
-    psdBuffer : array (config.psdBufferSize, nBase, nOpd)
+    psdBuffer : PsdBuffer
         The updated buffer for PSD computation            
-    psdBufferId : int
-        buffer array index of the current psd  
+    meanPsd : array (nBase, nOpd)
+        The mean psd of the buffer 
     filterInRescaled : array (nbase,2)
         The filter rescaled for each base
 
     """
     #ndrtdGetOpdIota,  fftCmb, sigCmb, filterIn, filterOut, posIota, snrIota, snrLast;
 
-    psdBufferSize = config.defaults["SIZE.PSD.BUFFER"]
+    if masks is None:
+        fltIn = config.defaults["FILTER.IN"] if fltIn is None else fltIn
+        fltOut = config.defaults["FILTER.OUT"] if fltOut is None else fltOut
+        masks = computeFilterMasks(fre, fltIn, fltOut)
 
-    fltIn = config.defaults["FILTER.IN"] if fltIn is None else fltIn
-    fltOut = config.defaults["FILTER.OUT"] if fltOut is None else fltOut
+    fltIn, maskIn, maskOut = masks
 
-    fltIn  = scaleFilter(fre, fltIn  )
-    fltOut = scaleFilter(fre, fltOut )
+    psd, meanPsd, psdBuffer = computePsdIota(ft, psdBuffer, out=out)
+    pos = computePosIota(ft, fre, maskIn, bands=bands)
+    snr = computeSnrIota(psd, meanPsd, maskIn, maskOut, bands=bands)
+    snrMean = computeSnrIota(meanPsd, meanPsd, maskIn, maskOut, bands=bands)
 
-    #/* build the filter as 0,1 mask */
-    maskIn  = np.array([ (abs(f)>fi[0]) & (abs(f)<fi[1]) for\
-                         f,fi in zip(fre,fltIn)])
-    maskOut = np.array([ (abs(f)>fo[0]) & (abs(f)<fo[1]) & (~mi) for\
-                         f,fo,mi in zip(fre,fltOut,maskIn) ])
-
-    # filter fft 
-    fftIn = ft*maskIn
-    # compute psd
-    psd = np.abs(ft)**2.0
-
-    #  /* Piston with the IOTA method (validated) */
-    df = fre[:,-2] - fre[:,-3]
-    #YOrick pha = -(fftIn(1:-1,) * conj(fftIn(2:0,)))(sum,);
-    pha = -( fftIn[:,0:-1] * np.conj(fftIn[:,1:])).sum(axis=1)
-
-    # create the buffer if new or if the buffer does not have the
-    # right size 
-    if (psdBuffer is None) or (psdBuffer.shape[1:]!=psd.shape ):
-        psdBuffer = np.zeros( (psdBufferSize,)+psd.shape, psd.dtype )
-        psdBufferId = -1
-        newBuffer = True
-    else:
-        newBuffer = False
+    return pos, snr, snrMean, psdBuffer, meanPsd, fltIn
 
-    psdBufferId += 1
 
-    psdBuffer[psdBufferId%psdBufferSize] = psd
 
-    meanPsd = psd if newBuffer else psdBuffer.mean(axis=0) 
+def computeAbcdMatrix(map, which=slice(0,None), dtype=complex):
+    """ compute the demodulation matrix of the ABCD estimator 
 
-    noise = (meanPsd*maskOut).sum(axis=1) * maskIn.sum(axis=1) / (maskOut.sum(axis=1) + 1e-10)
+    For each base the windows are modeled as  
+        I_k = F + vis_k * (X*cos(phi_k) - Y*sin(phi_k))
+    and the least square (X, Y) are given by the (nWin_base x 2) rows of 
+    the pseudo-inverse of the model. They are stored as one complex row 
+    (X + iY) per base so the phasor of all bases is one matrix product.
+    A base with only two windows in phase opposition (AC) get a real 
+    phasor. 
 
-    # Convert phasor in piston
-    pos = np.array([ (np.arctan2(ph.imag, ph.real) / (2.*np.pi *d)) for ph,d in zip(pha,df)])
-    #pos = np.arctan(pha.imag, pha.real) / (2.*np.pi * df[None].T)
+    Parameters
+    ----------
+    map : PndrsMappingArray or recarray
+        of dimension nWin
+    which : slice, optional
+        windows to use inside each base 
+    dtype : dtype, optional
+        type of demodMatrix, np.complex64 to demodulate float32 data 
 
-    snr = (psd*maskIn).sum(axis=1) / noise
-    snrMean = (meanPsd*maskIn).sum(axis=1) / noise
+    Outputs
+    -------
+    demodMatrix : complex array (nBase, nWin)
+        demodulation weight of each window for each base 
+    abcdTels : int array (2, nBase)
+        T1, T2 telescope indices (starting from 0) of each base
+    """
+    if map is None:
+        raise RuntimeError("map is None, cannot compute the ABCD matrix")
+
+    nBase = np.max(map[BASE])
+    nWin = len(map)
+    demodMatrix = np.zeros( (nBase,nWin), dtype=dtype )
+    abcdTels = np.zeros( (2,nBase), dtype=int )
+
+    for baseIndex, base in enumerate(range(1,nBase+1)):
+        id = np.where(map[BASE]==base)[0][which]
+        phi = map[id][PHI]
+        vis = map[id][VIS]
+        model = np.array([ np.ones_like(phi), vis*np.cos(phi), -vis*np.sin(phi)]).T
+        demod = np.linalg.pinv(model)[1:] # (2, nWin_base) flux removed
+        demodMatrix[baseIndex, id] = demod[0] + 1j*demod[1]
+        abcdTels[:,baseIndex] = map[id[0]][T1]-1, map[id[0]][T2]-1
+
+    return demodMatrix, abcdTels
+
+
+def computeOpdAbcd(data, opd, demodMatrix, abcdTels, coherenceLength):
+    """ Compute the fringe position from the ABCD phasor of each sample 
+
+    The phasor track of each base is computed directly from the windows 
+    (no combination and no FFT). The fringe packet is found where the 
+    phasor power, averaged over one coherence length, is the highest and 
+    its position is the centroid of the power above the noise level 
+    inside the packet. The noise level is the median power of the scan.
+    Position is returned in opd units with 0 beeing the center of the scan.
+
+    The SNR is the packet power over the noise level, it is ~1 without 
+    fringes but its scale is not the one of the IOTA SNR. 
+
+    Parameters
+    ----------
+    data : array (nWin, nOpd) or (K, nWin, nOpd)
+        the prepared data 
+    opd : array (nTel, nOpd) or (K, nTel, nOpd)
+        the centered opd of each telescope 
+    demodMatrix, abcdTels : array
+        as returned by computeAbcdMatrix
+    coherenceLength : float
+        length of the fringe packet in opd unit (e.g. 1/(fltIn[1]-fltIn[0]))
 
-    return pos, snr, snrMean, psdBuffer, psdBufferId, fltIn
+    Outputs
+    -------
+    pos : array (nBase,) or (K, nBase)
+        The piston value for each base
+    snr : array (nBase,) or (K, nBase)
+        The SNR for the piston computation 
+    phasor : complex array (nBase, nOpd) or (K, nBase, nOpd)
+        The phasor track of each base 
+    opdBase : array (nBase, nOpd) or (K, nBase, nOpd)
+        The opd of each base 
+    """
+    nOpd = data.shape[OPDIM]
+    phasor = np.matmul(demodMatrix, data)
+    opdBase = opd[...,abcdTels[1],:] - opd[...,abcdTels[0],:]
+
+    power = phasor.real**2 + phasor.imag**2
+    noise = np.median(power, axis=-1)
+
+    ##
+    # half size of the packet in sample for each base 
+    step = np.abs(opdBase[...,-1] - opdBase[...,0]) / (nOpd-1)
+    half = np.clip( (0.5*coherenceLength/np.maximum(step, 1e-30)).astype(int), 1, nOpd//2)
 
+    ##
+    # power averaged over the packet size with a cumulative sum 
+    u = np.arange(nOpd)
+    cumPower = np.concatenate( (np.zeros(power.shape[:-1]+(1,), power.dtype), 
+                                np.cumsum(power, axis=-1)), axis=-1)
+    lo = np.clip(u - half[...,None], 0, nOpd)
+    hi = np.clip(u + half[...,None] + 1, 0, nOpd)
+    packetPower = (_takeOpl(cumPower, hi) - _takeOpl(cumPower, lo)) / (hi - lo)
+
+    peak = np.argmax(packetPower, axis=-1)
+    snr = _takeOpl(packetPower, peak[...,None])[...,0] / (noise + 1e-30)
+
+    ##
+    # centroid of the power above noise inside the packet 
+    weight = np.maximum(power - noise[...,None], 0.0) * (np.abs(u - peak[...,None]) <= half[...,None])
+    pos = (weight*opdBase).sum(axis=-1) / (weight.sum(axis=-1) + 1e-30)
 
+    return pos, snr, phasor, opdBase
 
-def computeFiltered(ft, fre, filter):
+
+def computeFiltered(ft, fre, filter, mask=None, out=None):
     """ Compute the filtered data from fourier transformed data 
 
     Parameters
@@ -258,6 +1269,11 @@ def computeFiltered(ft, fre, filter):
         spacial frequencies
     filter : string or 2 array         
         "wide", "all", of [start,end] array 
+    mask : bool array (?,nOpd), optional
+        the mask of filter if already computed (e.g. maskIn 
+        of computeFilterMasks). If given filter is ignored 
+    out : tuple, optional
+        (dataFiltered, opdFiltered) arrays where the results are written 
 
     Outputs
     -------
@@ -266,32 +1282,161 @@ def computeFiltered(ft, fre, filter):
     opdFiltered : array (?,nOpd)
         opd filtered
     """
-    nW, nRead = ft.shape
+    nRead = ft.shape[OPDIM]
 
     # compute the sigma array 
-    df = fre[:,1] - fre[:,0]
+    df = fre[...,1] - fre[...,0]
     l = np.linspace(-0.5, 0.5, nRead)
-    opdFiltered = np.array([l/d for d in df])
-
-    if isinstance(filter, basestring):
-        if filter == "wide":
-            mm = np.abs(fre).max(axis=1)
-            mask = np.array([(np.abs(fr) > (0.05*m)) & (np.abs(fr) < (0.45*m)) for fr,m in zip(fre,mm)])
-        elif  filter == "all":
-            mask = 1.0
-        else:
-            raise ValueError("Unknown Filter %r"%filter)    
+    if out is None:
+        opdFiltered = l/df[...,None]
     else:
-        filter = scaleFilter(fre, filter)
-        mask = np.array([ (np.abs(fr) > fl[0]) & (np.abs(fr)<fl[1]) for fr,fl in zip(fre,filter) ])                        
+        opdFiltered = np.divide(l, df[...,None], out=out[1])
+
+    if mask is None:
+        absFre = np.abs(fre)
+        if isinstance(filter, basestring):
+            if filter == "wide":
+                mm = absFre.max(axis=-1, keepdims=True)
+                mask = (absFre > (0.05*mm)) & (absFre < (0.45*mm))
+            elif  filter == "all":
+                mask = 1.0
+            else:
+                raise ValueError("Unknown Filter %r"%filter)    
+        else:
+            filter = scaleFilter(fre, filter)
+            mask = (absFre > filter[...,0:1]) & (absFre < filter[...,1:2])
 
     # now filter
-    fftFilter = ft * mask
-    dataFiltered = np.fft.ifftn( fftFilter, axes=[1]) / np.sqrt(nRead)
+    if out is None:
+        fftFilter = ft * mask
+        dataFiltered = fftbackend.getBackend().ifft(fftFilter, axis=OPDIM)
+    else:
+        fftFilter = np.multiply(ft, mask, out=out[0])
+        dataFiltered = fftbackend.getBackend().ifft(fftFilter, axis=OPDIM, out=out[0])
+    dataFiltered *= 1.0/np.sqrt(nRead)
     return dataFiltered, opdFiltered
 
 
-def computeOplMatrix(pos, snr, mapc, snrMin=2.0, niobate=False):
+def computeZoomMatrix(fre, bands, opd, dtype=complex):
+    """ Build the matrix of the band limited inverse transform 
+
+    The matrix evaluate the inverse transform of the in-band bins on any 
+    opd grid (a zoom DFT). The filtered fringes are then only computed 
+    where they are plotted. 
+
+    Parameters
+    ----------
+    fre : array (nBase, nOpd) 
+        Spectral frequencies 
+    bands : tuple 
+        as returned by computeBandIndexes, only the in-band index and 
+        weight are used 
+    opd : array (nZoom,)
+        the opd grid, in units of 1./fre with 0 beeing the center of the scan
+    dtype : dtype, optional
+        type of zoomMatrix, np.complex64 for a complex64 fft 
+
+    Outputs
+    -------
+    zoomMatrix : complex array (nBase, nBin, nZoom)
+        to be given to computeFilteredZoom 
+    """
+    indexIn, weightIn = bands[0:2]
+    nRead = fre.shape[OPDIM]
+    df = fre[...,1] - fre[...,0]
+
+    # opd grid in unit of scan step from the first point 
+    t = opd * (df*(nRead-1))[...,None] + (nRead-1)/2.0
+    # signed frequency of the in-band bins 
+    k = indexIn - nRead*(indexIn > nRead//2)
+
+    phase = 2j*np.pi/nRead * k[...,:,None] * t[...,None,:]
+    return (weightIn[...,:,None] * np.exp(phase) / nRead**1.5).astype(dtype) 
+
+
+def computeFilteredZoom(ft, bands, zoomMatrix):
+    """ Compute the filtered data on a zoomed opd grid 
+
+    Same as computeFiltered with the maskIn filter but only the in-band 
+    bins are used and the result is evaluated on the grid used to build 
+    zoomMatrix. 
+
+    Parameters
+    ----------
+    ft : array (nBase, nOpd) or (K, nBase, nOpd)
+        Fourier transform
+    bands : tuple 
+        as returned by computeBandIndexes
+    zoomMatrix : complex array (nBase, nBin, nZoom)
+        as returned by computeZoomMatrix
+
+    Outputs
+    -------
+    dataFiltered : array (nBase, nZoom) or (K, nBase, nZoom)
+        Filtered Data 
+    """
+    ftIn = _gatherOpl(ft, bands[0])
+    return np.matmul(ftIn[...,None,:], zoomMatrix)[...,0,:]
+
+
+def computePivotMatrix(mapc, niobate=False):
+    """ compute the base to telescope matrices used by computeOplMatrix 
+
+    There is one system per pivot telescope, computeOplMatrix only picks 
+    the one of its pivot instead of building it at each scan.
+
+    Parameters
+    ----------
+    mapc : PndrsMappingArray or recarray (nBase,)
+        Must have unique base number 
+    niobate : bool
+        True is niobate are used (only one polar is taken)
+
+    Outputs
+    -------
+    M : array (nTel, nTel, nBase+1)
+        M[p] is the matrix (nTel, nBase+1) with the pivot component
+        set to the telescope p 
+    """
+    nTel = max( np.max(mapc[T1]),  np.max(mapc[T2]) )
+    nBase  = np.max(mapc[BASE])
+    # /* If Niobate, we use the matrix of one polar */
+    if niobate: 
+        nBase = nBase // 2
+
+    # Add one component for the pivot in bases
+    M = np.zeros( (nTel, nBase+1), float)
+    for i in range(nBase):
+        M[ mapc[i][T1]-1,i ] = +1
+        M[ mapc[i][T2]-1,i ] = -1
+
+    M = np.repeat(M[None], nTel, axis=0)
+    M[np.arange(nTel), np.arange(nTel), -1] = 1.0
+    return M
+
+
+def _solveStack(a, b):
+    """ solve the stack of systems a x = b 
+
+    Return the solutions and a bool array flagging the non singular systems,
+    the singular ones are left to x = b 
+    """
+    try:
+        return np.linalg.solve(a, b), np.ones(a.shape[:-2], dtype=bool)
+    except np.linalg.LinAlgError:
+        ## this happen when one matrix is singular 
+        ## solve them one by one 
+        x = np.array(np.broadcast_to(b, a.shape[:-1]+b.shape[-1:]))
+        valid = np.ones(a.shape[:-2], dtype=bool)
+        for i in np.ndindex(*a.shape[:-2]):
+            try:
+                x[i] = np.linalg.solve(a[i], x[i])
+            except np.linalg.LinAlgError:
+                valid[i] = False
+        return x, valid
+
+
+def computeOplMatrix(pos, snr, mapc, snrMin=2.0, niobate=False, pivotMatrix=None):
     """ Compute the SNR and the DL offset
     
     Compute the SNR and the DL offset for the 4 DLs based on the
@@ -300,11 +1445,17 @@ def computeOplMatrix(pos, snr, mapc, snrMin=2.0, niobate=False):
     If niobate=True, the computation is done for
     the differential phases
 
+    A stack of K scans can be given, all outputs get then a leading 
+    K dimension. 
+
+    The systems of all the pivot telescopes and all the scans are solved 
+    at once, the best pivot is then selected for each scan.
+
     Parameters
     ----------
-    pos : array (nBase,)
+    pos : array (nBase,) or (K, nBase)
         fringe (piston) position for each bases
-    snr : array (nBase,)
+    snr : array (nBase,) or (K, nBase)
         computed SNR for each base
     mapc : PndrsMappingArray or recarray (nBase,)
         Must have unique base number 
@@ -312,6 +1463,9 @@ def computeOplMatrix(pos, snr, mapc, snrMin=2.0, niobate=False):
         the snr treshold         
     niobate : bool
         True is niobate are used 
+    pivotMatrix : array (nTel, nTel, nBase+1), optional
+        as returned by computePivotMatrix(mapc, niobate), 
+        computed if not given 
     
     Ouputs
     ------
@@ -324,156 +1478,340 @@ def computeOplMatrix(pos, snr, mapc, snrMin=2.0, niobate=False):
     trackingStatus : array (nBase,) of boolean 
         True for telescope tracking               
     """
+    if pivotMatrix is None:
+        pivotMatrix = computePivotMatrix(mapc, niobate)
+    M = pivotMatrix 
+    nTel, _, nBase = M.shape
+    nBase -= 1
 
     ##
-    # init some value and array 
-    nTel = max( np.max(mapc[T1]),  np.max(mapc[T2]) )
-    snrTel = np.zeros( (nTel,), dtype=float)
-    posTel = np.asmatrix(np.zeros( (nTel,), dtype=float))
-    trackingStatus = np.zeros( (nTel,), dtype=bool)
-
-    nBase  = np.max(mapc[BASE])
-    nBaseTotal = nBase
-    # /* If Niobate, we use the matrix of one polar */
-    if niobate: 
-        nBase = nBaseTotal // 2
+    # work on a (K, nBase) stack of scans  
+    pos = np.asarray(pos, dtype=float)
+    snr = np.asarray(snr, dtype=float)
+    shape = pos.shape[:-1]
+    pos = pos.reshape( (-1, pos.shape[-1]) )
+    snr = snr.reshape( (-1, snr.shape[-1]) )
+    nScan = len(pos)
+
+    snrTel = np.zeros( (nScan,nTel), dtype=float)
+    posTel = np.zeros( (nScan,nTel), dtype=float)
+    trueSnrTel = np.zeros( (nScan,nTel), dtype=float)
+    trackingStatus = np.zeros( (nScan,nTel), dtype=bool)
     
-    # init the matrix
-    # Add one component for the pivot in bases
-    # matrix = np.zeros( (nTel, nBase), float)
-
-    M = np.zeros( (nTel, nBase+1), float)
-    for i in range(nBase):
-        M[ mapc[i][T1]-1,i ] = +1
-        M[ mapc[i][T2]-1,i ] = -1
-    ##
-    # M is a matrix     
-    M = np.asmatrix(M)    
     #/* Don't use baseline bellow a SNR threshold */
     snr = snr * (snr>snrMin) + 1e-10
 
     # add componant for the pivot
+    snr  = np.concatenate( (snr, snr.max(axis=1)[:,None]), axis=1 )
+    pos  = np.concatenate( (pos, np.zeros((nScan,1))), axis=1 )
 
-    snr  = np.concatenate( (snr,[np.max(snr)]) )
-    pos  = np.concatenate( (pos, [0.0]) )
-    snrU = np.identity(nBase+1) * snr.repeat(nBase+1).reshape((nBase+1,nBase+1))
     ##
-    # snrU is a matrix 
-    snrU = np.asmatrix(snrU)
-
-    Pos = np.asmatrix(pos).T
-
-    nTelTracked = 0
-    #  Loop on the telescopes to solve the system with
-    #  different pivot telescopes
-    trueSnrTel =  snrTel
+    # Solve the systems (nScan, nTel pivot, nTel, nTel) for all pivots. 
+    # The right hand side is completed by the identity to get the 
+    # inverse diagonal (the SNR) in the same solve   
+    Mt = M[None] * snr[:,None,None,:]
+    MtM = np.matmul(Mt, np.swapaxes(M, -1, -2)[None])
+    Two = np.matmul(Mt, pos[:,None,:,None])
+    rhs = np.concatenate( (Two, np.broadcast_to(np.identity(nTel), MtM.shape)), axis=-1)
+    sol, valid = _solveStack(MtM, rhs)
+
+    #/* Result and associated SNR */
+    posTelAll = sol[...,0]
+    trueSnrTelAll = 1.0/np.diagonal(sol[...,1:], axis1=-2, axis2=-1)
+
+    #/* Clip the wrong one */
+    test = trueSnrTelAll<=snrMin
+    snrTelAll = np.where(test, 0.0, trueSnrTelAll)
+    posTelAll = np.where(test, 0.0, posTelAll)
+    nTelTrackedAll = (snrTelAll>snrMin).sum(axis=-1)
+    snrTelMeanAll = snrTelAll.mean(axis=-1)
+
+    nTelTracked = np.zeros( (nScan,), dtype=int)
+    done = np.zeros( (nScan,), dtype=bool)
+    #  Loop on the telescopes to select the best pivot 
     for pivot in range(nTel):
-        M[:,-1] = 0.0
-        M[pivot,-1] = 1.0
-
-        Mt = M * snrU
-        
-        try:
-            One = np.linalg.inv(Mt * M.T)
-        except np.linalg.LinAlgError as e:
-            ## this happen when the matrix is singular 
-            ## just continue
-            #raise RuntimeError("Ssssssssssssssingular %s"%e)
-            continue 
-
-        Two = Mt * Pos
-
-        #/* Result and associated SNR */
-        posTelP = (One * Two).T;
-        #I = np.asmatrix(np.identity(nTel)) 
-        #snrTelP = 1.0/((One*I).sum(axis=1))
-        snrTelP = 1.0/One.diagonal()
-        
-        #snrTelP = np.asarray(snrTelP).squeeze()
-        #posTelP = np.asarray(posTelP).squeeze()
-
-        #/* Clip the wrong one */
-        #test = snrTelP>snrMin
-        #snrTelP *= np.asarray(test).squeeze()#0.0
-        trueSnrTelP = snrTelP.copy()
-        test = snrTelP<=snrMin
-        snrTelP[test] = 0.0
-        posTelP[test] = 0.0 #*= test#0.0
-
-        
-
         #/* Compute the number of traked telescopes */
-        nTelTracked  = (snrTel>snrMin).sum()
-        nTelTrackedP = (snrTelP>snrMin).sum()
+        nTelTracked  = (snrTel>snrMin).sum(axis=1)
+        nTelTrackedP = nTelTrackedAll[:,pivot]
 
         #/* Check if the estimate with the current pivot
         #   is better than previous */
-        if (nTelTrackedP>nTelTracked) or\
-              ((nTelTrackedP==nTelTracked) and\
-               (snrTelP.mean()>snrTel.mean())):
-            snrTel = snrTelP
-            posTel = posTelP
-            trueSnrTel = trueSnrTelP 
-            nTelTracked = nTelTrackedP             
-            trackingStatus = np.asarray(snrTelP>0.0).squeeze()
-        #/* If all telescopes are tracked, just break now */
-        if niobate and nTelTracked == nTel:
-            break
-
-        
+        better = valid[:,pivot] & (~done) & ((nTelTrackedP>nTelTracked) |\
+                 ((nTelTrackedP==nTelTracked) &\
+                  (snrTelMeanAll[:,pivot]>snrTel.mean(axis=1))))
+
+        snrTel[better] = snrTelAll[better,pivot]
+        posTel[better] = posTelAll[better,pivot]
+        trueSnrTel[better] = trueSnrTelAll[better,pivot]
+        nTelTracked[better] = nTelTrackedP[better]
+        trackingStatus[better] = snrTelAll[better,pivot]>0.0
+
+        #/* If all telescopes are tracked, just stop now */
+        if niobate:
+            done |= nTelTracked == nTel
+            if done.all():
+                break
 
     #/* If only one telescope has high SNR (the pivot),
     #   this means none is OK */
-    if nTelTracked<2:
-        snrTel[...] = 0.0;
-        posTel[...] = 0.0;
-        trackingStatus[...] = False
-    #posTel[...]= np.asarray(posTel).T* (trackingStatus)
-
+    lost = nTelTracked<2
+    snrTel[lost] = 0.0
+    posTel[lost] = 0.0
+    trackingStatus[lost] = False
 
     #/* Recompute each base */ 
-    
-    pos2 = M[:,0:nBase].T * posTel.T
+    pos2 = np.dot(posTel, M[0,:,0:nBase])
 
-    ## return the matrix as array to avoid confusion
-    return (np.asarray(posTel).squeeze(),
-            np.asarray(trueSnrTel).squeeze(),
-            np.asarray(pos2).squeeze(), 
-            trackingStatus
+    return (posTel.reshape(shape+(nTel,)),
+            trueSnrTel.reshape(shape+(nTel,)),
+            pos2.reshape(shape+(nBase,)), 
+            trackingStatus.reshape(shape+(nTel,))
         )
 
-def computeFluxPerTelescope(data, map):
-    """ from data and a map return the flux per telescope
+
+class PistonFilter(object):
+    """ alpha-beta filter of the telescope pistons 
+
+    The pistons measured in closed loop are residuals. An offset o sent by
+    com.sendOffsets is a relative move of the delay line which nulls a 
+    measured piston o (the offsets sent without prediction are POS.TEL), 
+    so the next residual is the open loop piston minus o. The open loop 
+    piston of each telescope is the measured one plus the offsets sent 
+    since the last update. Its position and velocity are tracked with an 
+    alpha-beta filter and extrapolated to the time the next offset 
+    reaches the delay line. 
+    With alpha=1, beta=0 the prediction is the measured piston. 
+
+    The position is kept relative to the delay line at the last update, 
+    the command (offsets sent since then) is therefore bounded by the 
+    offsets of one scan. A telescope which lost the lock is reset to its 
+    measured piston. 
 
     Parameters
     ----------
-    data : array (nBase, nOpd)
-        scan per base
-    map : PndrsMappingArray or recarray (nBase,)
+    nTel : int
+        number of telescopes 
+    alpha, beta : float, optional
+        gains of the filter on the position and the velocity 
+    nPeriod : int, optional
+        number of update intervals kept for the scan period 
+
+    Attributes
+    ----------
+    position : array (nTel,)
+        the open loop piston at `time`, relative to the delay line at `time`
+    velocity : array (nTel,)
+        the piston velocity (piston unit per second)
+    command : array (nTel,)
+        sum of the offsets sent to the delay lines since `time`
+    valid : array (nTel,) of bool 
+        False if the telescope state is not initialised (not tracking)
+    time : float or None
+        time of the last update (second)
+    intervals : array (nPeriod,) 
+        the last update intervals (second), 0.0 if unknown 
+    """
+    def __init__(self, nTel, alpha=0.5, beta=0.1, nPeriod=10):
+        self.nTel = nTel
+        self.alpha = alpha
+        self.beta = beta 
+        self.position = np.zeros( (nTel,), float)
+        self.velocity = np.zeros( (nTel,), float)
+        self.command = np.zeros( (nTel,), float)
+        self.valid = np.zeros( (nTel,), bool)
+        self.time = None 
+        self.intervals = np.zeros( (nPeriod,), float)
+
+    @property
+    def period(self):
+        """ median of the update intervals (second), 0.0 if unknown """
+        intervals = self.intervals[self.intervals>0]
+        return np.median(intervals) if len(intervals) else 0.0
+
+    def update(self, pos, time, tracking, maxGap=None):
+        """ update the state with the piston measured at time 
+
+        Parameters
+        ----------
+        pos : array (nTel,)
+            the measured (closed loop) piston 
+        time : float
+            time of the measurement (second) 
+        tracking : array (nTel,) of bool
+            telescopes with a valid measurement, the others are reset 
+        maxGap : float, optional
+            all the telescopes are reset if the last update is older  
+        """
+        openLoop = np.asarray(pos, float) + self.command
+        tracking = np.asarray(tracking, bool)
+        dt = 0.0 if self.time is None else time - self.time
+
+        reset = ~(self.valid & tracking)
+        if (dt<=0.0) or ((maxGap is not None) and (dt>maxGap)):
+            reset[:] = True 
+        else:
+            predicted = self.position + self.velocity*dt
+            residual = openLoop - predicted
+            self.position = predicted + self.alpha*residual
+            self.velocity = self.velocity + self.beta*residual/dt
+            self.intervals[1:] = self.intervals[0:-1]
+            self.intervals[0] = dt
+
+        self.position[reset] = openLoop[reset]
+        self.velocity[reset] = 0.0
+        ## relative to the delay line now  
+        self.position -= self.command
+        self.command[:] = 0.0
+        self.valid = tracking.copy()
+        self.time = time 
+
+    def predict(self, horizon):
+        """ return the offset to send to reach the piston predicted at 
+        horizon seconds after the last update 
+        """
+        return self.position + self.velocity*horizon - self.command
+
+    def addCommand(self, offset):
+        """ record the offsets sent to the delay lines """
+        self.command += offset
+
+
+def predictPiston(pos, tracking, time, horizon, pistonFilter=None, 
+                  alpha=0.5, beta=0.1, maxGap=None):
+    """ Update the piston filter and predict the offsets at actuation time 
+
+    Parameters
+    ----------
+    pos : array (nTel,)
+        the measured piston per telescope 
+    tracking : array (nTel,) of bool
+        True for the telescopes tracking 
+    time : float
+        time of the measurement (second)
+    horizon : float
+        delay between the measurement and the actuation in unit of the 
+        scan period (median of the update intervals)
+    pistonFilter : None or PistonFilter
+        the filter state. 
+        If None (or with the wrong number of telescopes) it will be constructed 
+    alpha, beta : float, optional
+        gains of a new filter 
+    maxGap : float, optional
+        see PistonFilter.update, in unit of the scan period. Default is 
+        no limit 
+
+    Outputs
+    -------
+    posPredicted : array (nTel,)
+        offsets predicted at actuation time 
+    pistonFilter : PistonFilter
+        the updated filter 
+    """
+    nTel = len(pos)
+    if (pistonFilter is None) or (pistonFilter.nTel != nTel):
+        pistonFilter = PistonFilter(nTel, alpha, beta)
+    pistonFilter.alpha, pistonFilter.beta = alpha, beta
+
+    period = pistonFilter.period
+    pistonFilter.update(pos, time, tracking, 
+                        None if (maxGap is None) or (period<=0) else maxGap*period)
+    return pistonFilter.predict(horizon*pistonFilter.period), pistonFilter
+
+def computeFluxMatrix(map):
+    """ compute the matrices needed by computeFluxPerTelescope 
+
+    The windows of each base are summed with one product by sumMatrix and 
+    the telescope fluxes are solved with pinvMatrix.
+
+    Parameters
+    ----------
+    map : PndrsMappingArray or recarray (nWin,)
         the IOBC mapping array
 
     Outputs
     -------
-    flux :  array (nTel,)
-        flux for each telescope        
+    pinvMatrix : array (nTel, nBase) 
+        pseudo-inverse of the base to telescope incidence matrix 
+    sumMatrix : array (nBase, nWin)
+        1.0 where the window belong to the base 
     """
     nBase = np.max(map[BASE])
     nTel = max(np.max(map[T1]), np.max(map[T2]))
-    pairFlux = np.zeros( (nBase,), dtype=float)
+    
+    sumMatrix = (map[BASE][None,:] == np.arange(1,nBase+1)[:,None]).astype(float)
+    
+    # one window per base gives the telescopes 
+    first = np.argmax(sumMatrix, axis=1)
     bases = np.zeros( (nTel,nBase), dtype=float)
+    bases[map[T1][first]-1, np.arange(nBase)] = 1.0
+    bases[map[T2][first]-1, np.arange(nBase)] = 1.0
+
+    return np.linalg.pinv(bases.T), sumMatrix
 
-    for baseIndex in range(nBase):
-        id = np.where(map[BASE]==(baseIndex+1))[0]
-        pairFlux[baseIndex] = (data[id,:].mean(axis=1)).sum()
-        bases[map[id[0]][T1]-1, baseIndex] = 1.0
-        bases[map[id[0]][T2]-1, baseIndex] = 1.0
+
+def computeFluxPerTelescope(data, map, pinvMatrix=None, sumMatrix=None):
+    """ from data and a map return the flux per telescope
+
+    Parameters
+    ----------
+    data : array (nWin, nOpd) or (K, nWin, nOpd)
+        scan per window
+    map : PndrsMappingArray or recarray (nWin,)
+        the IOBC mapping array
+    pinvMatrix, sumMatrix : array, optional
+        as returned by computeFluxMatrix(map), computed if not given 
+
+    Outputs
+    -------
+    flux :  array (nTel,) or (K, nTel)
+        flux for each telescope        
+    """
+    if pinvMatrix is None or sumMatrix is None:
+        pinvMatrix, sumMatrix = computeFluxMatrix(map)
 
     ##
-    # preform the linear regression 
-    flux,_,_,_ = np.linalg.lstsq(bases.T, pairFlux)
-    return flux
+    # flux per base then the linear regression  
+    pairFlux = np.dot(data.mean(axis=-1), sumMatrix.T)
+    return np.dot(pairFlux, pinvMatrix.T)
+
+def computeDifferentialPhaseMatrix(mapc):
+    """ compute the Up/Down pairing and the phase to telescope projection 
+
+    computeDifferentialPhase solves the base to telescope system with the 
+    same weight for all baselines. The pivot selection of computeOplMatrix 
+    does not depend on the phases, the solution is then a fixed linear 
+    projection for a given mapc. It is computed here once by solving 
+    the system for each base unit vector. 
+
+    Parameters
+    ----------
+    mapc : PndrsMappingArray or recarray (nBase,)
+        Must have unique base number 
+
+    Outputs
+    -------
+    idUp : array of int 
+        index of the 'U' bases
+    idDo : array of int 
+        index of the 'D' bases, paired with idUp  
+    projection : array (nTel, len(idUp))
+        phases per telescope is np.dot(projection, polPhases)
+    """
+    idUp = np.where(mapc.pol=="U")[0]
+    idDo = np.where(mapc.pol=="D")[0]
+
+    nPhase = len(idUp)
+    unitPhases = np.identity(nPhase)
+    projection, _, _, _ = computeOplMatrix(
+                                unitPhases, 
+                                unitPhases*0.0+100.0, #same weight to all baseline
+                                mapc, 
+                                niobate=1
+                            )
+    return idUp, idDo, projection.T
 
-def computeDifferentialPhase(data, mapc):
+
+def computeDifferentialPhase(data, mapc, phaseMatrix=None):
         """ compute the differential phase per telescope 
 
         Parameters
@@ -481,14 +1819,18 @@ def computeDifferentialPhase(data, mapc):
         data : array (nBase, nOpd)
         mapc : PndrsMappingArray or recarray (nBase,)
             Must have unique base number 
+        phaseMatrix : tuple, optional
+            (idUp, idDo, projection) as returned by 
+            computeDifferentialPhaseMatrix(mapc), computed if not given 
         
         Ouputs
         ------
         polPhasesTel : array (nTel,)
             Phases per telescope (in degree)
         """
-        idUp = np.where(mapc.pol=="U")[0];
-        idDo = np.where(mapc.pol=="D")[0];
+        if phaseMatrix is None:
+            phaseMatrix = computeDifferentialPhaseMatrix(mapc)
+        idUp, idDo, projection = phaseMatrix
 
         ## keep only the center of packet         
         tmp = data * (np.abs(data) > 0.75)
@@ -496,13 +1838,4 @@ def computeDifferentialPhase(data, mapc):
         tmp = (tmp[idDo,:] * np.conj( tmp[idUp,:] )).sum(axis=1)
         polPhases = np.arctan2(tmp.imag, tmp.real) *180./np.pi
 
-        polPhasesTel, _, _,_ = computeOplMatrix( 
-                                    polPhases, 
-                                    polPhases*0.0+100.0, #same weight to all baseline
-                                    mapc, 
-                                    niobate=1)
-        return polPhasesTel
-
-
-
-
+        return np.dot(projection, polPhases)
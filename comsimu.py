@@ -148,7 +148,7 @@ def receiveData(device, shape, dtype, timeout=1000):
         scanPoses = [-p/2.0 for p in C["STROKES.SCAN"]]
 
 
-    tels = np.zeros( (nTel, nWave, nOpl), np.complex)
+    tels = np.zeros( (nTel, nWave, nOpl), complex)
 
     sign = [1.0, -1.0][scanCounter%2]
     scanCounter += 1 
@@ -133,6 +133,37 @@ defaults = {
 	"SNR.MIN"    : 2.0,
 	"STRENGTH.TURBULENCE"    : 0.13, 
 	##
+	# Compute the IOTA phasor and SNR only on the bins inside the filters
+	# instead of the full masked spectrum (same result, faster)
+	"TEST.IOTA.BAND" : True, 
+	##
+	# The filter masks are rebuilt only when the last spectral frequency 
+	# of a base (1/opd step) moves by more than this relative tolerance. 
+	# The measured opd step jitters from scan to scan. 
+	"MASK.SIGMA.TOLERANCE" : 0.01, 
+	##
+	# The fringe position estimator of the 'track' and 'snr' recipes 
+	# 'iota' : combined data, FFT and IOTA method 
+	# 'abcd' : phasor of each sample from the ABCD windows, position of 
+	#          the fringe packet. Its SNR is not at the IOTA scale.
+	# per scan (comsimu map, 12 bases):  512 OPL abcd 0.9 ms, iota 0.7 ms
+	#                                   4096 OPL abcd 4.5 ms, iota 4.7 ms
+	"OPD.ESTIMATOR" : {"track": "iota", "snr": "iota"}, 
+	##
+	# The SNR min for tracking with the 'abcd' estimator, SNR.MIN is at the
+	# IOTA scale. Without fringes the ABCD SNR of a gaussian noise scan is 
+	# 3.4 (median) and below 8.7 for 99.9% of the scans (comsimu map, 512 OPL)
+	"SNR.MIN.ABCD" : 10.0, 
+	##
+	# Send to the delay lines the offsets predicted at actuation time 
+	# by an alpha-beta filter of the telescope pistons instead of the 
+	# last measured ones. HORIZON is in unit of scan period. 
+	# ALPHA=1, BETA=0 gives back the measured offsets 
+	"TEST.PREDICT.OFFSET" : False, 
+	"PREDICT.ALPHA" : 0.5, 
+	"PREDICT.BETA" : 0.1, 
+	"PREDICT.HORIZON" : 1.0, 
+	##
 	# Substract the dark windows to raw data
 	# should be True in Normal operation 
 	"TEST.SUBSTRACT.DARKWIN" : True, 
@@ -142,19 +173,122 @@ defaults = {
 	##
 	# Number of value to clean at begining of a scan 
 	"N.FIRST.SCAN.TO.CLEAN": 3, 
+	##
+	# Number of scans averaged in the background after "Save Bckg" 
+	# (None to average until the next "Save Bckg")
+	"BACKGROUND.N.SCAN": 10, 
+	##
+	# Screen the received scans and skip the reduction (and the offsets) 
+	# of the bad ones. QUALITY.REJECT is a sum of the computing.QUALITY_* 
+	# bits: 1 saturated, 2 NaN/inf, 4 opd not monotonic, 
+	#       8 opd step outlier, 16 opd frozen 
+	# Only the NaN/inf and frozen scans are rejected by default, the other 
+	# bits are recorded in QUALITY. 
+	# the saturation is not checked if QUALITY.SATURATION is None
+	# an opd is not monotonic (has step outliers) if more than 
+	# QUALITY.BAD.STEP.FRACTION of its steps go backward (are further than 
+	# QUALITY.STEP.TOLERANCE*median step from the median step)
+	"TEST.SCREEN.DATA": True, 
+	"QUALITY.SATURATION": None, 
+	"QUALITY.SATURATION.COUNT": 0, 
+	"QUALITY.STEP.TOLERANCE": 1.0, 
+	"QUALITY.BAD.STEP.FRACTION": 0.1, 
+	"QUALITY.REJECT": 18, 
 
 	##
 	# Compute or not the oversmapling factor 
 	# Oversampling factor will be 1 if False
+	# The scans are low-pass filtered and decimated by this factor 
+	# in prepareData
 	"TEST.COMPUTE.OVERSAMP.FACTOR": False,
 	##
+	# Minimum number of samples per fringe kept by the decimation 
+	"MIN.SAMPLING": 3.5, 
+	##
+	# The oversampling factor is kept while the estimated one is within 
+	# this margin of it, a change resets the reduction (TEST.NEW)
+	"OVERSAMP.HYSTERESIS": 0.25, 
+	##
 	# Process the oversampling when filtering fringes
 	"TEST.PROCESS.OVERSAMP": True, 
 
+	##
+	# Process the scans in single precision (float32/complex64) from 
+	# receiveData on. The OPD and the telescope solve stay in float64.
+	# Accuracy against double precision on 30 simulated scans 
+	# (comsimu, 4 telescopes, 512 OPL, SNR 10 to 330):
+	#   POS.TEL : max 1.2e-7 um, median 2e-8 um 
+	#   SNR.TEL : max 1.8e-7 relative, median 5e-8 
+	#   STATUS.TEL.TRACKING identical 
+	"TEST.SINGLE.PRECISION": False, 
+
+	##
+	# Resample the scans on a uniform opd grid (linear fit of each 
+	# telescope opd) in prepareData 
+	"TEST.RESAMPLE.OPD": False, 
+	##
+	# The resampling operator is recomputed only when the opd moves 
+	# by more than this tolerance (micron) 
+	"RESAMPLE.OPD.TOLERANCE": 0.02, 
+
+	##
+	# Compute only the half spectrum of the (real) raw data
+	# FFT.SCI.RAW has then N.OPL//2+1 frequencies
+	"TEST.REAL.FFT.RAW": True, 
+
+	##
+	# The FFT backend "pyfftw", "scipy" or "numpy" 
+	# None to take the first available in this order 
+	"FFT.BACKEND": None, 
+	##
+	# Number of threads used by the FFT backend (-1 for all cores)
+	"FFT.WORKERS": 1, 
+	##
+	# Number of threads running the independent steps of the recipies 
+	# (e.g. the raw and the combined data branches) 
+	# 1 to run them one after the other 
+	"STEP.WORKERS": 1, 
+	##
+	# Receive the scans in a thread (process.AcquisitionThread) while the 
+	# previous scan is reduced. The scans wait in a queue of SCAN.QUEUE.SIZE 
+	# scans, when it is full the acquisition waits (no scan dropped). 
+	# The plot recipies are only run on the last received scan 
+	"TEST.ACQUISITION.THREAD": False, 
+	"SCAN.QUEUE.SIZE": 4, 
+	##
+	# Write the per scan products (combined data, fft, psd, filtered data)
+	# in arrays reused from scan to scan instead of new arrays. 
+	# The arrays of a scan are reused BUFFER.ARENA.GENERATIONS scans later, 
+	# unless a snapshot of the scan (DataCommunication.latest) is still held. 
+	# Views taken out of a snapshot do not hold it, copy them to keep them.
+	# With 1 generation the latest snapshot is always held: no reuse. 
+	"TEST.BUFFER.ARENA": False, 
+	"BUFFER.ARENA.GENERATIONS": 2, 
+
+	##
+	# Half width (micron) of the opd window where the filtered fringes 
+	# are evaluated by a zoomed inverse transform of the in-band bins. 
+	# None to inverse transform the full spectrum 
+	"FILTER.ZOOM.RANGE": None, 
+	##
+	# Step (micron) of the zoomed opd grid 
+	"FILTER.ZOOM.STEP": 0.1,
+	##
+	# Recompute SCAN.SCI.CMB and SCAN.OPD.CMB from the combined fft when 
+	# filtering. Only needed if something use them after filterCombinedData
+	"TEST.INVERSE.FFT.CMB": False, 
+
 	##
 	# the size of the ring buffer that record the last N PSD for 
 	# smooth plot purpose 
 	"SIZE.PSD.BUFFER": 10, 
+	##
+	# How the PSD are averaged for SNR.BASE.MEAN and the psd plot 
+	# 'ring' : mean of the last SIZE.PSD.BUFFER psd 
+	# 'ema'  : exponential average with a time constant of PSD.EMA.SCANS
+	#          scans, one psd in memory. Kept when the scan size changes.
+	"PSD.AVERAGE": "ring", 
+	"PSD.EMA.SCANS": 10.0, 
 
 
 	###############################################
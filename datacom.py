@@ -19,6 +19,9 @@ All configuration and data are stored in 3 dictionaries:
 .data: data parameters 
 ----------------------
 All the following parameters are deleted when a new scan arrive.  
+When the recipies of a scan are done the .data (with .config, .permanentData and 
+the steps done) is published as a read only ScanSnapshot in the `.latest` attribute. 
+Readers in other threads (e.g. plots) should use `.latest` and never wait for the scans. 
 
 |              Param               |       constructor        |     Alterator      |         type             |
 |----------------------------------|--------------------------|--------------------|--------------------------|
@@ -28,19 +31,21 @@ All the following parameters are deleted when a new scan arrive.
 | TIME.MJD                         | receiveData              |                    | float                    |
 | TIME.ELAPSED                     | receiveData              |                    | float                    |
 | TEST.NEW                         | receiveData              |                    | bool                     |
-| SCAN.SCI.OFFSET                  | saveDataOffset           |                    | float (N.WIN.SCI,N.OPL)  |
-| SCAN.DARK.OFFSET                 | saveDataOffset           |                    | float (N.WIN.DARK,N.OPL) |
+| QUALITY.WIN                      | screenData               |                    | uint8 (N.WIN.SCI,)       |
+| QUALITY.TEL                      | screenData               |                    | uint8 (N.TEL,)           |
+| QUALITY                          | screenData               |                    | uint8                    |
 | SCAN.SCI.CMB                     | combineData              | filterCombinedData | float (N.BASE.N.OPL)     |
 | SCAN.OPD.CMB                     | combineData              | filterCombinedData | float (N.BASE.N.OPL)     |
 | FFT.SCI.CMB                      | computeDataFFTCmb        |                    | float (N.BASE,N.OPL)     |
 | FFT.SIGMA                        | computeDataFFTCmb        |                    | float (N.BASE,N.OPL)     |
 | POS.BASE                         | computeOpdPerBase        |                    | float (N.BASE,)          |
 | SNR.BASE                         | computeOpdPerBase        |                    | float (N.BASE,)          |
-| SNR.BASE.MEAN                    | computeOpdPerBase        |                    | float (N.BASE,)          |
+| SNR.BASE.MEAN                    | computePsdCmb            |                    | float (N.BASE,)          |
 | POS.TEL                          | computeOpdPerTelescope   |                    | float (N.TEL,)           |
 | SNR.TEL                          | computeOpdPerTelescope   |                    | float (N.TEL,)           |
 | POS.BASE.RECOMP                  | computeOpdPerTelescope   |                    | float (N.BASE,)          |
 | STATUS.TEL.TRACKING              | computeOpdPerTelescope   |                    | bool (N.TEL,)            |
+| POS.TEL.PREDICTED                | predictOffsets           |                    | float (N.TEL,)           |
 | SCAN.SCI.CMB.FILTERED            | filterCombinedData       |                    | float (N.BASE, N.OPL)    |
 | SCAN.OPD.CMB.FILTERED            | filterCombinedData       |                    | float (N.BASE, N.OPL)    |
 | SCAN.SCI.RAW                     | prepareRaw               | computeDataFFTRaw  | float (N.WIN.SCI, N.OPL) |
@@ -50,6 +55,9 @@ All the following parameters are deleted when a new scan arrive.
 | FFT.SIGMA.RAW                    | computeDataFFTRaw        |                    | float (N.WIN.SCI, N.OPL) |
 | SCAN.SCI.CMB.FILTERED.NORMALIZED | normalizeDataCmb         |                    | float (N.BASE, N.OPL)    |
 | PHASE.TEL                        | computeDifferentialPhase |                    | float (N.TEL,)           |
+| PSD.MEAN                         | computePsdCmb            |                    | float (N.BASE,N.OPL)     |
+| PSD.CMB                          | computePsdCmb            |                    | float (N.BASE,N.OPL)     |
+| PHASOR.SCI                       | computeOpdPerBaseAbcd    |                    | complex (N.BASE,N.OPL)   |
 
 
 .permanentData: Permanent Data Parameters
@@ -61,10 +69,12 @@ This parameter are not erazed but are linked to data (not config)
 |------------------|-------------|-------------------|---------------------|
 | COUNTER.DATA     | __init__    | receiveData       | long                |
 | COUNTER.CONFIG   | __init__    | prepareData       | int                 |
-| DATA.BUFFER.PSD  | __init__    | computeOpdPerBase | (10,N.BASE, N.SCAN) |
-| ID.BUFFER        | __init__    | computeOpdPerBase | int                 |
-| SCAN.SCI.OFFSET  | prepareData |                   | (N.BASE, N.SCAN)    |
-| SCAN.DARK.OFFSET | prepareData |                   | (N.BASE, N.SCAN)    |
+| DATA.BUFFER.PSD  | __init__    | computePsdCmb     | PsdBuffer or PsdEma |
+| BACKGROUND.SCI   | __init__    | prepareData       | BackgroundModel     |
+| BACKGROUND.DARK  | __init__    | prepareData       | BackgroundModel     |
+| TIMES.TRACK      | __init__    | sendOffsets       | float (10,)         |
+| PISTON.FILTER    | __init__    | predictOffsets    | PistonFilter        |
+| BUFFER.ARENA     | __init__    | getBuffer         | BufferArena         |
 | SEARCH.DL.POS    | __init__    |                   | (?, N.TEL)          |
 | SEARCH.SNR       | __init__    |                   | (?, N.TEL)          |
 
@@ -75,47 +85,105 @@ This parameter are not erazed but are linked to data (not config)
 Parameters related to instrument configuration and computation 
 
 
-|            Param             |    constructor    |  Alterator  |         type             |
-|------------------------------|-------------------|-------------|--------------------------|
-| N.WIN.SCI                    | __init__          | receiveData | int                      |
-| N.WIN.DARK                   | __init__          | receiveData | int                      |
-| N.POLAR                      | __init__          | receiveData | int                      |
-| N.OPL                        | __init__          | receiveData | int                      |
-| N.BASE                       | __init__          | prepareData | int  N.TRUE.BASE*N.POLAR |
-| N.TRUE.BASE                  | __init__          | prepareData | int                      |
-| N.TEL                        | __init__          | prepareDa   | int                      |
-| NS.DL                        | __init__          | receiveData | (N.TEL,)                 |
-| OBC                          | __init__          | prepareData | string                   |
-| MAP                          | __init__          | prepareData | recarray(N.WIN.SCI,)     |
-| MAPC                         | __init__          | prepareData | recarray(N.BASE,)        |
-| SNR.MIN                      | __init__          | prepareData | float                    |
-| FILTER.IN                    | __init__          |             | float (2,)               |
-| FILTER.OUT                   | __init__          |             | float (2,)               |
-| STRENGTH.TURBULENCE          | config.defaults   |             | float                    |
-| TEST.SUBSTRACT.DARKWIN       | __init__          | prepareData | bool                     |
-| TEST.COMPUTE.OVERSAMP.FACTOR | config.defaults   |             | bool                     |
-| TEST.PROCESS.OVERSAMP        | config.defaults   |             | bool                     |
-| ID.OVERSAMPLING              | preparedData      |             | int(-undefined-,)        |
-| FREQ.MAX                     | preparedData      |             | float                    |
-| FILTER.IN.RESCALED           | computeOpdPerBase |             | float (2,)               |
-| N.FIRST.SCAN.TO.CLEAN        | config.defaults   |             | int                      |
+|            Param             |    constructor     |  Alterator  |            type           |
+|------------------------------|--------------------|-------------|---------------------------|
+| N.WIN.SCI                    | __init__           | receiveData | int                       |
+| N.WIN.DARK                   | __init__           | receiveData | int                       |
+| N.POLAR                      | __init__           | receiveData | int                       |
+| N.OPL                        | __init__           | receiveData | int                       |
+| N.BASE                       | __init__           | prepareData | int  N.TRUE.BASE*N.POLAR  |
+| N.TRUE.BASE                  | __init__           | prepareData | int                       |
+| N.TEL                        | __init__           | prepareDa   | int                       |
+| NS.DL                        | __init__           | receiveData | (N.TEL,)                  |
+| OBC                          | __init__           | prepareData | string                    |
+| MAP                          | __init__           | prepareData | recarray(N.WIN.SCI,)      |
+| MAPC                         | __init__           | prepareData | recarray(N.BASE,)         |
+| SNR.MIN                      | __init__           | prepareData | float                     |
+| FILTER.IN                    | __init__           |             | float (2,)                |
+| FILTER.OUT                   | __init__           |             | float (2,)                |
+| STRENGTH.TURBULENCE          | config.defaults    |             | float                     |
+| TEST.IOTA.BAND               | config.defaults    |             | bool                      |
+| OPD.ESTIMATOR                | config.defaults    |             | dict                      |
+| SNR.MIN.ABCD                 | config.defaults    |             | float                     |
+| TEST.PREDICT.OFFSET          | config.defaults    |             | bool                      |
+| PREDICT.ALPHA                | config.defaults    |             | float                     |
+| PREDICT.BETA                 | config.defaults    |             | float                     |
+| PREDICT.HORIZON              | config.defaults    |             | float                     |
+| TEST.SUBSTRACT.DARKWIN       | __init__           | prepareData | bool                      |
+| TEST.COMPUTE.OVERSAMP.FACTOR | config.defaults    |             | bool                      |
+| MIN.SAMPLING                 | config.defaults    |             | float                     |
+| OVERSAMP.HYSTERESIS          | config.defaults    |             | float                     |
+| TEST.PROCESS.OVERSAMP        | config.defaults    |             | bool                      |
+| TEST.SINGLE.PRECISION        | config.defaults    |             | bool                      |
+| MASK.SIGMA.TOLERANCE         | config.defaults    |             | float                     |
+| TEST.REAL.FFT.RAW            | config.defaults    |             | bool                      |
+| TEST.RESAMPLE.OPD            | config.defaults    |             | bool                      |
+| RESAMPLE.OPD.TOLERANCE       | config.defaults    |             | float                     |
+| FFT.BACKEND                  | config.defaults    |             | string or None            |
+| FFT.WORKERS                  | config.defaults    |             | int                       |
+| FILTER.ZOOM.RANGE            | config.defaults    |             | float or None             |
+| FILTER.ZOOM.STEP             | config.defaults    |             | float                     |
+| TEST.INVERSE.FFT.CMB         | config.defaults    |             | bool                      |
+| N.OPL.RAW                    | __init__           | receiveData | int                       |
+| OVERSAMP.FACTOR              | prepareData        |             | int                       |
+| FILTER.DECIMATION            | prepareData        |             | float (?,OVERSAMP.FACTOR) |
+| ID.OVERSAMPLING              | preparedData       |             | int(-undefined-,)         |
+| MATRIX.CMB                   | prepareData        |             | complex(N.BASE,N.WIN.SCI) |
+| ID.TEL.CMB                   | prepareData        |             | int (2,N.BASE)            |
+| ID.OPL.ORDER                 | prepareData        |             | int (2,N.OPL)             |
+| MATRIX.ABCD                  | prepareData        |             | complex(N.BASE,N.WIN.SCI) |
+| ID.TEL.ABCD                  | prepareData        |             | int (2,N.BASE)            |
+| MATRIX.PIVOT                 | prepareData        |             | float (N.TEL,N.TEL,?)     |
+| MATRIX.PHASE                 | prepareData        |             | tuple or None             |
+| MATRIX.FLUX.PINV             | prepareData        |             | float (N.TEL,N.BASE)      |
+| MATRIX.FLUX.SUM              | prepareData        |             | float (N.BASE,N.WIN.SCI)  |
+| FREQ.MAX                     | preparedData       |             | float                     |
+| RESAMPLE.OPERATORS           | resampleData       |             | list                      |
+| FILTER.IN.RESCALED           | computeFilterMasks |             | float (N.BASE,2)          |
+| MASK.IN                      | computeFilterMasks |             | bool (N.BASE,N.OPL)       |
+| MASK.OUT                     | computeFilterMasks |             | bool (N.BASE,N.OPL)       |
+| MASK.KEY                     | computeFilterMasks |             | tuple                     |
+| MASK.SIGMA                   | computeFilterMasks |             | float (N.BASE,)           |
+| BAND.INDEX                   | computeFilterMasks |             | tuple of 6 (N.BASE,?)     |
+| OPD.ZOOM                     | computeFilterMasks |             | float (?,)                |
+| MATRIX.ZOOM                  | computeFilterMasks |             | complex (N.BASE,?,?)      |
+| N.FIRST.SCAN.TO.CLEAN        | config.defaults    |             | int                       |
+| BACKGROUND.N.SCAN            | config.defaults    |             | int or None               |
+| STEP.WORKERS                 | config.defaults    |             | int                       |
+| TEST.SCREEN.DATA             | config.defaults    |             | bool                      |
+| QUALITY.SATURATION           | config.defaults    |             | float or None             |
+| QUALITY.SATURATION.COUNT     | config.defaults    |             | int                       |
+| QUALITY.STEP.TOLERANCE       | config.defaults    |             | float                     |
+| QUALITY.BAD.STEP.FRACTION    | config.defaults    |             | float                     |
+| QUALITY.REJECT               | config.defaults    |             | int                       |
+| TEST.BUFFER.ARENA            | config.defaults    |             | bool                      |
+| TEST.ACQUISITION.THREAD      | config.defaults    |             | bool                      |
+| SCAN.QUEUE.SIZE              | config.defaults    |             | int                       |
+| BUFFER.ARENA.GENERATIONS     | config.defaults    |             | int                       |
 
 
 """
 
 recipiesInfo = """
-            getdata     : get and prepare data 
+            getdata     : get, screen and prepare data 
                         Will fail and raise Exception if problem 
 
-            getdatasafe : get and prepare the data 
+            getdatasafe : get, screen and prepare the data 
                           If failed (e.g. communication problems, or scan not running)
                           wait a few before giving back the hand for an other try  
 
+            The track, filter, filterPsd, snr and niobate recipies do nothing 
+            if the scan is rejected by the screening (TEST.SCREEN.DATA)
+
             track     : run for tracking the fringes
                         - Combine the data
                         - Compute the FFT of combined data
                         - Compute the OPD per base
+                        (or the OPD per base from the ABCD phasors if 
+                         OPD.ESTIMATOR['track'] is 'abcd')
                         - Compute the OPD per telescope
+                        - predict the offset at actuation time 
+                          if TEST.PREDICT.OFFSET
                         - send offset to the telescope
 
             filter    : run to plot filtered data
@@ -131,6 +199,7 @@ recipiesInfo = """
 
             snr       : run to get the tracking snr per telescope
                         - run all the track computing
+                        (estimator from OPD.ESTIMATOR['snr'])
 
             raw       : run to plot the raw data
                         - prepare raw 
@@ -157,14 +226,80 @@ from .mapping import WIN, T1, T2, BASE, PHI, POL, VIS
 from time import time as _time
 import time
 from collections import OrderedDict
+import numbers
+from multiprocessing.pool import ThreadPool
+import threading
 
 ## for python3
 try:
     unicode
 except NameError:
     basestring = (str,bytes)
-
-
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+#######
+# The recipies only made for plots. When the scans are received by an 
+# acquisition thread (see DataCommunication.scanQueue) they are only run 
+# on the last received scan, the other recipies are run on every scan. 
+plotRecipies = ("filter", "filterPsd", "snr", "flux", "raw")
+
+
+#######
+# The step graph used by the recipies.
+# For each step (a DataCommunication method) : 
+#     (input keys, output keys, altered keys) 
+# Keys are the .data and .config keys of the tables above, the steps
+# needed by a recipy and their order are computed from it (see scheduleSteps)
+stepGraph = OrderedDict(
+        [
+        ("combineData",              (("SCAN.SCI", "SCAN.OPD"), 
+                                      ("SCAN.SCI.CMB", "SCAN.OPD.CMB"), 
+                                      ())), 
+        ("computeDataFFTCmb",        (("SCAN.SCI.CMB", "SCAN.OPD.CMB"), 
+                                      ("FFT.SCI.CMB", "FFT.SIGMA"), 
+                                      ())), 
+        ("computeFilterMasks",       (("FFT.SIGMA", "SCAN.SCI.CMB"), 
+                                      ("FILTER.IN.RESCALED", "MASK.IN", "MASK.OUT", "BAND.INDEX"),
+                                      ())), 
+        ("computePsdCmb",            (("FFT.SIGMA", "MASK.IN", "BAND.INDEX"), 
+                                      ("PSD.CMB", "PSD.MEAN", "SNR.BASE.MEAN"), 
+                                      ())), 
+        ("computeOpdPerBase",        (("FFT.SIGMA", "MASK.IN", "BAND.INDEX", "PSD.CMB", "PSD.MEAN"), 
+                                      ("POS.BASE", "SNR.BASE"), 
+                                      ())), 
+        ("computeOpdPerBaseAbcd",    (("SCAN.SCI", "SCAN.OPD"), 
+                                      ("POS.BASE", "SNR.BASE", "PHASOR.SCI"), 
+                                      ())), 
+        ("computeOpdPerTelescope",   (("POS.BASE", "SNR.BASE"), 
+                                      ("POS.TEL", "SNR.TEL", "POS.BASE.RECOMP", "STATUS.TEL.TRACKING"), 
+                                      ())), 
+        ("predictOffsets",           (("POS.TEL", "STATUS.TEL.TRACKING"), 
+                                      ("POS.TEL.PREDICTED",), 
+                                      ())), 
+        ("filterCombinedData",       (("FFT.SCI.CMB", "FFT.SIGMA", "MASK.IN"), 
+                                      ("SCAN.SCI.CMB.FILTERED", "SCAN.OPD.CMB.FILTERED"), 
+                                      ("SCAN.SCI.CMB", "SCAN.OPD.CMB"))), 
+        ("normalizeDataCmb",         (("SCAN.SCI.CMB.FILTERED",), 
+                                      ("SCAN.SCI.CMB.FILTERED.NORMALIZED",), 
+                                      ())), 
+        ("computeDifferentialPhase", (("SCAN.SCI.CMB.FILTERED.NORMALIZED",), 
+                                      ("PHASE.TEL",), 
+                                      ())), 
+        ("prepareRaw",               (("SCAN.SCI", "SCAN.OPD"), 
+                                      ("SCAN.SCI.RAW", "SCAN.OPD.RAW"), 
+                                      ())), 
+        ("computeDataFFTRaw",        (("SCAN.SCI.RAW", "SCAN.OPD.RAW"), 
+                                      ("FFT.SCI.RAW", "FFT.SIGMA.RAW"), 
+                                      ("SCAN.SCI.RAW", "SCAN.OPD.RAW"))), 
+        ("computeFlux",              (("SCAN.SCI.RAW",), 
+                                      ("FLUX.TEL",), 
+                                      ())), 
+        ]
+)
 
 
 class DataCommunication(object):
@@ -195,6 +330,7 @@ class DataCommunication(object):
             "N.WIN.DARK": 0,  # number of dark windows
             "N.POLAR": 1,      
             "N.OPL"  : 0,     # number of scan point (OPL)
+            "N.OPL.RAW" : 0,  # number of scan point (OPL) as received
             "N.TRUE.BASE" : 0,  
             "MAP" : None,     # full MAP information corresponding to the IOBC
             "MAPC": None,     # reduced MAP information, one per base (without ABCD)
@@ -203,35 +339,52 @@ class DataCommunication(object):
             }   
         )
         self.permanentData = {
-            "DATA.BUFFER.PSD":None,  #list buffer of PSD 
-            "ID.BUFFER":-1,          
+            "DATA.BUFFER.PSD":None,  #ring buffer of PSD (computing.PsdBuffer or PsdEma)
+            "BACKGROUND.SCI": None,  # background model (computing.BackgroundModel)
+            "BACKGROUND.DARK": None, 
             "COUNTER.DATA": 0,
             "COUNTER.CONFIG": 0, 
-            "TIMES.TRACK": np.ones((10,), float)*_time()           
+            "TIMES.TRACK": np.ones((10,), float)*_time(), 
+            "PISTON.FILTER": None,   # state of the piston predictor (computing.PistonFilter)
+            "BUFFER.ARENA": None     # reused product arrays (computing.BufferArena)
         }
         self.steps = {} 
         self.data = {} 
-        self._locked = False
+        self._stepPool = None 
+        self._stepPoolSize = 0
+        ## guards the step bookkeeping (steps, timers, elapsedTimes) and 
+        ## the buffer arena when steps run concurrently (see runSteps)
+        self._stepLock = threading.RLock()
+        ## queue.Queue of scans filled by an acquisition thread, 
+        ## receiveData take the scans from it if not None  
+        self.scanQueue = None 
         self.resetData()
+        self.publish()
         self.timers = {}        
         self.elapsedTimes = {}   
+
+        fft = computing.fftbackend.getBackend()
+        self.log("FFT backend is %s with %d workers"%(fft.name, fft.workers), 2)
         
 
 
     def _tic(self,label):
-        self.timers[label] = _time()
-        self.steps[label] = False
+        with self._stepLock:
+            self.timers[label] = _time()
+            self.steps[label] = False
 
     def _tac(self,label):
-        try:
-            tic = self.timers[label]
-        except KeyError:
-            return None
-        self.elapsedTimes[label] = (_time()-tic)
-        self.steps[label] = True
+        with self._stepLock:
+            try:
+                tic = self.timers[label]
+            except KeyError:
+                return None
+            self.elapsedTimes[label] = (_time()-tic)
+            self.steps[label] = True
 
     def checkStep(self, step):
-        return self.steps.get(step, False)
+        with self._stepLock:
+            return self.steps.get(step, False)
 
     def open(self):
         """ open the communication. If already open do nothing 
@@ -267,12 +420,11 @@ class DataCommunication(object):
             return False        
         return com.isOpen(self.device)
 
-    def resetData(self, timeout=5, ignore=False):
+    def resetData(self):
         """ reset all the data componant to None 
         
-        if the data is locked (from plot interface for example), wait that it get unlocked 
-        before clearing data. 
-        If it does not get unlock after `timeout` a RuntimeError is raise unless ignore is False
+        The readers (e.g. plots) are not affected, they read the last 
+        published snapshot (see publish)
 
         Parameters
         ----------
@@ -282,43 +434,108 @@ class DataCommunication(object):
         ------
         None
         """  
-        s = time.time()
-        if ignore:
-            while self._locked:
-                time.sleep(0.01)
-                if (time.time()-s)>timeout:
-                    break
-            self._locked = False                   
-        else:    
-            while self._locked:
-                time.sleep(0.01)
-                if (time.time()-s)>timeout:
-                    raise RuntimeError("The data is locked")
-
-        self.data.clear()  # clear all data
-        self.steps.clear() # clear the step dictionary 
-      
-
-    def lock(self):
-        """ lock the running data 
-
-        if locked, the .data  dictionary cannot been cleaned until it has been unlocked
-        
-        """
-        self._locked = True
+        ## new objects, the published snapshot keeps the old ones 
+        self.data = {}  
+        self.steps = {} 
+
+    def getBuffer(self, name, shape, dtype=float):
+        """ return a reusable array for the product `name` 
 
-    def unlock(self):
-        """ unlock the running data 
+        If TEST.BUFFER.ARENA the array is taken from the BUFFER.ARENA of 
+        the current scan shape (N.WIN.SCI, N.OPL.RAW, dtype of SCAN.SCI), 
+        the arena is rebuilt when this shape changes. Otherwise None is 
+        returned, so the result can be given to the `out` arguments of 
+        the computing functions. 
 
-        if locked the .data  dictionary cannot been cleaned until it has been un locked
+        Parameters
+        ----------
+        name : string
+            product name 
+        shape : tuple
+        dtype : dtype, optional
 
+        Outputs
+        -------
+        buffer : array or None
+            with undefined content 
         """
-        self._locked = False
+        config = self.config
+        if not config["TEST.BUFFER.ARENA"]:
+            return None
+
+        key = (config["N.WIN.SCI"], config["N.OPL.RAW"], 
+               np.dtype(np.float32 if config["TEST.SINGLE.PRECISION"] else float))
+        with self._stepLock:
+            arena = self.permanentData["BUFFER.ARENA"]
+            if (arena is None) or (arena.key != key):
+                arena = computing.BufferArena(key, config["BUFFER.ARENA.GENERATIONS"])
+                self.permanentData["BUFFER.ARENA"] = arena
+                self.log("New buffer arena for %r"%(key,), 3)
+            return arena.get(name, shape, dtype)
+
+    def publish(self):
+        """ publish the current scan as the `latest` snapshot 
+
+        The snapshot is a read only copy of .data (the arrays are made 
+        read only, not copied), .config, .permanentData (without its 
+        stateful objects) and of the steps done, see ScanSnapshot. 
+        It replaces `latest` in one assignment so readers can take it 
+        without any lock.
+
+        Outputs
+        -------
+        snapshot : ScanSnapshot
+        """
+        snapshot = ScanSnapshot(self.data, self.config, self.permanentData, self.steps)
+        ## the arrays of the scan are not reused while the snapshot lives 
+        if self.permanentData["BUFFER.ARENA"] is not None:
+            self.permanentData["BUFFER.ARENA"].lend(snapshot)
+        self.latest = snapshot
+        return snapshot
 
                 
+    def acquireScan(self, timeout=1000):
+        """ Wait for the next scan of the instrument 
+
+        Nothing of the DataCommunication is changed so this can run in 
+        an acquisition thread (see process.AcquisitionThread) while the 
+        previous scan is reduced. 
+
+        Outputs
+        -------
+        scan : tuple or None 
+            (rawData, mjd) the (nOpl, nData) received block and the MJD of 
+            reception. None if there is no scanning data
+        """
+        # open communication if needed
+        # open() is ignored if communication already exists
+        try:
+            self.open()
+        except RuntimeError as e:
+            raise RuntimeError("Data Error: %s"%e) 
+
+        ## get the nData, nOpl values in integer        
+        nData, nOpl = com.getScanDataShape(self.device)
+        if not (nData*nOpl):
+            return None
+
+        ## Now retrieve the data         
+        try:
+            rawData = com.receiveData(self.device, (nOpl,nData), float, timeout)
+        except RuntimeError as e:  
+            raise RuntimeError("Data Error: %s"%e)
+        return rawData, com.getMJD()
+
+    def hasPendingScan(self):
+        """ True if a newer scan is waiting in scanQueue """
+        return (self.scanQueue is not None) and (not self.scanQueue.empty())
+
     def receiveData(self, timeout=1000):
         """ Wait for scanning data and populate the data parameters 
 
+        The scan is received by acquireScan, or taken from scanQueue if 
+        an acquisition thread is running. 
+
         Data Product
         ------------
         TIME.ELAPSED : float
@@ -332,6 +549,7 @@ class DataCommunication(object):
             Opd for each scan point and telescope 
         SCAN.SCI : float (N.WIN.SCI, N.OPL) 
             Scientific flux measurement for each outputs and scan point 
+            float32 if TEST.SINGLE.PRECISION
         SCAN.DARK : float (N.WIN.DARK, N.OPL) 
             Flux for the dark windows
         
@@ -348,6 +566,9 @@ class DataCommunication(object):
             number of dark windows
         N.OPL: int
             number of OPL per scan (size of the scan typicaly 512)
+            (changed by prepareData if the scan is decimated)
+        N.OPL.RAW: int 
+            number of OPL per received scan 
         N.TEL: int
             number of telescopes
         """
@@ -356,42 +577,41 @@ class DataCommunication(object):
         # record the previous data format to check if the data is new
         config, data = self.config, self.data
 
-        previous_nWin, previous_nOpl = config["N.WIN.SCI"]+config["N.WIN.DARK"],config["N.OPL"] 
+        previous_nWin, previous_nOpl = config["N.WIN.SCI"]+config["N.WIN.DARK"],config["N.OPL.RAW"] 
         previousMjd = data.get('TIME.MJD',0)
 
         
                 
-        # open communication if needed
-        # open() is ignored if communication already exists
         try:
-            self.open()
-        except RuntimeError as e:
+            if self.scanQueue is None:
+                scan = self.acquireScan(timeout)
+            else:
+                ## the acquisition thread give its errors  
+                try:
+                    scan = self.scanQueue.get(timeout=timeout/1000.0)
+                except queue.Empty:
+                    raise RuntimeError("Data Error: no scan received")
+                if isinstance(scan, Exception):
+                    raise scan 
+        except RuntimeError:
             self.resetData()
-            raise RuntimeError("Data Error: %s"%e) 
-                       
+            raise 
 
-        ## get the nData, nOpl values in integer        
-        nData, nOpl = com.getScanDataShape(self.device)
-
-
-        if not (nData*nOpl):
+        if scan is None:
             self.log("No scanning data")
             self.resetData()
             return 1
-        
-        ## Now retrieve the data         
-        try:
-            rawData = com.receiveData(self.device, (nOpl,nData), float, timeout)
-        except RuntimeError as e:  
-            self.resetData()           
-            raise RuntimeError("Data Error: %s"%e)
+        rawData, mjd = scan 
+        nOpl, nData = rawData.shape
         
         #######
         # Now that we have recieve new data we can reset the curent one
         #
         self.resetData()    
+        data = self.data
+        if self.permanentData["BUFFER.ARENA"] is not None:
+            self.permanentData["BUFFER.ARENA"].next()
        
-        mjd = com.getMJD()   
         if previousMjd:
             data['TIME.ELAPSED'] = (mjd-previousMjd)*24*3600
         else:
@@ -420,21 +640,23 @@ class DataCommunication(object):
 
         nSciWin = nWin - nDarkWin
 
-        ##
-        # Transpose the data to have window/tel indices first
-        rawData = rawData.T
-        oplData = rawData[0:nTel,:]
-        sciData = rawData[nTel:nSciWin+nTel,:]
-        if nDarkWin:
-            darkData = rawData[nSciWin+nTel:,:]
-        else:
-            darkData = 0.0 
-        
         config["N.WIN.SCI"]  = nSciWin
         config["N.WIN.DARK"] = nDarkWin
         config["N.OPL"] = nOpl
+        config["N.OPL.RAW"] = nOpl
         config["N.TEL"] = nTel
 
+        ##
+        # Transpose the data to have window/tel indices first, in 
+        # contiguous arrays (FFT and in place operations are along opl)
+        # the opd stay in double precision 
+        sciType = np.float32 if config["TEST.SINGLE.PRECISION"] else rawData.dtype
+        out = (self.getBuffer("SCAN.OPD", (nTel,nOpl), rawData.dtype), 
+               self.getBuffer("SCAN.SCI", (nSciWin,nOpl), sciType), 
+               self.getBuffer("SCAN.DARK", (nDarkWin,nOpl), sciType))
+        oplData, sciData, darkData = computing.splitScan(rawData, nTel, nSciWin, sciType, 
+                                                         out=None if out[0] is None else out)
+
 
         data["TEST.NEW"] = isNewShape
 
@@ -451,6 +673,52 @@ class DataCommunication(object):
         self._tac("receiveData")
         return 0
 
+    def screenData(self):
+        """ Compute the quality flags of the received scan 
+
+        Must be run before prepareData (on the raw scan). The flags are the
+        computing.QUALITY_* bits, a scan is rejected (see isScanRejected)
+        if QUALITY has one of the QUALITY.REJECT bits. 
+
+        Data Products
+        -------------
+        QUALITY.WIN : uint8 array (N.WIN.SCI,)
+            quality bits of each science window 
+        QUALITY.TEL : uint8 array (N.TEL,)
+            quality bits of each telescope opd 
+        QUALITY : uint8
+            quality bits of the scan 
+        """
+        if not self.isDataValid():
+            raise RuntimeError("screenData: no data received")
+        if self.checkStep("prepareData"):
+            raise RuntimeError("screenData: must be run before prepareData")
+        self._tic("screenData")
+        data, config = self.data, self.config
+
+        (data["QUALITY.WIN"], 
+         data["QUALITY.TEL"], 
+         data["QUALITY"]
+        ) = computing.computeScanQuality(
+                data["SCAN.SCI"], 
+                data["SCAN.OPD"], 
+                saturation = config["QUALITY.SATURATION"], 
+                maxSaturated = config["QUALITY.SATURATION.COUNT"], 
+                stepTolerance = config["QUALITY.STEP.TOLERANCE"], 
+                maxBadSteps = config["QUALITY.BAD.STEP.FRACTION"], 
+                start = config["N.FIRST.SCAN.TO.CLEAN"]
+        )
+        if self.isScanRejected():
+            self.log("Scan #%d rejected, quality=%d"%(self.permanentData["COUNTER.DATA"], data["QUALITY"]), 2)
+        self._tac("screenData")
+
+    def isScanRejected(self):
+        """ True if the scan quality has one of the QUALITY.REJECT bits 
+
+        False if the scan has not been screened 
+        """
+        return bool(self.data.get("QUALITY", 0) & self.config["QUALITY.REJECT"])
+
     def isDataValid(self):
         """ check if raw data is valid 
         
@@ -497,7 +765,8 @@ class DataCommunication(object):
         test : bool
             True if data offset (background) has been saved 
         """
-        return "SCAN.SCI.OFFSET" in self.permanentData
+        background = self.permanentData["BACKGROUND.SCI"]
+        return (background is not None) and (background.count>0)
         
     def prepareData(self):
         """ Prepare the raw data 
@@ -505,12 +774,18 @@ class DataCommunication(object):
         - cleanup  the first scan   (N.FIRST.SCAN.TO.CLEAN)
         - substract the dark windows if TEST.SUBSTRACT.DARKWIN
         - compute oversampling factor if TEST.COMPUTE.OVERSAMP.FACTOR
-        - save the current scan as offset if user asked for it
-        - remove the offset to the scan if user asked for it
+          (with OVERSAMP.HYSTERESIS) and decimate the scans by this factor 
+        - start a new background model if user asked for it and
+          average the next BACKGROUND.N.SCAN scans in it 
+        - remove the background to the scan if user asked for it
         - center the scan 
+        - resample the scan on a uniform opd grid if TEST.RESAMPLE.OPD
         IF the shape of data has changed (change of instrument config)
             - del the stored offsets
             - update the config keys and mapping
+            - compute the matrices of the reduction (MATRIX.*). They only 
+              depend on the map, mapc and N.OPL, so they are computed once 
+              per configuration instead of at each scan
         """
         if not self.isDataValid():
             self.log("Data not valid")
@@ -558,30 +833,63 @@ class DataCommunication(object):
         # compute the oversampling factor 
         # 
         if config["TEST.COMPUTE.OVERSAMP.FACTOR"]:
-            dx = (oplData[:,18] - oplData[:,17]) ## in um
-            #
-            nd = dx.size
-
-            sampling = 1.0 / config["FILTER.IN"].mean() / np.max( np.abs(dx - a.repeat(nd).reshape((nd,nd))) ) 
-            self.log("sampling=%s"%sampling, 3)
-            overSamplingFactor = np.max( int(sampling/3.5), 1)
+            ## a new data shape gets a fresh estimate 
+            overSamplingFactor = computing.computeOversamplingFactor(
+                    oplData, 
+                    config["FILTER.IN"], 
+                    config["MIN.SAMPLING"], 
+                    current = None if data["TEST.NEW"] else config.get("OVERSAMP.FACTOR", None), 
+                    hysteresis = config["OVERSAMP.HYSTERESIS"]
+            )
         else:           
             overSamplingFactor = 1;
         self.log("overSamplingFactor=%d"%overSamplingFactor, 3)
         
+        ## a new factor is a new data shape 
+        if overSamplingFactor != config.get("OVERSAMP.FACTOR", 1):
+            data["TEST.NEW"] = True
+        config["OVERSAMP.FACTOR"] = overSamplingFactor
 
         ####
-        # Remove the saved offset if any 
+        # Average the background scans and remove it if any 
         #
+        permanentData = self.permanentData
         if com.getSaveDataOffsetFlag():
-            self.permanentData["SCAN.SCI.OFFSET"]  = sciData
-            self.permanentData["SCAN.DARK.OFFSET"] = darkData
+            nBackground = config["BACKGROUND.N.SCAN"]
+            permanentData["BACKGROUND.SCI"] = computing.BackgroundModel(sciData.shape, nBackground)
+            if np.ndim(darkData):
+                permanentData["BACKGROUND.DARK"] = computing.BackgroundModel(darkData.shape, nBackground)
+            else:
+                permanentData["BACKGROUND.DARK"] = None
             com.clearSaveDataOffsetFlag()
 
+        backgroundSci, backgroundDark = permanentData["BACKGROUND.SCI"], permanentData["BACKGROUND.DARK"]
+        if (backgroundSci is not None) and backgroundSci.push(sciData):
+            if backgroundDark is not None:
+                backgroundDark.push(darkData)
+            self.log("Background scan %d/%s"%(backgroundSci.count, backgroundSci.size), 2)
+
         if com.getSubstractDataOffsetFlag() and self.hasSavedOffset():
-                        
-            sciData  -= self.permanentData["SCAN.SCI.OFFSET"]
-            darkData -= self.permanentData["SCAN.DARK.OFFSET"]
+            backgroundSci.subtract(sciData)
+            if backgroundDark is not None:
+                backgroundDark.subtract(darkData)
+
+        ####
+        # low-pass and decimate the oversampled scans 
+        # 
+        if overSamplingFactor>1:
+            if data["TEST.NEW"] or (config.get("FILTER.DECIMATION", None) is None):
+                config["FILTER.DECIMATION"] = computing.computeDecimationFilter(overSamplingFactor)
+            sciData = computing.decimateData(sciData, config["FILTER.DECIMATION"])
+            if np.ndim(darkData):
+                darkData = computing.decimateData(darkData, config["FILTER.DECIMATION"])
+            nOpl = nOpl // overSamplingFactor
+            oplData = oplData[:,0:nOpl*overSamplingFactor].reshape( (-1,nOpl,overSamplingFactor) ).mean(axis=-1)
+
+            data["SCAN.SCI"], data["SCAN.DARK"], data["SCAN.OPD"] = sciData, darkData, oplData 
+            config["N.OPL"] = nOpl
+        else:
+            config["FILTER.DECIMATION"] = None
                                 
         # Center the scan and move it to the right 
         # yorick : opl -= opl(nopl/2,)(-,);
@@ -604,6 +912,8 @@ class DataCommunication(object):
         # If the data shape is the same than before,
         # nothing else to do.
         if not data["TEST.NEW"]:
+            if config["TEST.RESAMPLE.OPD"]:
+                self.resampleData()
             self.log("-%04d Data prepared in %.3f sec "%(self.permanentData["COUNTER.DATA"],(com.getMJD()-data["TIME.MJD"])*24*3600), 2)
             self._tac("prepareData")            
             return
@@ -624,9 +934,8 @@ class DataCommunication(object):
         
         #######
         # the offset are not anymore valids
-        if self.hasSavedOffset():
-            del self.permanentData["SCAN.SCI.OFFSET"]
-            del self.permanentData["SCAN.DARK.OFFSET"]  
+        self.permanentData["BACKGROUND.SCI"] = None
+        self.permanentData["BACKGROUND.DARK"] = None
 
         ###
         # Check if we know the mapping (correlation matrix)
@@ -649,7 +958,8 @@ class DataCommunication(object):
         
         dlsNumbers = com.getDlsConfig()
         
-        freqmax = nOpl//2//overSamplingFactor
+        ## the oversampling has been removed by decimateData 
+        freqmax = nOpl//2
         
         u = np.arange(nOpl)
         idOversampling = (u) - (nOpl*(u > nOpl/2))
@@ -661,6 +971,41 @@ class DataCommunication(object):
         config["ID.OVERSAMPLING"] = np.where( (idOversampling<=freqmax) * (idOversampling>-freqmax))[0]
 
         config["FREQ.MAX"] = freqmax
+
+        ###
+        # the matrices of the reduction, see the docstring 
+        # combination of the windows in bases 
+        (
+         config["MATRIX.CMB"],
+         config["ID.TEL.CMB"],
+         config["ID.OPL.ORDER"]
+        ) = computing.computeCombinationMatrix(map, nOpl, 
+                dtype=np.complex64 if config["TEST.SINGLE.PRECISION"] else complex
+        )
+
+        # ABCD phasors of the bases 
+        (
+         config["MATRIX.ABCD"],
+         config["ID.TEL.ABCD"]
+        ) = computing.computeAbcdMatrix(map, 
+                dtype=np.complex64 if config["TEST.SINGLE.PRECISION"] else complex
+        )
+
+        # base to telescope pistons 
+        config["MATRIX.PIVOT"] = computing.computePivotMatrix(mapc)
+
+        # base to telescope differential phases (with polar)
+        if nPolar>1:
+            config["MATRIX.PHASE"] = computing.computeDifferentialPhaseMatrix(mapc)
+        else:
+            config["MATRIX.PHASE"] = None
+
+        # window to telescope fluxes 
+        (
+         config["MATRIX.FLUX.PINV"], 
+         config["MATRIX.FLUX.SUM"]
+        ) = computing.computeFluxMatrix(map)
+
         config["MAP"] = map
         config["MAPC"] = mapc
         config["N.TRUE.BASE"] = len(mapc)
@@ -668,9 +1013,59 @@ class DataCommunication(object):
         config["OBC"] = obc
         config["N.POLAR"] = nPolar
         config["NS.DL"] = dlsNumbers
+
+        config["RESAMPLE.OPERATORS"] = []
+        if config["TEST.RESAMPLE.OPD"]:
+            self.resampleData()
                                      
         self._tac("prepareData")  
 
+    def resampleData(self):
+        """ Resample the prepared scan on a uniform opd grid 
+
+        Called by prepareData if TEST.RESAMPLE.OPD. The interpolation 
+        operator is computed from the measured opd and reused as long as 
+        SCAN.OPD stay within RESAMPLE.OPD.TOLERANCE (micron) of the opd 
+        used to compute it. The operators of the last two opd are kept 
+        for the forward and backward scans. 
+
+        Altered Data Products
+        ---------------------
+        SCAN.SCI : resampled on the uniform grid
+        SCAN.OPD : the uniform opd of each telescope 
+
+        Config Products
+        ---------------
+        RESAMPLE.OPERATORS : list 
+            of (opd, operator), opd is the measured opd used to compute 
+            the operator (index, weight, opdLinear), see 
+            computing.computeResampleOperator
+        """
+        config, data = self.config, self.data
+        if config.get("MAP", None) is None:
+            return 
+
+        self._tic("resampleData")
+        oplData = data["SCAN.OPD"]
+        nOpl = config["N.OPL"]
+
+        operators = config.setdefault("RESAMPLE.OPERATORS", [])
+        for ref, operator in operators:
+            if (ref.shape == oplData.shape) and\
+               (np.max(np.abs(oplData-ref)) <= config["RESAMPLE.OPD.TOLERANCE"]):
+                break
+        else:
+            operator = computing.computeResampleOperator(oplData, config["MAP"])
+            operators.insert(0, (oplData.copy(), operator))
+            del operators[2:]
+            self.log("New opd resampling operator", 3)
+
+        index, weight, opdLinear = operator
+        data["SCAN.SCI"] = computing.computeResampledData(data["SCAN.SCI"], index, weight)
+        ## keep the scan centered 
+        oplData[...] = opdLinear - opdLinear[:,nOpl//2:nOpl//2+1]
+        self._tac("resampleData")
+
 
     def combineData(self):
         """ Make the combined data 
@@ -699,13 +1094,26 @@ class DataCommunication(object):
         if map is None:
             raise RuntimeError("No interaction matrix map given, cannot combine data")
         
+        sciData, oplData = data["SCAN.SCI"], data["SCAN.OPD"]
+        cmbMatrix = config.get("MATRIX.CMB", None)
+        out = None 
+        if cmbMatrix is not None:
+            shape = (len(cmbMatrix), sciData.shape[-1])
+            out = (self.getBuffer("SCAN.SCI.CMB", shape, np.result_type(cmbMatrix, sciData)), 
+                   self.getBuffer("SCAN.OPD.CMB", shape, oplData.dtype))
+            if out[0] is None:
+                out = None 
         (
          data["SCAN.SCI.CMB"],
          data["SCAN.OPD.CMB"] 
         ) = computing.computeDataCmd(
-            data["SCAN.SCI"],
-            data["SCAN.OPD"],
-            map
+            sciData,
+            oplData,
+            map, 
+            cmbMatrix=cmbMatrix, 
+            cmbTels=config.get("ID.TEL.CMB", None), 
+            oplOrder=config.get("ID.OPL.ORDER", None), 
+            out=out
         )
         self._tac("combineData")
 
@@ -722,82 +1130,259 @@ class DataCommunication(object):
         if not self.checkStep("combineData"):
             raise RuntimeError("computeDataFFTCmd: Data must be combined first")
 
-        if self.checkStep("computeDataFFT"):
+        if self.checkStep("computeDataFFTCmb"):
             self.log("FFT already computed")
             return 
 
         self._tic("computeDataFFTCmb")
 
         data, config = self.data, self.config
+        dataCmb = data["SCAN.SCI.CMB"]
 
+        out = (self.getBuffer("FFT.CMB", dataCmb.shape, dataCmb.dtype), 
+               self.getBuffer("FFT.SIGMA.CMB", dataCmb.shape, data["SCAN.OPD.CMB"].dtype))
         (
          sciFFTCmb, 
          sigCmb
          ) = computing.computeDataFFT(
-                data["SCAN.SCI.CMB"],
-                data["SCAN.OPD.CMB"] 
+                dataCmb,
+                data["SCAN.OPD.CMB"], 
+                out=None if out[0] is None else out
             )
         if config["TEST.PROCESS.OVERSAMP"]:
-            sciFFTCmb = sciFFTCmb[:,config["ID.OVERSAMPLING"]]
-            sigCmb = sigCmb[:,config["ID.OVERSAMPLING"]]
+            index = config["ID.OVERSAMPLING"]
+            shape = (len(dataCmb), len(index))
+            sciFFTCmb = np.take(sciFFTCmb, index, axis=1, 
+                                out=self.getBuffer("FFT.SCI.CMB", shape, sciFFTCmb.dtype))
+            sigCmb = np.take(sigCmb, index, axis=1, 
+                             out=self.getBuffer("FFT.SIGMA", shape, sigCmb.dtype))
 
         data["FFT.SCI.CMB"] = sciFFTCmb
         data["FFT.SIGMA"] =   sigCmb
                             
         self._tac("computeDataFFTCmb")
 
+    def computeFilterMasks(self):
+        """ Build the spectral filter masks if needed 
 
-    def computeOpdPerBase(self):
-        """ Compute the piston with IOTA method 
-
+        The masks only depend on FFT.SIGMA, FILTER.IN, FILTER.OUT and 
+        STRENGTH.TURBULENCE. FFT.SIGMA is fully defined by the configuration 
+        (COUNTER.CONFIG) and its last frequency per base. This frequency comes 
+        from the measured opd step and jitters from scan to scan, the masks 
+        are kept while it stays within MASK.SIGMA.TOLERANCE (relative) of 
+        MASK.SIGMA and the other values do not change.
         
+        Config Products
+        ---------------
+        FILTER.IN.RESCALED : array (N.BASE,2)
+            The filter rescale for each base        
+        MASK.IN : bool array (N.BASE, N.OPL)
+            True where the signal is 
+        MASK.OUT : bool array (N.BASE, N.OPL)
+            True where the noise is 
+        MASK.KEY : tuple
+            the inputs used to build the masks 
+        MASK.SIGMA : array (N.BASE,)
+            the last frequency of FFT.SIGMA used to build the masks 
+        BAND.INDEX : tuple 
+            the in-band and out-band bins index (see computing.computeBandIndexes)
+        OPD.ZOOM : array or None
+            the opd grid of the filtered fringes if FILTER.ZOOM.RANGE is set 
+        MATRIX.ZOOM : array or None
+            the matrix of the zoomed inverse transform on OPD.ZOOM 
+        """
+        if "FFT.SIGMA" not in self.data:
+            raise RuntimeError("computeFilterMasks: FFT.SIGMA must be computed first")
+        if self.checkStep("computeFilterMasks"):
+            return 
+
+        self._tic("computeFilterMasks")
+        data, config = self.data, self.config
+
+        fre = data["FFT.SIGMA"]
+        key = (self.permanentData["COUNTER.CONFIG"], fre.shape, 
+               tuple(config["FILTER.IN"]), tuple(config["FILTER.OUT"]), 
+               config["STRENGTH.TURBULENCE"], 
+               config["FILTER.ZOOM.RANGE"], config["FILTER.ZOOM.STEP"], 
+               data["SCAN.SCI.CMB"].dtype.str
+               )
+
+        maskSigma = config.get("MASK.SIGMA", None)
+        if (key != config.get("MASK.KEY", None)) or\
+           (not np.allclose(fre[:,-1], maskSigma, rtol=config["MASK.SIGMA.TOLERANCE"], atol=0.0)):
+            (
+             config["FILTER.IN.RESCALED"],
+             config["MASK.IN"],
+             config["MASK.OUT"]
+            ) = computing.computeFilterMasks(
+                    fre, 
+                    config["FILTER.IN"], 
+                    config["FILTER.OUT"], 
+                    config["STRENGTH.TURBULENCE"]
+            )
+            config["BAND.INDEX"] = computing.computeBandIndexes(
+                    config["MASK.IN"], 
+                    config["MASK.OUT"]
+            )
+            zoomRange = config["FILTER.ZOOM.RANGE"]
+            if zoomRange is None:
+                config["OPD.ZOOM"] = None
+                config["MATRIX.ZOOM"] = None
+            else:
+                step = config["FILTER.ZOOM.STEP"]
+                config["OPD.ZOOM"] = np.arange(-zoomRange, zoomRange+step/2.0, step)
+                config["MATRIX.ZOOM"] = computing.computeZoomMatrix(
+                        fre, 
+                        config["BAND.INDEX"], 
+                        config["OPD.ZOOM"], 
+                        dtype=data["SCAN.SCI.CMB"].dtype
+                )
+
+            config["MASK.KEY"] = key
+            config["MASK.SIGMA"] = fre[:,-1].copy()
+        self._tac("computeFilterMasks")
+
+    def computePsdCmb(self):
+        """ Compute the psd of the combined scan and update the PSD buffer 
+
+        It does not depend on the piston estimator, the psd plot and 
+        SNR.BASE.MEAN are available when POS.BASE is computed by 
+        computeOpdPerBaseAbcd.
+
         Data Products
         -------------
-        POS.BASE : array (N.BASE,)
-            The piston value for each base
-        SNR.BASE : array (N.BASE,)
-            The SNR for the piston computation 
+        PSD.CMB : array (N.BASE, N.OPL)
+            The psd of the scan 
+        PSD.MEAN : array (N.BASE, N.OPL)
+            The mean psd of the PSD buffer ring 
         SNR.BASE.MEAN : array (N.BASE,)
             The SNR computed from the PSD buffer ring 
-            The number of ellements 
         
         Permanent Data Products
         -----------------------            
-        DATA.BUFFER.PSD  : array (config["SIZE.PSD.BUFFER"], N.BASE, N.OPL)
+        DATA.BUFFER.PSD  : computing.PsdBuffer or computing.PsdEma
             The updated buffer for PSD computation            
-        ID.BUFFER : int
-            buffer array index of the current psd 
         
-        Config Products
-        ---------------                
-        FILTER.IN.RESCALED : array (N.BASE,)
-            The filter rescale for each base        
+        Filter masks are taken from computeFilterMasks. 
         """
         if not self.checkStep("computeDataFFTCmb"):
-            raise RuntimeError("computeOpdIota: FFTcmb must be computed first")
+            raise RuntimeError("computePsdCmb: FFTcmb must be computed first")
+        if self.checkStep("computePsdCmb"):
+            return 
+
+        if not self.checkStep("computeFilterMasks"):
+            self.computeFilterMasks()
+
+        self._tic("computePsdCmb")
+        permanentData, data, config = self.permanentData, self.data, self.config
+
+        ft = data["FFT.SCI.CMB"]
+        psdType = ft.real.dtype
+        out = (self.getBuffer("PSD", ft.shape, psdType), 
+               self.getBuffer("PSD.MEAN", ft.shape, psdType))
+        (data["PSD.CMB"], 
+         data["PSD.MEAN"], 
+         permanentData["DATA.BUFFER.PSD"]
+         ) = computing.computePsdIota(
+                ft, 
+                permanentData["DATA.BUFFER.PSD"], 
+                out = None if out[0] is None else out
+        )
+        data["SNR.BASE.MEAN"] = computing.computeSnrIota(
+                data["PSD.MEAN"], 
+                data["PSD.MEAN"], 
+                config["MASK.IN"], 
+                config["MASK.OUT"], 
+                bands=self._iotaBands()
+        )
+        self._tac("computePsdCmb")
+
+    def _iotaBands(self):
+        """ the band index of the IOTA estimator, None for the masks """
+        return self.config["BAND.INDEX"] if self.config["TEST.IOTA.BAND"] else None
+
+    def computeOpdPerBase(self):
+        """ Compute the piston with IOTA method 
+
+        The psd and the PSD buffer are taken from computePsdCmb.
+        
+        Data Products
+        -------------
+        POS.BASE : array (N.BASE,)
+            The piston value for each base
+        SNR.BASE : array (N.BASE,)
+            The SNR for the piston computation 
+        """
+        if not self.checkStep("computePsdCmb"):
+            self.computePsdCmb()
         if self.checkStep("computeOpdPerBase"):
             return 
 
         self._tic("computeOpdPerBase")
-        permanentData, data, config = self.permanentData, self.data, self.config
+        data, config = self.data, self.config
 
-        (data["POS.BASE"], 
-         data["SNR.BASE"], 
-         data["SNR.BASE.MEAN"],
-         permanentData["DATA.BUFFER.PSD"],
-         permanentData["ID.BUFFER"], 
-         config["FILTER.IN.RESCALED"]
-         ) = computing.computeOpdIota(
+        bands = self._iotaBands()
+        data["POS.BASE"] = computing.computePosIota(
                 data["FFT.SCI.CMB"], 
                 data["FFT.SIGMA"], 
-
-                fltIn = config["FILTER.IN"], 
-                fltOut= config["FILTER.OUT"],
-                psdBuffer=  permanentData["DATA.BUFFER.PSD"],
-                psdBufferId = permanentData["ID.BUFFER"]
-        )        
+                config["MASK.IN"], 
+                bands = bands
+        )
+        data["SNR.BASE"] = computing.computeSnrIota(
+                data["PSD.CMB"], 
+                data["PSD.MEAN"], 
+                config["MASK.IN"], 
+                config["MASK.OUT"], 
+                bands = bands
+        )
         self._tac("computeOpdPerBase")
 
+    def computeOpdPerBaseAbcd(self):
+        """ Compute the piston with the ABCD phasor of each sample 
+
+        Alternative to combineData/computeDataFFTCmb/computeOpdPerBase
+        selected by the OPD.ESTIMATOR configuration of the recipy. 
+        The phasors are computed from the prepared SCAN.SCI with the 
+        MATRIX.ABCD demodulation matrix (see computing.computeOpdAbcd). 
+        
+        Data Products
+        -------------
+        POS.BASE : array (N.BASE,)
+            The piston value for each base
+        SNR.BASE : array (N.BASE,)
+            The SNR for the piston computation (not at the IOTA scale, 
+            compared to SNR.MIN.ABCD)
+        PHASOR.SCI : complex array (N.BASE, N.OPL)
+            The phasor track of each base 
+        """
+        if self.checkStep("computeOpdPerBaseAbcd"):
+            return 
+        if self.config.get("MAP", None) is None:
+            raise RuntimeError("No IOBC mapping ")
+        self._tic("computeOpdPerBaseAbcd")
+        data, config = self.data, self.config
+
+        fltIn = config["FILTER.IN"]
+        (data["POS.BASE"], 
+         data["SNR.BASE"], 
+         data["PHASOR.SCI"], 
+         _
+        ) = computing.computeOpdAbcd(
+                data["SCAN.SCI"], 
+                data["SCAN.OPD"], 
+                config["MATRIX.ABCD"], 
+                config["ID.TEL.ABCD"], 
+                1.0/(fltIn[1]-fltIn[0])
+        )
+        self._tac("computeOpdPerBaseAbcd")
+
+    def useAbcd(self, recipy):
+        """ True if the OPD.ESTIMATOR of the recipy is 'abcd' """
+        estimator = self.config["OPD.ESTIMATOR"].get(recipy, "iota")
+        if estimator not in ("iota", "abcd"):
+            raise ValueError("OPD.ESTIMATOR should be 'iota' or 'abcd' got %r"%estimator)
+        return estimator == "abcd"
+
     def computeOpdPerTelescope(self):
         """ Compute the SNR and the DL offset 
 
@@ -814,12 +1399,19 @@ class DataCommunication(object):
             The recomputed position for each base                       
         STATUS.TEL.TRACKING : array (N.BASE,) of boolean 
             True for telescope tracking                                         
+
+        The SNR threshold is SNR.MIN, or SNR.MIN.ABCD when POS.BASE comes 
+        from computeOpdPerBaseAbcd.
         """
 
         if self.config.get("MAP", None) is None:
             raise RuntimeError("No IOBC mapping ")
         self._tic("computeOpdPerTelescope") 
         data, config = self.data, self.config
+        if self.checkStep("computeOpdPerBaseAbcd"):
+            snrMin = config["SNR.MIN.ABCD"]
+        else:
+            snrMin = config["SNR.MIN"]
 
         (
          data["POS.TEL"],
@@ -830,24 +1422,68 @@ class DataCommunication(object):
                     data["POS.BASE"],
                     data["SNR.BASE"],
                     config["MAPC"],                    
-                    config["SNR.MIN"],
-                    niobate= False# must be false at that point
+                    snrMin,
+                    niobate= False,# must be false at that point
+                    pivotMatrix= config.get("MATRIX.PIVOT", None)
         )
         self._tac("computeOpdPerTelescope") 
 
+    def predictOffsets(self):
+        """ Predict the telescope offsets at actuation time 
+
+        POS.TEL is measured on a scan which is already one scan period old
+        when the offsets reach the delay lines. The open loop pistons are 
+        followed by an alpha-beta filter (PREDICT.ALPHA, PREDICT.BETA) and 
+        extrapolated PREDICT.HORIZON scan periods ahead. The pistons are 
+        dated with the scan TIME.MJD, the scan period is the median interval
+        between the scans. The filter is reset after 10 periods without 
+        scan. 
+
+        Data Products
+        -------------
+        POS.TEL.PREDICTED : array (N.TEL,)
+            the offsets to send, used by sendOffsets 
+
+        Permanent Data Products
+        -----------------------
+        PISTON.FILTER : computing.PistonFilter
+            the updated filter 
+        """
+        if not self.checkStep("computeOpdPerTelescope"):
+            raise RuntimeError("tel offset position not computed")
+        self._tic("predictOffsets")
+        data, config, permanentData = self.data, self.config, self.permanentData
+
+        (data["POS.TEL.PREDICTED"], 
+         permanentData["PISTON.FILTER"]
+        ) = computing.predictPiston(
+                data["POS.TEL"], 
+                data["STATUS.TEL.TRACKING"], 
+                data["TIME.MJD"]*24*3600, 
+                config["PREDICT.HORIZON"], 
+                pistonFilter = permanentData["PISTON.FILTER"], 
+                alpha = config["PREDICT.ALPHA"], 
+                beta = config["PREDICT.BETA"], 
+                maxGap = 10
+        )
+        self._tac("predictOffsets")
+
     def filterCombinedData(self):
         """ filter the combined data 
 
+        If FILTER.ZOOM.RANGE is set the filtered data are only evaluated 
+        on the OPD.ZOOM grid from the in-band bins.
+
         Altered Data Products
         ----------------------
-        SCAN.SCI.CMB
-        SCAN.OPD.CMB
+        SCAN.SCI.CMB  (only if TEST.INVERSE.FFT.CMB)
+        SCAN.OPD.CMB  (only if TEST.INVERSE.FFT.CMB)
         
         Data Products
         -------------
-        SCAN.SCI.CMB.FILTERED : array (N.BASE, N.OPL)
+        SCAN.SCI.CMB.FILTERED : array (N.BASE, N.OPL) or (N.BASE, len(OPD.ZOOM))
             The filtered, combined data
-        SCAN.OPD.CMB.FILTERED : array (N.BASE, N.OPL)
+        SCAN.OPD.CMB.FILTERED : array (N.BASE, N.OPL) or (N.BASE, len(OPD.ZOOM))
         
         """
         
@@ -857,30 +1493,47 @@ class DataCommunication(object):
         if self.checkStep("filterCombinedData"):
             return 
 
+        if not self.checkStep("computeFilterMasks"):
+            self.computeFilterMasks()
+
         self._tic("filterCombinedData")    
         data, config = self.data, self.config
 
         ##
         # filter back to the binned combined data
-        (
-         data["SCAN.SCI.CMB"],
-         data["SCAN.OPD.CMB"]
-        ) = computing.computeDataFFT(
-              data["FFT.SCI.CMB"], 
-              data["FFT.SIGMA"],
-              inverse=True
-        )
-
-          
+        if config["TEST.INVERSE.FFT.CMB"]:
+            (
+             data["SCAN.SCI.CMB"],
+             data["SCAN.OPD.CMB"]
+            ) = computing.computeDataFFT(
+                  data["FFT.SCI.CMB"], 
+                  data["FFT.SIGMA"],
+                  inverse=True
+            )
 
-        (   
-         data["SCAN.SCI.CMB.FILTERED"], 
-         data["SCAN.OPD.CMB.FILTERED"]             
-        ) = computing.computeFiltered(
-                data["FFT.SCI.CMB"], 
-                data["FFT.SIGMA"],
-                config["FILTER.IN"]
-        )
+        if config["MATRIX.ZOOM"] is None:
+            ft = data["FFT.SCI.CMB"]
+            out = (self.getBuffer("SCAN.SCI.CMB.FILTERED", ft.shape, ft.dtype), 
+                   self.getBuffer("SCAN.OPD.CMB.FILTERED", ft.shape, data["FFT.SIGMA"].dtype))
+            (   
+             data["SCAN.SCI.CMB.FILTERED"], 
+             data["SCAN.OPD.CMB.FILTERED"]             
+            ) = computing.computeFiltered(
+                    data["FFT.SCI.CMB"], 
+                    data["FFT.SIGMA"],
+                    config["FILTER.IN"], 
+                    mask=config["MASK.IN"], 
+                    out=None if out[0] is None else out
+            )
+        else:
+            data["SCAN.SCI.CMB.FILTERED"] = computing.computeFilteredZoom(
+                    data["FFT.SCI.CMB"], 
+                    config["BAND.INDEX"], 
+                    config["MATRIX.ZOOM"]
+            )
+            data["SCAN.OPD.CMB.FILTERED"] = np.repeat(config["OPD.ZOOM"][None,:], 
+                                                      len(data["SCAN.SCI.CMB.FILTERED"]), 
+                                                      axis=0)
         self._tac("filterCombinedData") 
 
     def prepareRaw(self):
@@ -912,6 +1565,10 @@ class DataCommunication(object):
     def computeDataFFTRaw(self):
         """ Compute the fft for raw data 
 
+        If TEST.REAL.FFT.RAW is True only the non-redundant half spectrum
+        of the (real) raw data is computed, FFT.SCI.RAW and FFT.SIGMA.RAW
+        have then N.OPL//2+1 frequencies.
+
         Saved Attributes
         ----------------
         FFT.SIGMA.RAW : array (N.BASE, N.OPL)
@@ -931,25 +1588,34 @@ class DataCommunication(object):
             return             
         self._tic("computeDataFFTRaw") 
         data, config = self.data, self.config
+        real = config["TEST.REAL.FFT.RAW"]
 
         (
          sciFFTRaw, 
          sigRaw
          )  = computing.computeDataFFT(
                 data["SCAN.SCI.RAW"],
-                data["SCAN.OPD.RAW"] 
+                data["SCAN.OPD.RAW"], 
+                real=real
             )
         
         if config["TEST.PROCESS.OVERSAMP"]:
+            ##
+            # The half spectrum only have the positive frequencies 
+            if real:
+                idOversampling = slice(0, config["FREQ.MAX"]+1)
+            else:
+                idOversampling = config["ID.OVERSAMPLING"]
 
-            sigRaw = sigRaw[:,config["ID.OVERSAMPLING"]]
-            sciFFTRaw = sciFFTRaw[:,config["ID.OVERSAMPLING"]]
+            sigRaw = sigRaw[:,idOversampling]
+            sciFFTRaw = sciFFTRaw[:,idOversampling]
 
             (
               data["SCAN.SCI.RAW"],
               data["SCAN.OPD.RAW"]  
             ) = computing.computeDataFFT(
-                sciFFTRaw,  sigRaw, inverse=1
+                sciFFTRaw,  sigRaw, inverse=1, 
+                real=real, size=2*config["FREQ.MAX"]
             )                                                
         
         data["FFT.SCI.RAW"]   = sciFFTRaw
@@ -976,7 +1642,9 @@ class DataCommunication(object):
         data, config = self.data, self.config
         data["FLUX.TEL"] = computing.computeFluxPerTelescope(
             data["SCAN.SCI.RAW"], 
-            config["MAP"]
+            config["MAP"], 
+            pinvMatrix=config.get("MATRIX.FLUX.PINV", None), 
+            sumMatrix=config.get("MATRIX.FLUX.SUM", None)
         )
 
         self._tac("computeFlux") 
@@ -1033,9 +1701,117 @@ class DataCommunication(object):
 
         data["PHASE.TEL"] = computing.computeDifferentialPhase(
                 data["SCAN.SCI.CMB.FILTERED.NORMALIZED"], 
-                config["MAPC"]
+                config["MAPC"], 
+                phaseMatrix=config.get("MATRIX.PHASE", None)
             )                
-        self._tac("computeDifferentialPhase")   
+        self._tac("computeDifferentialPhase")
+
+
+    def reduceScans(self, sciData, oplData, darkData=None):
+        """ Reduce a stack of scans in one vectorized pass
+
+        This is used to re-process offline (or catch up) several scans taken
+        with the current configuration (MAP, N.OPL, ...). The scans are
+        prepared as in prepareData (without background offset), then go
+        through the 'snr' and 'flux' computing. The psd of all the scans are
+        pushed in order in the PSD ring buffer.
+
+        The current scan (.data) is not altered.
+
+        Parameters
+        ----------
+        sciData : array (K, N.WIN.SCI, N.OPL.RAW)
+            Scientific flux as received
+        oplData : array (K, N.TEL, N.OPL.RAW)
+            Opd as received (in meter)
+        darkData : array (K, N.WIN.DARK, N.OPL.RAW), optional
+            Flux for the dark windows
+
+        Outputs
+        -------
+        products : dict
+            with POS.BASE, SNR.BASE, SNR.BASE.MEAN  (K, N.BASE)
+                 PSD.MEAN (K, N.BASE, N.OPL)
+                 POS.TEL, SNR.TEL, STATUS.TEL.TRACKING, FLUX.TEL (K, N.TEL)
+                 POS.BASE.RECOMP (K, N.BASE)
+
+        Altered Permanent Data Products
+        -------------------------------
+        DATA.BUFFER.PSD
+        """
+        config, permanentData = self.config, self.permanentData
+        map = config["MAP"]
+        if map is None:
+            raise RuntimeError("No interaction matrix map given, cannot reduce scans")
+
+        nOpl = config["N.OPL"]
+        nOplRaw = config["N.OPL.RAW"]
+        sciData = np.array(sciData, dtype=np.float32 if config["TEST.SINGLE.PRECISION"] else float)
+        oplData = np.array(oplData, dtype=float)
+        if sciData.shape[1:] != (config["N.WIN.SCI"], nOplRaw):
+            raise ValueError("Expecting scans of shape (K, %d, %d) got %r"%(config["N.WIN.SCI"], nOplRaw, sciData.shape))
+
+        ###
+        # same preparation than prepareData
+        nFclean = config["N.FIRST.SCAN.TO.CLEAN"]
+        sciData[...,0:nFclean] = sciData[...,nFclean:nFclean+1]
+        if config["TEST.SUBSTRACT.DARKWIN"] and (darkData is not None):
+            darkData = np.asarray(darkData)
+            sciData -= darkData.reshape( (len(darkData),-1) ).mean(axis=1)[:,None,None]
+        if config.get("FILTER.DECIMATION", None) is not None:
+            factor = config["OVERSAMP.FACTOR"]
+            sciData = computing.decimateData(sciData, config["FILTER.DECIMATION"])
+            oplData = oplData[...,0:nOpl*factor].reshape( oplData.shape[:-1]+(nOpl,factor) ).mean(axis=-1)
+        oplData *= 1e6
+        oplData -= oplData[...,nOpl//2:nOpl//2+1]
+
+        products = {}
+        sciCmb, opdCmb = computing.computeDataCmd(
+            sciData,
+            oplData,
+            map,
+            cmbMatrix=config.get("MATRIX.CMB", None),
+            cmbTels=config.get("ID.TEL.CMB", None),
+            oplOrder=config.get("ID.OPL.ORDER", None)
+        )
+        sciFFTCmb, sigCmb = computing.computeDataFFT(sciCmb, opdCmb)
+        if config["TEST.PROCESS.OVERSAMP"]:
+            sciFFTCmb = sciFFTCmb[...,config["ID.OVERSAMPLING"]]
+            sigCmb = sigCmb[...,config["ID.OVERSAMPLING"]]
+
+        (products["POS.BASE"],
+         products["SNR.BASE"],
+         products["SNR.BASE.MEAN"],
+         permanentData["DATA.BUFFER.PSD"],
+         products["PSD.MEAN"],
+         _
+         ) = computing.computeOpdIota(
+                sciFFTCmb,
+                sigCmb,
+                fltIn = config["FILTER.IN"],
+                fltOut= config["FILTER.OUT"],
+                psdBuffer=  permanentData["DATA.BUFFER.PSD"]
+        )
+        (
+         products["POS.TEL"],
+         products["SNR.TEL"],
+         products["POS.BASE.RECOMP"],
+         products["STATUS.TEL.TRACKING"]
+        ) = computing.computeOplMatrix(
+                    products["POS.BASE"],
+                    products["SNR.BASE"],
+                    config["MAPC"],
+                    config["SNR.MIN"],
+                    niobate= False, 
+                    pivotMatrix= config.get("MATRIX.PIVOT", None)
+        )
+        products["FLUX.TEL"] = computing.computeFluxPerTelescope(
+            sciData, 
+            map,
+            pinvMatrix=config.get("MATRIX.FLUX.PINV", None), 
+            sumMatrix=config.get("MATRIX.FLUX.SUM", None)
+        )
+        return products
 
 
 
@@ -1093,14 +1869,35 @@ class DataCommunication(object):
     def runRecipies(self):
         """ Run all the recipies that has been turned on 
 
+        'getdata' and 'getdatasafe' are run first, the loop stop if they 
+        fail. The steps of all the other recipies are then scheduled 
+        together (see runSteps), each step is run once. The actions of the
+        recipies (e.g. sendOffsets) are run at the end. 
+        The plotRecipies are skipped if a newer scan is waiting in scanQueue.
+
         see turnRecipyOff, turnRecipyOn
         """
         self._tic("recipy:all")
-        for recipy, state in self.recipies.items():
-            if state:
+        active = [recipy for recipy, state in self.recipies.items() if state]
+        for recipy in active:
+            if recipy in ("getdata", "getdatasafe"):
                 if self.runRecipy(recipy):
-                    break
+                    self._tac("recipy:all")
+                    return 0
+        
+        reductions = [recipy for recipy in active if recipy not in ("getdata", "getdatasafe")]
+        ## a newer scan is waiting, the plots will be made with it  
+        if self.hasPendingScan():
+            reductions = [recipy for recipy in reductions if recipy not in plotRecipies]
+        targets = []
+        for recipy in reductions:
+            targets.extend(step for step in self.recipySteps(recipy) if step not in targets)
+        self.runSteps(targets)
+
+        for recipy in reductions:
+            self.runActions(recipy)
         self._tac("recipy:all")        
+        self.publish()
         return 0
 
     def runRecipy(self,recipy):
@@ -1119,6 +1916,8 @@ class DataCommunication(object):
             self._tic("recipy:getdata")
             self.open() # try to open connection if closed
             self.receiveData()
+            if self.config["TEST.SCREEN.DATA"]:
+                run("screenData", self.screenData)
             run("prepareData",self.prepareData)
             self._tac("recipy:getdata")
             return 0
@@ -1154,6 +1953,8 @@ class DataCommunication(object):
                 self._tac("recipy:getdatasafe")
                 return 1
 
+            if self.config["TEST.SCREEN.DATA"]:
+                run("screenData", self.screenData)
             run("prepareData",self.prepareData)
             if not self.isDataReady():
                 self.log("Wrong data retry wait %f sec "%sleepTime)
@@ -1164,60 +1965,171 @@ class DataCommunication(object):
             self._tac("recipy:getdatasafe")
             return 0
 
-        if recipy == "track":
-            self._tic("recipy:track")
-            run("combineData", self.combineData)
-            run("computeDataFFTCmb", self.computeDataFFTCmb)
-            run("computeOpdPerBase", self.computeOpdPerBase)
-            run("computeOpdPerTelescope", self.computeOpdPerTelescope)                                                            
-            self.sendOffsets()       
-            self._tac("recipy:track")
-            return 0    
-        
-        elif recipy == "filter" or recipy == "filterPsd":
-            self._tic("recipy:filter")            
-            run("combineData", self.combineData)
-            run("computeDataFFTCmb", self.computeDataFFTCmb)
-            run("computeOpdPerBase", self.computeOpdPerBase)
-            run("computeOpdPerTelescope", self.computeOpdPerTelescope)
-            run("filterCombinedData", self.filterCombinedData)
-            self._tac("recipy:filter")
-            return 0
-
-        elif recipy == "flux":
-            self._tic("recipy:flux")
-            run("prepareRaw",  self.prepareRaw)
-            run("computeFlux", self.computeFlux)
-            self._tac("recipy:flux")
-            return 0
+        if recipy not in self.recipies:
+            raise ValueError("Unknown recipy %r"%recipy)
 
-        elif recipy == "snr": # same as track but without sending offsets
-            self._tic("recipy:snr")
-            run("combineData", self.combineData)
-            run("computeDataFFTCmb", self.computeDataFFTCmb)
-            run("computeOpdPerBase", self.computeOpdPerBase)
-            run("computeOpdPerTelescope", self.computeOpdPerTelescope)                        
-            self._tac("recipy:snr")
-            return 0
+        self._tic("recipy:"+recipy)
+        self.runSteps(self.recipySteps(recipy))
+        self.runActions(recipy)
+        self._tac("recipy:"+recipy)
+        self.publish()
+        return 0
 
-        elif recipy == "raw":
-            self._tic("recipy:raw")
-            run("prepareRaw", self.prepareRaw)
-            run("computeDataFFTRaw", self.computeDataFFTRaw)
-            run("computeFlux", self.computeFlux)
-            self._tac("recipy:raw")
-            return 0
+    def recipySteps(self, recipy):
+        """ return the steps (names) needed by a recipy 
 
-        elif recipy == "niobate":    
-            self._tic("recipy:niobate")
-            run("combineData", self.combineData)            
-            run("computeDataFFTCmb", self.computeDataFFTCmb)
-            run("filterCombinedData", self.filterCombinedData)
-            run("normalizeDataCmb", self.normalizeDataCmb)
-            run("computeDifferentialPhase", self.computeDifferentialPhase)
+        The steps they depend on (see stepGraph) are not necessarly 
+        in the list, they are added by scheduleSteps. 
+        An empty list is returned if the scan is rejected by the screening.
+        """
+        config = self.config
+        ## no need to reduce a bad scan, and no offset sent 
+        if recipy in ("track", "filter", "filterPsd", "snr", "niobate") and\
+           self.isScanRejected():
+            return []
+
+        if recipy in ("track", "snr"):
+            if self.useAbcd(recipy):
+                steps = ["computeOpdPerBaseAbcd"]
+            else:
+                steps = ["computeDataFFTCmb", "computeOpdPerBase"]
+            steps.append("computeOpdPerTelescope")
+            if recipy == "track" and config["TEST.PREDICT.OFFSET"]:
+                steps.append("predictOffsets")
+            return steps 
+
+        if recipy in ("filter", "filterPsd"):
+            ## the psd plot does not depend on the piston estimator
+            return ["computeDataFFTCmb", "computePsdCmb", "computeOpdPerBase", 
+                    "computeOpdPerTelescope", "filterCombinedData"]
+        if recipy == "flux":
+            return ["computeFlux"]
+        if recipy == "raw":
+            return ["computeDataFFTRaw", "computeFlux"]
+        if recipy == "niobate":
+            ## no differential phase without polarisation 
+            if config["N.POLAR"] < 2:
+                return []
+            return ["computeDataFFTCmb", "computeDifferentialPhase"]
+        return []
+
+    def runActions(self, recipy):
+        """ run the communication actions of a recipy after its steps """
+        if recipy == "track" and self.checkStep("computeOpdPerTelescope"):
+            self.sendOffsets()
+        elif recipy == "niobate" and self.checkStep("filterCombinedData"):
             self.sendDifferentialPhase()
-            self._tac("recipy:niobate")
-            return 0
+
+    def scheduleSteps(self, targets):
+        """ Order the steps needed to compute targets 
+
+        The producers (see stepGraph) of the missing inputs are added, the
+        first step selected for a data key is its only producer: a later 
+        step with the same output is ignored. A step altering a key run 
+        after the other steps reading it (they get the unaltered key), 
+        unless they depend on it. Steps already done for this scan are 
+        removed. 
+
+        Parameters
+        ----------
+        targets : list of string
+            step names 
+
+        Outputs
+        -------
+        waves : list of list of string
+            the steps of a wave only depend on the previous waves and 
+            can be run concurrently 
+        """
+        selected = []
+        producers = {}
+        def select(step):
+            if step in selected:
+                return
+            inputs, outputs, _ = stepGraph[step]
+            if any(key in producers for key in outputs):
+                self.log("step %s ignored, its outputs are computed by %s"%(step, 
+                         ", ".join(set(producers[k] for k in outputs if k in producers))), 2)
+                return
+            for key in outputs:
+                producers[key] = step
+            selected.append(step)
+            for key in inputs:
+                if key in producers:
+                    continue
+                for other, (_, otherOutputs, _) in stepGraph.items():
+                    if key in otherOutputs:
+                        select(other)
+                        break
+        for step in targets:
+            select(step)
+        
+        ## dependencies from the data keys 
+        depends = dict( (step, set(producers[key] for key in stepGraph[step][0] if key in producers)) 
+                         for step in selected)
+        def ancestors(step, found=None):
+            found = set() if found is None else found
+            for parent in depends[step]:
+                if parent not in found:
+                    found.add(parent)
+                    ancestors(parent, found)
+            return found
+        for alterer in selected:
+            for key in stepGraph[alterer][2]:
+                for reader in selected:
+                    if (reader != alterer) and (key in stepGraph[reader][0]) and\
+                       (alterer not in ancestors(reader)):
+                        depends[alterer].add(reader)
+
+        ## waves in the stepGraph order 
+        order = [step for step in stepGraph if step in selected]
+        waves = []
+        done = set(step for step in order if self.checkStep(step))
+        todo = [step for step in order if step not in done]
+        while todo:
+            wave = [step for step in todo if depends[step] <= done]
+            if not wave:
+                raise RuntimeError("Circular step dependencies in %s"%todo)
+            waves.append(wave)
+            done.update(wave)
+            todo = [step for step in todo if step not in done]
+        return waves
+
+    def runSteps(self, targets):
+        """ Run the steps needed to compute targets 
+
+        The independent steps of a wave (see scheduleSteps) are run 
+        concurrently on a pool of STEP.WORKERS threads, one after the other 
+        if STEP.WORKERS is 1. The concurrent steps write different keys 
+        of .data and .config (one producer per key, a step altering a key 
+        waits for its readers), the step bookkeeping (steps, timers, 
+        elapsedTimes) and the buffer arena are guarded by a lock. 
+
+        Parameters
+        ----------
+        targets : list of string
+            step names 
+        """
+        waves = self.scheduleSteps(targets)
+        workers = self.config["STEP.WORKERS"]
+        for wave in waves:
+            if (workers>1) and (len(wave)>1):
+                self.getStepPool().map(self._runStep, wave)
+            else:
+                for step in wave:
+                    self._runStep(step)
+
+    def _runStep(self, step):
+        if not self.checkStep(step):
+            getattr(self, step)()
+
+    def getStepPool(self):
+        """ return the thread pool of runSteps, built at first call """
+        workers = self.config["STEP.WORKERS"]
+        if (self._stepPool is None) or (self._stepPoolSize != workers):
+            self._stepPool = ThreadPool(workers)
+            self._stepPoolSize = workers
+        return self._stepPool
 
 
     ##########################################
@@ -1250,6 +2162,9 @@ class DataCommunication(object):
 
     def sendOffsets(self, timeout=1000):
         """ Send the computed offset to the delay lines 
+
+        POS.TEL.PREDICTED is sent if computed (predictOffsets), 
+        POS.TEL otherwise.
     
         Parmeters
         ---------
@@ -1266,16 +2181,21 @@ class DataCommunication(object):
         
         tt = self.permanentData["TIMES.TRACK"]        
         tt[1:] = tt[0:-1]
-        tt[1] = _time()
+        tt[0] = _time()
 
         ## if no tracking return 
         if not com.getTrackingFlag():
             return             
 
+        offsets = self.data.get("POS.TEL.PREDICTED", self.data["POS.TEL"])
         try:
-            com.sendOffsets(self.device, self.data["POS.TEL"], timeout=timeout) 
+            com.sendOffsets(self.device, offsets, timeout=timeout) 
         except RuntimeError:
-            self.log("ERROR Offset to DL: %s failed !"%(", ".join("%.2f"%o for o in self.data["POS.TEL"])),1)    
+            self.log("ERROR Offset to DL: %s failed !"%(", ".join("%.2f"%o for o in offsets)),1)    
+            return 
+        ## the predictor needs the sum of the offsets sent 
+        if self.permanentData["PISTON.FILTER"] is not None:
+            self.permanentData["PISTON.FILTER"].addCommand(offsets)
 
 
 
@@ -1299,25 +2219,90 @@ class DataCommunication(object):
             com.setSnr(i,snr)
 
 
+class ReadOnlyDict(dict):
+    """ a dict that cannot be modified after construction """
+    def _readOnly(self, *args, **kwargs):
+        raise TypeError("snapshot dictionaries are read only")
+    __setitem__ = __delitem__ = _readOnly
+    clear = update = pop = popitem = setdefault = _readOnly
+
+
+class ScanSnapshot(object):
+    """ Read only state of DataCommunication after one scan 
+
+    Built by DataCommunication.publish and available as its `latest`
+    attribute. It has the reading interface of DataCommunication 
+    (data, config, permanentData, checkStep, isDataValid, isDataReady) 
+    so it can be given to the plots instead of the DataCommunication. 
+
+    What is guaranteed not to change after the publication:
+    - .data : the arrays are made read only (not copied), the next scan
+      gets new dictionaries and arrays.
+    - .permanentData : the arrays (e.g. TIMES.TRACK, updated in place) are
+      copied and read only, the numbers are kept. The stateful objects 
+      (DATA.BUFFER.PSD, BACKGROUND.*, PISTON.FILTER, BUFFER.ARENA) are 
+      updated in place and are not published, their per scan results are 
+      in .data (e.g. PSD.MEAN).
+    - .config : shallow copy, the DataCommunication replaces the config 
+      values and does not modify them in place. 
+
+    Parameters
+    ----------
+    data, config, permanentData : dict
+        the DataCommunication dictionaries 
+    steps : dict
+        step name -> True if done
+    """
+    log = staticmethod(com.log)
+
+    def __init__(self, data, config, permanentData, steps):
+        for value in data.values():
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+        self.data = ReadOnlyDict(data)
+        self.config = ReadOnlyDict(config)
+        published = {}
+        for key, value in permanentData.items():
+            if isinstance(value, np.ndarray):
+                value = value.copy()
+                value.flags.writeable = False
+            elif not isinstance(value, (numbers.Number, str, type(None))):
+                continue
+            published[key] = value
+        self.permanentData = ReadOnlyDict(published)
+        self.steps = frozenset(step for step, done in steps.items() if done)
+
+    def checkStep(self, step):
+        return step in self.steps
+
+    def isDataValid(self):
+        """ True if the snapshot has a scan """
+        return self.data.get("SCAN.SCI",None) is not None
+
+    def isDataReady(self):
+        """ True if the scan of the snapshot has been prepared """
+        return self.checkStep("prepareData")
+
+
 class Lock(object):
-    """ decorate a dataCom instance so it will be locked in a with instance 
+    """ give the latest snapshot of a dataCom instance in a with statement 
+
+    Nothing is locked (see DataCommunication.publish), this is kept 
+    for the plots. 
 
     Example
     -------
-        with Lock(dataCom) as dc:
-            # do stuff
-    
-
+        with Lock(dataCom) as snapshot:
+            # read snapshot.data, snapshot.config 
     """
     def __init__(self, dataCom):
         self.dataCom = dataCom
     
     def __enter__(self):
-        self.dataCom.lock()
-        return self.dataCom
+        return self.dataCom.latest
 
     def __exit__(self,type, value, traceback):
-        self.dataCom.unlock()
+        pass
 
 
 
@@ -0,0 +1,178 @@
+""" Small FFT layer used by computing.py
+
+The transforms are made by the first available backend of:
+
+- pyfftw : FFTW plans are built once per (shape, dtype, axis) and reused
+- scipy  : scipy.fft with several workers (threads)
+- numpy  : numpy.fft, always available
+
+The backend can be forced with the "FFT.BACKEND" configuration key and the
+number of threads is set by "FFT.WORKERS". The chosen backend is recorded
+in the `name` attribute of the backend returned by getBackend().
+
+All the transforms accept an `out` array where the result is written. Only
+pyfftw writes it without allocating an intermediate array.
+
+Example:
+    >>> from pndrtdscope import fftbackend
+    >>> fftbackend.getBackend().name
+    'scipy'
+    >>> ft = fftbackend.getBackend().fft(data, axis=-1)
+"""
+import numpy as np
+import threading
+import multiprocessing
+from . import config
+
+try:
+    import pyfftw
+    import pyfftw.builders
+except ImportError:
+    pyfftw = None
+
+try:
+    import scipy.fft as scipyfft
+except ImportError:
+    scipyfft = None
+
+
+def availableBackends():
+    """ return the list of available backend names by order of preference """
+    backends = []
+    if pyfftw is not None:
+        backends.append("pyfftw")
+    if scipyfft is not None:
+        backends.append("scipy")
+    backends.append("numpy")
+    return backends
+
+
+class FFTBackend(object):
+    """ FFT functions with plans cached per (shape, dtype, axis)
+
+    Parameters
+    ----------
+    name : string, optional
+        "pyfftw", "scipy" or "numpy".
+        If None the first of availableBackends() is taken
+    workers : int, optional
+        number of threads used by pyfftw or scipy, -1 for all the cores
+    """
+    def __init__(self, name=None, workers=1):
+        available = availableBackends()
+        if name is None:
+            name = available[0]
+        elif name not in available:
+            raise ValueError("FFT backend %r is not available, should be one of %s"%(name, ", ".join(available)))
+
+        if workers is None or workers<1:
+            workers = multiprocessing.cpu_count()
+
+        self.name = name
+        self.workers = workers
+        self.plans = {}
+
+    def getPlan(self, kind, shape, dtype, axis=-1, n=None):
+        """ return the cached plan, a function plan(data, out=None)
+
+        Parameters
+        ----------
+        kind : string
+            "fft", "ifft", "rfft" or "irfft"
+        shape : tuple
+            shape of the input array
+        dtype : dtype
+            type of the input array
+        axis : int, optional
+            axis of the transform
+        n : int, optional
+            length of the output for irfft
+        """
+        key = (kind, tuple(shape), np.dtype(dtype), axis, n)
+        try:
+            return self.plans[key]
+        except KeyError:
+            plan = self._makePlan(kind, shape, dtype, axis, n)
+            self.plans[key] = plan
+            return plan
+
+    def _makePlan(self, kind, shape, dtype, axis, n):
+        workers = self.workers
+
+        if self.name == "pyfftw":
+            fftw = getattr(pyfftw.builders, kind)(
+                        pyfftw.empty_aligned(shape, dtype=dtype),
+                        n=n, axis=axis, threads=workers,
+                        planner_effort="FFTW_MEASURE"
+                    )
+            ## the fftw object reuse its input/output arrays
+            lock = threading.Lock()
+            def plan(data, out=None):
+                with lock:
+                    if out is None:
+                        return fftw(data).copy()
+                    out[...] = fftw(data)
+                    return out
+            return plan
+
+        if self.name == "scipy":
+            func = getattr(scipyfft, kind)
+            return _withOut(lambda data: func(data, n=n, axis=axis, workers=workers))
+
+        func = getattr(np.fft, kind)
+        if np.dtype(dtype) in (np.float32, np.complex64):
+            ## numpy.fft compute in double, keep the single precision
+            outType = np.float32 if kind=="irfft" else np.complex64
+            return _withOut(lambda data: func(data, n=n, axis=axis).astype(outType, copy=False))
+        return _withOut(lambda data: func(data, n=n, axis=axis))
+
+    def fft(self, data, axis=-1, out=None):
+        """ forward complex fft along axis """
+        return self.getPlan("fft", data.shape, data.dtype, axis)(data, out)
+
+    def ifft(self, data, axis=-1, out=None):
+        """ backward complex fft along axis """
+        return self.getPlan("ifft", data.shape, data.dtype, axis)(data, out)
+
+    def rfft(self, data, axis=-1, out=None):
+        """ forward fft of real data along axis (half spectrum) """
+        return self.getPlan("rfft", data.shape, data.dtype, axis)(data, out)
+
+    def irfft(self, data, n=None, axis=-1, out=None):
+        """ backward fft of a half spectrum, return a real signal of length n """
+        return self.getPlan("irfft", data.shape, data.dtype, axis, n)(data, out)
+
+
+def _withOut(func):
+    """ add the out argument to a transform returning a new array """
+    def plan(data, out=None):
+        if out is None:
+            return func(data)
+        out[...] = func(data)
+        return out
+    return plan
+
+
+_backend = None
+def getBackend():
+    """ return the FFT backend, built from config at first call """
+    global _backend
+    if _backend is None:
+        _backend = FFTBackend(config.defaults.get("FFT.BACKEND", None),
+                              config.defaults.get("FFT.WORKERS", 1)
+                              )
+    return _backend
+
+def setBackend(name=None, workers=1):
+    """ change the FFT backend, all cached plans are dropped
+
+    Parameters
+    ----------
+    name : string, optional
+        "pyfftw", "scipy" or "numpy". If None the first available is taken
+    workers : int, optional
+        number of threads, -1 for all the cores
+    """
+    global _backend
+    _backend = FFTBackend(name, workers)
+    return _backend
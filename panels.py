@@ -537,7 +537,7 @@ class StatusFrame(tk.Frame):
 
     def rtdUpdate(self):
         """ update the status message """
-        dataCom = self.dataCom
+        dataCom = self.dataCom.latest
         thistime = time.time()
         elpased = thistime-self.time if self.time else 0.0
         text = time.strftime("%Y-%m-%dT%H:%M:%S",time.localtime())+" - " 
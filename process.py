@@ -1,4 +1,4 @@
-from .datacom import DataCommunication, Lock, com
+from .datacom import DataCommunication, Lock, com, queue
 import threading
 import time
 
@@ -14,6 +14,44 @@ except NameError:
     basestring = (str,bytes)
     
 
+class AcquisitionThread(threading.Thread):
+    """ Receive the scans in a bounded queue while the previous ones are reduced 
+
+    The scans (or the errors) of dataCom.acquireScan are put in `queue`, 
+    when the queue is full the thread waits: no scan is dropped. 
+    The queue is given to dataCom.scanQueue by TrackThread.
+    """
+    def __init__(self, dataCom, size=4, sleepTime=2.0):
+        threading.Thread.__init__(self)
+        self.daemon = True 
+        self.dataCom = dataCom
+        self.queue = queue.Queue(size)
+        self.sleepTime = sleepTime
+        self.stopEvent = threading.Event()
+
+    def stop(self):
+        self.stopEvent.set()
+
+    def put(self, scan):
+        while not self.stopEvent.is_set():
+            try:
+                self.queue.put(scan, timeout=0.5)
+            except queue.Full:
+                continue
+            return 
+
+    def run(self):
+        while not self.stopEvent.is_set():
+            try:
+                scan = self.dataCom.acquireScan()
+            except RuntimeError as e:
+                scan = e 
+            self.put(scan)
+            ## no scan running or communication problem, wait a few  
+            if not isinstance(scan, tuple):
+                self.stopEvent.wait(self.sleepTime)
+
+
 class TrackThread(threading.Thread):
     def __init__(self, dataCom, delay=0.0):
         threading.Thread.__init__(self)
@@ -26,6 +64,22 @@ class TrackThread(threading.Thread):
         # turn the recipy 'track' on 
         # this is the minimum we can ask 
         self.dataCom.turnRecipyOn("track")
+
+        ###
+        # receive the next scan while this one is reduced 
+        acquisition = None 
+        if self.dataCom.config["TEST.ACQUISITION.THREAD"]:
+            acquisition = AcquisitionThread(self.dataCom, self.dataCom.config["SCAN.QUEUE.SIZE"])
+            self.dataCom.scanQueue = acquisition.queue
+            acquisition.start()
+        try:
+            self.loop()
+        finally:
+            if acquisition is not None:
+                acquisition.stop()
+                self.dataCom.scanQueue = None 
+
+    def loop(self):
         while True:
             time.sleep(self.delay)
             ####
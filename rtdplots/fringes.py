@@ -149,8 +149,9 @@ class RtdCombinedFringesAxis(RtdAxis):
 class RtdCombinedFringesFigure(RtdFigure):		
 	AxisClass = RtdCombinedFringesAxis
 	def isReady(self):
-		return self.dataCom.checkStep("filterCombinedData") and\
-		 self.dataCom.checkStep("computeOpdPerTelescope")
+		dataCom = self.dataCom.latest
+		return dataCom.checkStep("filterCombinedData") and\
+		 dataCom.checkStep("computeOpdPerTelescope")
 		
 	def turnOn(self):
 		self.dataCom.turnRecipyOn("filter")
@@ -159,7 +160,7 @@ class RtdCombinedFringesFigure(RtdFigure):
 		self.dataCom.turnRecipyOff("filter")	
 
 	def makeSubPlots(self):
-		dataCom = self.dataCom
+		dataCom = self.dataCom.latest
 		nBase = len(dataCom.data["SCAN.SCI.CMB"])	
 		if nBase>6:
 			M, N = 2, int(np.ceil(nBase/2))
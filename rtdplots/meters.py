@@ -147,7 +147,7 @@ class RtdTelFluxAxis(RtdAxis):
 class RtdTelFluxFigure(RtdFigure):	
 
 	def isReady(self):
-		return self.dataCom.checkStep("computeFlux")
+		return self.dataCom.latest.checkStep("computeFlux")
 	def turnOn(self):
 		self.dataCom.turnRecipyOn("flux")
 	def turnOff(self):
@@ -285,7 +285,7 @@ class RtdTelSnrAxis(RtdAxis):
 class RtdTelSnrFigure(RtdFigure):	
 
 	def isReady(self):
-		return self.dataCom.checkStep("computeOpdPerTelescope")
+		return self.dataCom.latest.checkStep("computeOpdPerTelescope")
 	def turnOn(self):
 		self.dataCom.turnRecipyOn("snr")
 	def turnOff(self):
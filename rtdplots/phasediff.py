@@ -112,7 +112,7 @@ class RtdPhaseDiffMeterFigure(RtdFigure):
 	AxisClass = RtdPhaseDiffMeterAxis
 	def isReady(self):
 		return True
-		return self.dataCom.checkStep("computeDifferentialPhase")
+		return self.dataCom.latest.checkStep("computeDifferentialPhase")
 		
 	def turnOn(self):		
 		return 
@@ -183,7 +183,7 @@ class RtdPhaseDiffAxis(RtdAxis):
 			nPolar = dataCom.config["N.POLAR"]
 			data = dataCom.data		
 			y = data["SCAN.SCI.CMB.FILTERED.NORMALIZED"]	
-			x = data["SCAN.OPD.CMB"]
+			x = data["SCAN.OPD.CMB.FILTERED"]
 
 
 		if nPolar < 2:
@@ -279,7 +279,7 @@ class RtdPhaseDiff2Axis(RtdAxis):
 			nPolar = dataCom.config["N.POLAR"]
 			data = dataCom.data		
 			y = data["SCAN.SCI.CMB.FILTERED.NORMALIZED"]	
-			x = data["SCAN.OPD.CMB"]
+			x = data["SCAN.OPD.CMB.FILTERED"]
 
 		if nPolar < 2:
 			return
@@ -325,7 +325,7 @@ class RtdPhaseDiff2Axis(RtdAxis):
 class RtdPhaseDiffFigure(RtdFigure):		
 	AxisClass = RtdPhaseDiffAxis
 	def isReady(self):
-		return self.dataCom.checkStep("computeDifferentialPhase")
+		return self.dataCom.latest.checkStep("computeDifferentialPhase")
 
 	def turnOn(self):
 		return 
@@ -338,7 +338,7 @@ class RtdPhaseDiffFigure(RtdFigure):
 		#self.dataCom.turnRecipyOff("niobate")	
 
 	def makeSubPlots(self):
-		dataCom = self.dataCom
+		dataCom = self.dataCom.latest
 		nBase = len(dataCom.data["SCAN.SCI.CMB"])//2					
 		M, N = 1, nBase
 
@@ -353,7 +353,7 @@ class RtdPhaseDiffFigure(RtdFigure):
 class RtdPhaseDiff2Figure(RtdFigure):		
 	AxisClass = RtdPhaseDiff2Axis
 	def isReady(self):
-		return self.dataCom.checkStep("computeDifferentialPhase")
+		return self.dataCom.latest.checkStep("computeDifferentialPhase")
 
 	def turnOn(self):
 		return 
@@ -366,7 +366,7 @@ class RtdPhaseDiff2Figure(RtdFigure):
 		#self.dataCom.turnRecipyOff("niobate")	
 
 	def makeSubPlots(self):
-		dataCom = self.dataCom
+		dataCom = self.dataCom.latest
 		nBase = len(dataCom.data["SCAN.SCI.CMB"])//2					
 		M, N = 1, nBase
 
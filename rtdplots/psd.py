@@ -73,7 +73,7 @@ class RtdCombinedFringesPsdAxis(RtdAxis):
 			try:
 				y = data["FFT.SCI.CMB"]
 				x = data["FFT.SIGMA"]			
-				yMean = dataCom.permanentData["DATA.BUFFER.PSD"]
+				yMean = data["PSD.MEAN"]
 				filter = dataCom.config.get("FILTER.IN.RESCALED", None)
 				tsts = data.get('STATUS.TEL.TRACKING',None)
 			except KeyError:				
@@ -82,8 +82,8 @@ class RtdCombinedFringesPsdAxis(RtdAxis):
 		# take the norm 					
 		y = np.abs(y[baseIndex])**2
 		x = x[baseIndex]
-		# take the mean real 
-		yMean = yMean[:,baseIndex,:].mean(axis=0).real
+		# the mean psd of the buffer 
+		yMean = yMean[baseIndex].real
 
 
 
@@ -141,8 +141,9 @@ class RtdCombinedFringesPsdAxis(RtdAxis):
 class RtdCombinedFringesPsdFigure(RtdFigure):		
 	AxisClass = RtdCombinedFringesPsdAxis
 	def isReady(self):
-		return self.dataCom.checkStep("filterCombinedData") and\
-		 self.dataCom.checkStep("computeOpdPerTelescope")
+		dataCom = self.dataCom.latest
+		return dataCom.checkStep("filterCombinedData") and\
+		 dataCom.checkStep("computeOpdPerTelescope")
 		
 	def turnOn(self):
 		self.dataCom.turnRecipyOn("filterPsd")
@@ -151,7 +152,7 @@ class RtdCombinedFringesPsdFigure(RtdFigure):
 		self.dataCom.turnRecipyOff("filterPsd")	
 
 	def makeSubPlots(self):
-		dataCom = self.dataCom
+		dataCom = self.dataCom.latest
 		nBase = len(dataCom.data["SCAN.SCI.CMB"])	
 		if nBase>6:
 			M, N = 2, int(np.ceil(nBase/2))
@@ -56,7 +56,7 @@ class RtdRawFFTAxis(RtdAxis):
         ##
         # grab the data
         with Lock(self.dataCom) as dataCom:
-        	if not self.dataCom.checkStep("computeDataFFTRaw"):
+        	if not dataCom.checkStep("computeDataFFTRaw"):
         		return 
 	        data =  dataCom.data
 	        y = data['FFT.SCI.RAW']
@@ -87,7 +87,7 @@ class RtdRawFFTAxis(RtdAxis):
 class RtdRawFFTFigure(RtdFigure):       
     AxisClass = RtdRawFFTAxis
     def isReady(self):
-        return self.dataCom.checkStep("computeDataFFTRaw")
+        return self.dataCom.latest.checkStep("computeDataFFTRaw")
 
     def turnOn(self):
         self.dataCom.turnRecipyOn("raw")
@@ -96,7 +96,7 @@ class RtdRawFFTFigure(RtdFigure):
         self.dataCom.turnRecipyOff("raw")   
 
     def makeSubPlots(self):
-        dataCom = self.dataCom
+        dataCom = self.dataCom.latest
         nBase = dataCom.config["N.WIN.SCI"]
 
         N = nBase// int(np.sqrt(nBase))
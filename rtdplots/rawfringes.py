@@ -88,7 +88,7 @@ class RtdRawFringesAxis(RtdAxis):
 class RtdRawFringesFigure(RtdFigure):       
     AxisClass = RtdRawFringesAxis
     def isReady(self):
-        return self.dataCom.checkStep("prepareRaw")
+        return self.dataCom.latest.checkStep("prepareRaw")
 
     def turnOn(self):
         self.dataCom.turnRecipyOn("raw")
@@ -97,7 +97,7 @@ class RtdRawFringesFigure(RtdFigure):
         self.dataCom.turnRecipyOff("raw")   
 
     def makeSubPlots(self):
-        dataCom = self.dataCom
+        dataCom = self.dataCom.latest
         nBase = dataCom.config["N.WIN.SCI"]
 
         N = nBase// int(np.sqrt(nBase))
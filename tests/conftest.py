@@ -0,0 +1,23 @@
+""" make the package importable as `pndrtdscope` and run it in simulation mode """
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+## pndrtdscope_config.py of this directory turns SIMU.MODE on  
+sys.path.insert(0, HERE)
+
+if "pndrtdscope" not in sys.modules:
+    try:
+        import importlib.util
+    except ImportError:
+        import imp
+        imp.load_module("pndrtdscope", None, ROOT, ("", "", imp.PKG_DIRECTORY))
+    else:
+        spec = importlib.util.spec_from_file_location("pndrtdscope", 
+                    os.path.join(ROOT, "__init__.py"), 
+                    submodule_search_locations=[ROOT])
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["pndrtdscope"] = module
+        spec.loader.exec_module(module)
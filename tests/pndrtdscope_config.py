@@ -0,0 +1,10 @@
+""" local configuration used by the tests: simulated instrument """
+import numpy as np
+
+defaults = {"SIMU.MODE": True}
+
+## fewer spectral channels to make the simulated scans fast 
+simuConfig = {
+    "SPECTRA": np.ones( (4,50), float )/50., 
+    "WAVELENGTHS": np.linspace(1.4, 1.8, 50), 
+}
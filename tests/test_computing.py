@@ -0,0 +1,549 @@
+import numpy as np
+import pytest
+
+from pndrtdscope import computing, config
+from pndrtdscope.mapping import T1, T2, BASE, PHI, VIS
+
+
+def makeScan(nOpl=128, nTel=4, map=config.mapABCD_H, seed=0, signs=(1,-1,1,-1)):
+    """ random science windows and opd ramps of different directions """
+    rng = np.random.RandomState(seed)
+    data = rng.normal(size=(len(map), nOpl))
+    ramp = np.linspace(-10.0, 10.0, nOpl)
+    opd = np.array([s*(i+1)*ramp for i, s in enumerate(signs[0:nTel])])
+    return data, opd
+
+
+def referenceDataCmd(data, opd, map):
+    """ the loop of the first python version of computeDataCmd """
+    nBase = np.max(map[BASE])
+    dataCmb = np.zeros( (nBase, data.shape[-1]), complex)
+    opdCmb = np.zeros( (nBase, data.shape[-1]), float)
+    for b in range(nBase):
+        id = np.where(map[BASE]==b+1)[0]
+        dx = opd[map[id[0]][T2]-1] - opd[map[id[0]][T1]-1]
+        order = slice(0,None,1) if dx[1]>dx[0] else slice(-1,None,-1)
+        v = 0.0
+        for i in id:
+            v = v + data[i,order] * (map[i][VIS] * np.exp(1j*map[i][PHI]))
+        dataCmb[b] = v
+        opdCmb[b] = dx[order]
+    return dataCmb, opdCmb
+
+
+def test_computeDataCmd_matches_loop():
+    map = config.mapABCD_H
+    data, opd = makeScan()
+    dataCmb, opdCmb = computing.computeDataCmd(data, opd, map)
+    refData, refOpd = referenceDataCmd(data, opd, map)
+    assert np.allclose(dataCmb, refData, rtol=1e-12, atol=1e-12)
+    assert np.array_equal(opdCmb, refOpd)
+
+
+def test_computeDataCmd_precomputed_matrix():
+    map = config.mapABCD_H
+    data, opd = makeScan()
+    matrices = computing.computeCombinationMatrix(map, data.shape[-1])
+    dataCmb, opdCmb = computing.computeDataCmd(data, opd, map, 
+            cmbMatrix=matrices[0], cmbTels=matrices[1], oplOrder=matrices[2])
+    refData, refOpd = computing.computeDataCmd(data, opd, map)
+    assert np.array_equal(dataCmb, refData)
+    assert np.array_equal(opdCmb, refOpd)
+
+
+def uniqueBases(map):
+    """ the mapc of the map: one window per base, by base number """
+    bases = sorted(set(map[BASE]))
+    return map[[np.where(map[BASE]==b)[0][0] for b in bases]]
+
+
+def test_stack_of_scans_matches_one_by_one():
+    map = config.mapABCD_H
+    mapc = uniqueBases(map)
+    scans = [makeScan(nOpl=128, seed=k, signs=[(1,-1,1,-1), (-1,1,1,-1), (1,1,-1,-1)][k]) 
+             for k in range(3)]
+    data = np.array([s[0] for s in scans])
+    opd = np.array([s[1] for s in scans])
+
+    dataCmb, opdCmb = computing.computeDataCmd(data, opd, map)
+    ft, fre = computing.computeDataFFT(dataCmb, opdCmb)
+    pos, snr, snrMean, _, meanPsd, _ = computing.computeOpdIota(ft, fre)
+    posTel, snrTel, posBase, tracking = computing.computeOplMatrix(pos, snr, mapc)
+    flux = computing.computeFluxPerTelescope(data, map)
+
+    psdBuffer = None
+    for k in range(3):
+        oneCmb, oneOpd = computing.computeDataCmd(data[k], opd[k], map)
+        assert np.allclose(dataCmb[k], oneCmb) and np.allclose(opdCmb[k], oneOpd)
+        oneFt, oneFre = computing.computeDataFFT(oneCmb, oneOpd)
+        assert np.allclose(ft[k], oneFt) and np.allclose(fre[k], oneFre)
+        onePos, oneSnr, oneSnrMean, psdBuffer, oneMeanPsd, _ = computing.computeOpdIota(
+                oneFt, oneFre, psdBuffer=psdBuffer)
+        for a, b in [(pos, onePos), (snr, oneSnr), (snrMean, oneSnrMean), (meanPsd, oneMeanPsd)]:
+            assert np.allclose(a[k], b)
+        one = computing.computeOplMatrix(onePos, oneSnr, mapc)
+        for a, b in zip([posTel, snrTel, posBase, tracking], one):
+            assert np.allclose(a[k], b)
+        assert np.allclose(flux[k], computing.computeFluxPerTelescope(data[k], map))
+
+
+def noisyRamps(nTel=4, nOpl=512, jitter=0.3, seed=1):
+    """ opd ramps with a gaussian jitter of `jitter` steps on each sample """
+    rng = np.random.RandomState(seed)
+    step = np.array([1.0, -3.0, 0.5, -0.2])[0:nTel, None]
+    return step*np.arange(nOpl) + jitter*step*rng.normal(size=(nTel, nOpl))
+
+
+def test_computeScanQuality_noisy_ramps_are_good():
+    opd = noisyRamps()
+    data = np.ones( (24, opd.shape[-1]) )
+    qualityWin, qualityTel, quality = computing.computeScanQuality(data, opd)
+    assert quality == 0
+    assert not qualityTel.any()
+
+
+def test_computeScanQuality_flags():
+    opd = noisyRamps(jitter=0.0)
+    data = np.ones( (24, opd.shape[-1]) )
+
+    bad = opd.copy()
+    bad[0, 100:300] = bad[0, 100:300][::-1]         # goes backward
+    bad[1, ::4] += 10.0                              # many jumps 
+    bad[2] = 0.0                                     # frozen 
+    bad[3, 10] = np.nan
+    data[5, 20] = np.inf
+    qualityWin, qualityTel, quality = computing.computeScanQuality(data, bad)
+
+    assert qualityTel[0] & computing.QUALITY_OPD_NOT_MONOTONIC
+    assert qualityTel[1] & computing.QUALITY_OPD_STEP
+    assert qualityTel[2] == computing.QUALITY_OPD_FROZEN
+    assert qualityTel[3] & computing.QUALITY_NOT_FINITE
+    assert qualityWin[5] == computing.QUALITY_NOT_FINITE
+    assert not qualityWin[0]
+    ## one frozen telescope does not flag the scan as frozen 
+    assert not (quality & computing.QUALITY_OPD_FROZEN)
+    assert quality & computing.QUALITY_NOT_FINITE
+
+
+def test_computeScanQuality_few_dropped_frames_are_tolerated():
+    opd = noisyRamps(jitter=0.0)
+    opd[:, 200:] += 2*(opd[:, 1:2]-opd[:, 0:1])      # two missing samples
+    data = np.ones( (24, opd.shape[-1]) )
+    assert computing.computeScanQuality(data, opd)[2] == 0
+    assert computing.computeScanQuality(data, opd, maxBadSteps=0.0)[2] & computing.QUALITY_OPD_STEP
+
+
+def test_computeScanQuality_saturation_and_stack():
+    opd = noisyRamps(jitter=0.0)
+    data = np.zeros( (2, 24, opd.shape[-1]) )
+    data[1, 3, 0:5] = 100.0
+    qualityWin, qualityTel, quality = computing.computeScanQuality(data, np.array([opd, opd]), 
+                                                                   saturation=100.0, maxSaturated=2)
+    assert quality.shape == (2,)
+    assert quality[0] == 0
+    assert qualityWin[1,3] == computing.QUALITY_SATURATED
+
+
+def test_computeOpdIota_split_in_psd_pos_snr():
+    data, opd = makeScan(nOpl=256)
+    dataCmb, opdCmb = computing.computeDataCmd(data, opd, config.mapABCD_H)
+    ft, fre = computing.computeDataFFT(dataCmb, opdCmb)
+    masks = computing.computeFilterMasks(fre, config.filterH, config.filterHw)
+    pos, snr, snrMean, _, meanPsd, _ = computing.computeOpdIota(ft, fre, masks=masks)
+
+    psd, splitMean, _ = computing.computePsdIota(ft)
+    assert np.allclose(splitMean, meanPsd)
+    assert np.allclose(computing.computePosIota(ft, fre, masks[1]), pos)
+    assert np.allclose(computing.computeSnrIota(psd, splitMean, masks[1], masks[2]), snr)
+    assert np.allclose(computing.computeSnrIota(splitMean, splitMean, masks[1], masks[2]), snrMean)
+
+
+class Owner(object):
+    """ something reading the arrays of an arena """
+
+
+def test_BufferArena_reuse_after_generations():
+    arena = computing.BufferArena( (24, 512, np.dtype(float)), generations=2)
+    first = arena.get("PSD", (6,512))
+    arena.next()
+    second = arena.get("PSD", (6,512))
+    assert second is not first
+    arena.next()
+    assert arena.get("PSD", (6,512)) is first
+    assert arena.get("PSD", (6,256)) is not first
+
+
+def test_BufferArena_keeps_the_arrays_of_a_live_owner():
+    arena = computing.BufferArena( (24, 512, np.dtype(float)), generations=1)
+    owner = Owner()
+    first = arena.get("PSD", (6,512))
+    first.flags.writeable = False
+    arena.lend(owner)
+    arena.next()
+    second = arena.get("PSD", (6,512))
+    assert second is not first
+    assert not first.flags.writeable
+
+    del owner
+    arena.next()
+    assert arena.get("PSD", (6,512)) is second
+    assert second.flags.writeable
+
+
+def closedLoop(nScan, predict, drift=(2.0, -1.0, 0.5, 0.0), period=0.01, lost=()):
+    """ residual pistons of a delay line loop following a drifting piston 
+
+    The offsets computed on a scan move the delay lines (relative moves, 
+    as com.sendOffsets) before the next scan. 
+    """
+    drift = np.array(drift)
+    delayLines = np.zeros_like(drift)
+    pistonFilter = None
+    residuals = []
+    for k in range(nScan):
+        time = 1000.0 + k*period
+        residual = drift*time - delayLines
+        residuals.append(residual)
+        tracking = np.ones(len(drift), bool)
+        if k in lost:
+            tracking[0] = False 
+        offsets, pistonFilter = computing.predictPiston(residual, tracking, time, 1.0, 
+                pistonFilter=pistonFilter, alpha=0.5, beta=0.1, maxGap=10)
+        if not predict:
+            offsets = residual
+        delayLines += offsets
+        pistonFilter.addCommand(offsets)
+    return np.array(residuals), pistonFilter
+
+
+def test_predictPiston_removes_the_lag_of_a_drift():
+    lag, _ = closedLoop(200, False)
+    residuals, pistonFilter = closedLoop(200, True)
+    assert np.allclose(lag[-1], np.array([2.0, -1.0, 0.5, 0.0])*0.01)
+    assert np.all(np.abs(residuals[-1]) < 0.01*np.abs(lag[-1]).max())
+    assert np.isclose(pistonFilter.period, 0.01)
+    ## relative to the delay lines: nothing accumulates 
+    assert np.all(np.abs(pistonFilter.position) < 1.0)
+
+
+def test_predictPiston_reset_after_loss_of_lock():
+    residuals, pistonFilter = closedLoop(100, True, lost=(99,))
+    assert pistonFilter.velocity[0] == 0.0
+    assert pistonFilter.velocity[1] != 0.0
+    assert pistonFilter.position[0] == residuals[-1][0]
+    assert not pistonFilter.valid[0]
+
+
+def test_computeOversamplingFactor_hysteresis():
+    nOpd = 512
+    flt = np.array([0.5, 0.7])
+    ## 2.95 to 3.05 minSampling per fringe on the fastest base 
+    factors, kept = [], []
+    for ratio in np.linspace(2.95, 3.05, 11):
+        step = 1.0/0.6/3.5/ratio
+        opd = np.array([np.zeros(nOpd), step*np.arange(nOpd)])
+        factors.append(computing.computeOversamplingFactor(opd, flt, 3.5))
+        kept.append(computing.computeOversamplingFactor(opd, flt, 3.5, current=2))
+    assert set(factors) == {2, 3}
+    assert set(kept) == {2}
+    opd = np.array([np.zeros(nOpd), np.arange(nOpd)/0.6/3.5/4.5])
+    assert computing.computeOversamplingFactor(opd, flt, 3.5, current=2) == 4
+
+
+def test_decimateData_matches_convolution():
+    rng = np.random.RandomState(3)
+    data = rng.normal(size=(3, 120))
+    factor = 4
+    polyphase = computing.computeDecimationFilter(factor)
+    taps = polyphase.ravel()
+    half = polyphase.shape[0]//2*factor
+    padded = np.concatenate( (np.repeat(data[:,0:1], half, axis=1), data, 
+                              np.repeat(data[:,-1:], half, axis=1)), axis=1)
+    reference = np.array([[ (padded[i, m*factor:m*factor+len(taps)]*taps).sum() 
+                            for m in range(data.shape[1]//factor)] for i in range(len(data))])
+    assert np.allclose(computing.decimateData(data, polyphase), reference)
+    ## a constant goes through unchanged 
+    assert np.allclose(computing.decimateData(np.ones((2,120)), polyphase), 1.0)
+
+
+def edgeMasks(nOpd=64, nIn=1, nOut=1):
+    """ in-band bins at the end of the spectrum, out-band bins at its start """
+    maskIn = np.zeros( (3, nOpd), bool)
+    maskOut = np.zeros( (3, nOpd), bool)
+    maskIn[0, nOpd-nIn:] = True
+    maskIn[1, nOpd-1:] = True
+    maskIn[2, 10:10+nIn] = True
+    maskOut[:, 1:1+nOut] = True
+    return maskIn, maskOut
+
+
+@pytest.mark.parametrize("nIn, nOut", [(1, 1), (3, 1), (1, 0), (64, 0)])
+def test_computeBandIndexes_narrow_and_edge_bands(nIn, nOut):
+    nOpd = 64
+    maskIn, maskOut = edgeMasks(nOpd, nIn, nOut)
+    bands = computing.computeBandIndexes(maskIn, maskOut)
+    for index in bands[0::2]:
+        assert index.min() >= 0 and index.max() <= nOpd-1
+    assert bands[2].max()+1 <= nOpd-1
+    assert np.array_equal(bands[1].sum(axis=-1), maskIn.sum(axis=-1))
+    assert np.array_equal(bands[5].sum(axis=-1), maskOut.sum(axis=-1))
+
+
+def test_computeOpdIota_bands_on_edge_bins():
+    rng = np.random.RandomState(2)
+    nOpd = 64
+    ft = rng.normal(size=(3, nOpd)) + 1j*rng.normal(size=(3, nOpd))
+    fre = np.tile(np.arange(nOpd, dtype=float), (3,1))
+    maskIn, maskOut = edgeMasks(nOpd, 3, 2)
+    masks = (None, maskIn, maskOut)
+    full = computing.computeOpdIota(ft, fre, masks=masks)
+    bands = computing.computeOpdIota(ft, fre, masks=masks, 
+                                     bands=computing.computeBandIndexes(maskIn, maskOut))
+    for a, b in zip(full[0:3], bands[0:3]):
+        assert np.allclose(a, b)
+
+
+def test_computeDataFFT_real_matches_complex_fft():
+    rng = np.random.RandomState(6)
+    data = rng.normal(size=(5, 128))
+    opd = np.tile(np.linspace(-10.0, 10.0, 128), (5,1))
+    ft, fre = computing.computeDataFFT(data, opd)
+    rft, rfre = computing.computeDataFFT(data, opd, real=True)
+    assert rft.shape == (5, 65)
+    assert np.allclose(rft, ft[:,0:65])
+    assert np.allclose(rfre, fre[:,0:65])
+    back = computing.computeDataFFT(rft, inverse=True, real=True, size=128)
+    assert np.allclose(back, computing.computeDataFFT(ft, inverse=True).real)
+
+
+def test_PsdBuffer_matches_the_buffer_mean():
+    """ the running sum against the mean of the last psd as first coded """
+    rng = np.random.RandomState(9)
+    size, shape = 4, (3, 16)
+    psds = rng.uniform(size=(11,)+shape)
+    psdBuffer = computing.PsdBuffer(size, shape)
+    buffer = np.zeros( (size,)+shape)
+    for id, psd in enumerate(psds):
+        buffer[id%size] = psd
+        expected = psd if id==0 else buffer.mean(axis=0)
+        assert np.allclose(psdBuffer.push(psd), expected)
+    assert np.allclose(psdBuffer.sum, psds[-size:].sum(axis=0))
+
+    ## a stack of psd gives the same means than one at a time 
+    stacked = computing.PsdBuffer(size, shape)
+    oneByOne = computing.PsdBuffer(size, shape)
+    means = stacked.push(psds)
+    for psd, mean in zip(psds, means):
+        assert np.allclose(oneByOne.push(psd), mean)
+
+
+def referenceOplMatrix(pos, snr, mapc, snrMin=2.0, niobate=False):
+    """ the pivot loop of the first python version of computeOplMatrix """
+    nTel = max(np.max(mapc[T1]), np.max(mapc[T2]))
+    nBase = np.max(mapc[BASE]) // (2 if niobate else 1)
+    snrTel = np.zeros(nTel)
+    posTel = np.zeros(nTel)
+    trueSnrTel = snrTel
+    tracking = np.zeros(nTel, bool)
+    M = np.zeros( (nTel, nBase+1))
+    for i in range(nBase):
+        M[mapc[i][T1]-1, i] = +1
+        M[mapc[i][T2]-1, i] = -1
+    snr = snr*(snr>snrMin) + 1e-10
+    snr = np.concatenate( (snr, [np.max(snr)]) )
+    pos = np.concatenate( (pos, [0.0]) )
+    nTelTracked = 0
+    for pivot in range(nTel):
+        M[:,-1] = 0.0
+        M[pivot,-1] = 1.0
+        Mt = M*snr
+        try:
+            one = np.linalg.inv(Mt.dot(M.T))
+        except np.linalg.LinAlgError:
+            continue
+        posTelP = one.dot(Mt.dot(pos))
+        snrTelP = 1.0/one.diagonal()
+        trueSnrTelP = snrTelP.copy()
+        test = snrTelP<=snrMin
+        snrTelP[test] = 0.0
+        posTelP[test] = 0.0
+        nTelTracked = (snrTel>snrMin).sum()
+        nTelTrackedP = (snrTelP>snrMin).sum()
+        if (nTelTrackedP>nTelTracked) or\
+           ((nTelTrackedP==nTelTracked) and (snrTelP.mean()>snrTel.mean())):
+            snrTel, posTel, trueSnrTel = snrTelP, posTelP, trueSnrTelP
+            nTelTracked = nTelTrackedP
+            tracking = snrTelP>0.0
+        if niobate and nTelTracked == nTel:
+            break
+    if nTelTracked<2:
+        snrTel[...] = 0.0
+        posTel[...] = 0.0
+        tracking[...] = False
+    return posTel, trueSnrTel, M[:,0:nBase].T.dot(posTel), tracking
+
+
+@pytest.mark.parametrize("snrScale", [0.0, 1.0, 3.0, 10.0, 100.0])
+def test_computeOplMatrix_matches_pivot_loop(snrScale):
+    mapc = uniqueBases(config.mapABCD_H)
+    rng = np.random.RandomState(int(snrScale))
+    pivotMatrix = computing.computePivotMatrix(mapc)
+    for i in range(20):
+        pos = rng.normal(size=len(mapc))
+        snr = snrScale*rng.uniform(size=len(mapc))
+        expected = referenceOplMatrix(pos, snr, mapc)
+        for matrix in [None, pivotMatrix]:
+            result = computing.computeOplMatrix(pos, snr, mapc, pivotMatrix=matrix)
+            for a, b in zip(result, expected):
+                assert np.allclose(a, b)
+    ## niobate: the system of one polar 
+    mapc = uniqueBases(config.mapABCD_Hpol)
+    nBase = len(mapc)//2
+    for i in range(20):
+        pos = rng.normal(size=nBase)
+        snr = snrScale*rng.uniform(size=nBase)
+        expected = referenceOplMatrix(pos, snr, mapc, niobate=True)
+        result = computing.computeOplMatrix(pos, snr, mapc, niobate=True)
+        for a, b in zip(result, expected):
+            assert np.allclose(a, b)
+
+
+def test_computeFilteredZoom_matches_computeFiltered():
+    rng = np.random.RandomState(10)
+    nOpl = 128
+    data = rng.normal(size=(2, 6, nOpl))
+    opd = np.tile(np.linspace(-20.0, 20.0, nOpl), (2, 6, 1))
+    ft, fre = computing.computeDataFFT(data, opd)
+    _, maskIn, maskOut = computing.computeFilterMasks(fre[0], 
+                    config.defaults["FILTER.IN"], config.defaults["FILTER.OUT"])
+    bands = computing.computeBandIndexes(maskIn, maskOut)
+    full, opdFiltered = computing.computeFiltered(ft, fre, None, mask=maskIn)
+    ## the zoom evaluated on the samples of the full inverse transform 
+    zoomMatrix = computing.computeZoomMatrix(fre[0], bands, opdFiltered[0,0])
+    zoom = computing.computeFilteredZoom(ft, bands, zoomMatrix)
+    assert zoom.shape == full.shape
+    assert np.allclose(zoom, full, rtol=1e-9, atol=1e-12)
+
+
+def referenceFlux(data, map):
+    """ the loop of the first python version of computeFluxPerTelescope """
+    nBase = np.max(map[BASE])
+    nTel = max(np.max(map[T1]), np.max(map[T2]))
+    pairFlux = np.zeros(nBase)
+    bases = np.zeros( (nTel, nBase))
+    for b in range(nBase):
+        id = np.where(map[BASE]==(b+1))[0]
+        pairFlux[b] = (data[id,:].mean(axis=1)).sum()
+        bases[map[id[0]][T1]-1, b] = 1.0
+        bases[map[id[0]][T2]-1, b] = 1.0
+    return np.linalg.lstsq(bases.T, pairFlux, rcond=None)[0]
+
+
+@pytest.mark.parametrize("map", [config.mapABCD_H, config.mapABCD_Hpol])
+def test_computeFluxPerTelescope_matches_lstsq(map):
+    rng = np.random.RandomState(11)
+    data = rng.uniform(size=(3, len(map), 64))
+    pinvMatrix, sumMatrix = computing.computeFluxMatrix(map)
+    flux = computing.computeFluxPerTelescope(data, map, pinvMatrix, sumMatrix)
+    for k in range(3):
+        expected = referenceFlux(data[k], map)
+        assert np.allclose(flux[k], expected)
+        assert np.allclose(computing.computeFluxPerTelescope(data[k], map), expected)
+
+
+def test_computeDifferentialPhase_matches_pivot_solve():
+    mapc = uniqueBases(config.mapABCD_Hpol)
+    rng = np.random.RandomState(12)
+    data = 2.0*(rng.normal(size=(len(mapc), 64)) + 1j*rng.normal(size=(len(mapc), 64)))
+    idUp = np.where(mapc.pol=="U")[0]
+    idDo = np.where(mapc.pol=="D")[0]
+    tmp = data*(np.abs(data) > 0.75)
+    tmp = (tmp[idDo,:]*np.conj(tmp[idUp,:])).sum(axis=1)
+    polPhases = np.arctan2(tmp.imag, tmp.real)*180./np.pi
+    expected = computing.computeOplMatrix(polPhases, polPhases*0.0+100.0, mapc, niobate=1)[0]
+
+    phaseMatrix = computing.computeDifferentialPhaseMatrix(mapc)
+    assert np.allclose(computing.computeDifferentialPhase(data, mapc, phaseMatrix), expected)
+    assert np.allclose(computing.computeDifferentialPhase(data, mapc), expected)
+
+
+def test_computeResampledData_matches_interp():
+    map = config.mapABCD_H
+    opd = noisyRamps(nOpl=256, seed=4)
+    data = np.random.RandomState(13).normal(size=(len(map), 256))
+    index, weight, opdLinear = computing.computeResampleOperator(opd, map)
+    j = np.arange(256)
+    for t in range(len(opd)):
+        assert np.allclose(opdLinear[t], np.polyval(np.polyfit(j, opd[t], 1), j))
+
+    resampled = computing.computeResampledData(data, index, weight)
+    for w, (t1, t2) in enumerate(zip(map[T1]-1, map[T2]-1)):
+        x = opd[t2] - opd[t1]
+        order = np.argsort(x, kind="mergesort")
+        grid = opdLinear[t2] - opdLinear[t1]
+        assert np.allclose(resampled[w], np.interp(grid, x[order], data[w,order]))
+    stack = computing.computeResampledData(np.array([data, 2*data]), index, weight)
+    assert np.allclose(stack[1], 2*resampled)
+
+
+def test_PsdEma_matches_the_exponential_mean():
+    rng = np.random.RandomState(14)
+    shape = (3, 16)
+    psds = rng.uniform(size=(12,)+shape)
+    psdEma = computing.PsdEma(5.0, shape)
+    expected = psds[0]
+    for id, psd in enumerate(psds):
+        if id:
+            expected = 0.8*expected + 0.2*psd
+        assert np.allclose(psdEma.push(psd), expected)
+    assert np.allclose(computing.PsdEma(5.0, shape).push(psds)[-1], expected)
+
+    ## a new number of frequencies keeps the spectrum shape 
+    fre = np.fft.fftfreq(16)
+    psdEma.mean[...] = np.exp(-fre**2/0.05)
+    psdEma.resize( (3, 32) )
+    assert psdEma.mean.shape == (3, 32)
+    newFre = np.fft.fftfreq(32)
+    inside = np.abs(newFre) <= np.abs(fre).max()
+    assert np.allclose(psdEma.mean[:,inside], np.exp(-newFre[inside]**2/0.05), atol=2e-2)
+    with pytest.raises(ValueError):
+        psdEma.resize( (4, 32) )
+
+
+def test_BackgroundModel_matches_numpy_mean():
+    rng = np.random.RandomState(15)
+    scans = 3.0 + rng.normal(size=(6, 4, 32))
+    model = computing.BackgroundModel( (4, 32), size=5)
+    for scan in scans[0:5]:
+        assert model.push(scan)
+    assert model.isComplete()
+    assert not model.push(scans[5])
+    assert model.count == 5
+    assert np.allclose(model.mean, scans[0:5].mean(axis=0))
+    assert np.allclose(model.variance, scans[0:5].var(axis=0, ddof=1))
+    scan = scans[5].copy()
+    assert model.subtract(scan) is scan
+    assert np.allclose(scan, scans[5]-scans[0:5].mean(axis=0))
+
+
+@pytest.mark.parametrize("nDark", [0, 2])
+def test_splitScan_matches_transposed_slices(nDark):
+    nTel, nSciWin, nOpd = 4, 24, 300
+    rawData = np.random.RandomState(16).normal(size=(nOpd, nTel+nSciWin+nDark))
+    expected = [rawData[:,0:nTel].T, rawData[:,nTel:nTel+nSciWin].T]
+    expected.append(rawData[:,nTel+nSciWin:].T if nDark else 0.0)
+
+    def check(parts, sciType=float):
+        for part, ref in zip(parts, expected):
+            assert np.array_equal(part, np.asarray(ref, dtype=np.asarray(part).dtype))
+        assert parts[0].dtype == rawData.dtype
+        assert parts[1].dtype == sciType
+        assert parts[1].flags.c_contiguous
+
+    check(computing.splitScan(rawData, nTel, nSciWin, block=64))
+    check(computing.splitScan(np.ascontiguousarray(rawData.T).T, nTel, nSciWin))
+    check(computing.splitScan(rawData, nTel, nSciWin, np.float32, block=7), np.float32)
+    out = (np.empty( (nTel, nOpd)), np.empty( (nSciWin, nOpd)), np.empty( (nDark, nOpd)))
+    parts = computing.splitScan(rawData, nTel, nSciWin, out=out, block=128)
+    assert parts[0] is out[0] and parts[1] is out[1]
+    check(parts)
@@ -0,0 +1,241 @@
+import numpy as np
+import pytest
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from pndrtdscope import datacom
+from pndrtdscope.datacom import DataCommunication
+
+datacom.com.VERBOSE = 0
+
+
+def runScans(nScan=2, recipies=("track",), seed=1, **configs):
+    """ run the recipies on nScan simulated scans, return the DataCommunication """
+    np.random.seed(seed)
+    dataCom = DataCommunication("test")
+    dataCom.config.update(configs)
+    for recipy in list(dataCom.recipies):
+        dataCom.recipies[recipy] = False
+    for recipy in recipies:
+        dataCom.turnRecipyOn(recipy)
+    for i in range(nScan):
+        dataCom.runRecipy("getdata")
+        dataCom.runRecipies()
+    return dataCom
+
+
+def test_abcd_track_keeps_the_psd():
+    dataCom = runScans(2, ("track", "filterPsd"), **{"OPD.ESTIMATOR": {"track": "abcd"}})
+    assert dataCom.checkStep("computeOpdPerBaseAbcd")
+    assert not dataCom.checkStep("computeOpdPerBase")
+    nBase, nOpl = dataCom.config["N.BASE"], dataCom.config["N.OPL"]
+    assert dataCom.data["PSD.MEAN"].shape == (nBase, nOpl)
+    assert dataCom.data["SNR.BASE.MEAN"].shape == (nBase,)
+    assert dataCom.data["POS.BASE"].shape == (nBase,)
+
+
+def test_abcd_track_uses_its_snr_threshold():
+    estimator = {"OPD.ESTIMATOR": {"track": "abcd"}}
+    dataCom = runScans(1, ("track",), **estimator)
+    assert dataCom.data["STATUS.TEL.TRACKING"].any()
+    dataCom = runScans(1, ("track",), **dict(estimator, **{"SNR.MIN.ABCD": 1e9}))
+    assert not dataCom.data["STATUS.TEL.TRACKING"].any()
+
+
+def test_snapshot_does_not_change_with_the_next_scan():
+    dataCom = runScans(1, ("track", "filterPsd"))
+    snapshot = dataCom.latest
+    posBase = np.array(snapshot.data["POS.BASE"])
+    timesTrack = np.array(snapshot.permanentData["TIMES.TRACK"])
+    counter = snapshot.permanentData["COUNTER.DATA"]
+    assert "DATA.BUFFER.PSD" not in snapshot.permanentData
+    with pytest.raises(TypeError):
+        snapshot.data["POS.BASE"] = None
+    with pytest.raises(ValueError):
+        snapshot.data["POS.BASE"][0] = 0.0
+    with pytest.raises(ValueError):
+        snapshot.permanentData["TIMES.TRACK"][0] = 0.0
+
+    dataCom.runRecipy("getdata")
+    dataCom.runRecipies()
+    assert dataCom.latest is not snapshot
+    assert not np.array_equal(dataCom.permanentData["TIMES.TRACK"], timesTrack)
+    assert np.array_equal(snapshot.data["POS.BASE"], posBase)
+    assert np.array_equal(snapshot.permanentData["TIMES.TRACK"], timesTrack)
+    assert snapshot.permanentData["COUNTER.DATA"] == counter
+
+
+def test_buffer_arena_does_not_overwrite_a_held_snapshot():
+    dataCom = runScans(1, ("track", "filterPsd"), **{"TEST.BUFFER.ARENA": True, 
+                                                   "BUFFER.ARENA.GENERATIONS": 1})
+    snapshot = dataCom.latest
+    psdMean = np.array(snapshot.data["PSD.MEAN"])
+    for i in range(2):
+        dataCom.runRecipy("getdata")
+        dataCom.runRecipies()
+    assert dataCom.latest.data["PSD.MEAN"] is not snapshot.data["PSD.MEAN"]
+    assert np.array_equal(snapshot.data["PSD.MEAN"], psdMean)
+
+
+def test_predictOffsets_dated_with_the_scans():
+    dataCom = runScans(3, ("track",), **{"TEST.PREDICT.OFFSET": True})
+    pistonFilter = dataCom.permanentData["PISTON.FILTER"]
+    assert pistonFilter.time == dataCom.data["TIME.MJD"]*24*3600
+    assert dataCom.data["POS.TEL.PREDICTED"].shape == dataCom.data["POS.TEL"].shape
+
+
+def test_scheduleSteps_waves():
+    dataCom = DataCommunication("test")
+    waves = dataCom.scheduleSteps(["computeOpdPerTelescope", "computeFlux"])
+    steps = [step for wave in waves for step in wave]
+    assert len(steps) == len(set(steps))
+    ## the raw and combined branches are independent 
+    assert {"combineData", "prepareRaw"} <= set(waves[0])
+    for step in ["computeDataFFTCmb", "computeFilterMasks", "computePsdCmb", 
+                 "computeOpdPerBase", "computeOpdPerTelescope"]:
+        assert step in steps
+    assert steps.index("computePsdCmb") < steps.index("computeOpdPerBase") 
+    ## the first producer of POS.BASE wins 
+    waves = dataCom.scheduleSteps(["computeOpdPerBaseAbcd", "computeOpdPerBase"])
+    steps = [step for wave in waves for step in wave]
+    assert "computeOpdPerBaseAbcd" in steps and "computeOpdPerBase" not in steps
+    ## filterCombinedData alters SCAN.SCI.CMB: after its readers 
+    waves = dataCom.scheduleSteps(["filterCombinedData", "computeOpdPerBase"])
+    steps = [step for wave in waves for step in wave]
+    assert steps.index("filterCombinedData") > steps.index("computeDataFFTCmb")
+
+
+def feedScans(dataCom, scans):
+    """ give copies of the scans to dataCom through its scanQueue """
+    dataCom.scanQueue = queue.Queue()
+    for rawData, mjd in scans:
+        dataCom.scanQueue.put( (rawData.copy(), mjd) )
+
+
+def test_concurrent_steps_give_the_same_products():
+    np.random.seed(5)
+    source = DataCommunication("test")
+    scans = [source.acquireScan() for i in range(3)]
+    recipies = ("track", "filter", "raw", "flux", "niobate")
+    products = []
+    for workers in [1, 4]:
+        dataCom = DataCommunication("test")
+        dataCom.config["STEP.WORKERS"] = workers
+        for recipy in list(dataCom.recipies):
+            dataCom.recipies[recipy] = recipy in recipies
+        dataCom.recipies["getdata"] = True
+        feedScans(dataCom, scans)
+        for scan in scans:
+            dataCom.runRecipies()
+        products.append(dataCom.data)
+    serial, concurrent = products
+    assert sorted(serial) == sorted(concurrent)
+    for key, value in serial.items():
+        if key.startswith("TIME"):
+            continue 
+        assert np.array_equal(np.asarray(value), np.asarray(concurrent[key])), key
+
+
+def test_filter_masks_kept_until_the_filter_changes():
+    dataCom = runScans(1, ("track",))
+    config = dataCom.config
+    maskIn, key = config["MASK.IN"], config["MASK.KEY"]
+    dataCom.runRecipy("getdata")
+    dataCom.runRecipies()
+    assert config["MASK.IN"] is maskIn
+    assert config["MASK.KEY"] == key
+
+    config["FILTER.IN"] = np.asarray(config["FILTER.IN"])*0.9
+    dataCom.runRecipy("getdata")
+    dataCom.runRecipies()
+    assert config["MASK.KEY"] != key
+    assert not np.array_equal(config["MASK.IN"], maskIn)
+    expected = datacom.computing.computeFilterMasks(dataCom.data["FFT.SIGMA"], 
+                    config["FILTER.IN"], config["FILTER.OUT"], 
+                    config["STRENGTH.TURBULENCE"])
+    assert np.array_equal(config["MASK.IN"], expected[1])
+    assert np.array_equal(config["MASK.OUT"], expected[2])
+
+
+def test_single_precision_matches_double():
+    np.random.seed(5)
+    source = DataCommunication("test")
+    scans = [source.acquireScan() for i in range(3)]
+    recipies = ("track", "filter", "raw", "flux")
+    products = []
+    for single in [False, True]:
+        dataCom = DataCommunication("test")
+        dataCom.config["TEST.SINGLE.PRECISION"] = single
+        for recipy in list(dataCom.recipies):
+            dataCom.recipies[recipy] = recipy in recipies
+        dataCom.recipies["getdata"] = True
+        feedScans(dataCom, scans)
+        for scan in scans:
+            dataCom.runRecipies()
+        products.append(dataCom.data)
+    double, single = products
+    assert single["SCAN.SCI.CMB"].dtype == np.complex64
+    assert single["PSD.MEAN"].dtype == np.float32
+    for key in ["SCAN.SCI.CMB", "SCAN.SCI.CMB.FILTERED", "PSD.MEAN", "POS.BASE", 
+                "SNR.BASE", "POS.TEL", "SNR.TEL", "FLUX.TEL"]:
+        scale = np.abs(double[key]).max()
+        assert np.allclose(single[key], double[key], rtol=1e-4, atol=1e-5*scale), key
+    assert np.array_equal(single["STATUS.TEL.TRACKING"], double["STATUS.TEL.TRACKING"])
+
+
+def jitteredScans(nScan=10, jitter=1e-3, seed=6):
+    """ simulated scans with a relative noise of `jitter` on the opd steps """
+    np.random.seed(seed)
+    source = DataCommunication("test")
+    nTel = source.config["N.TEL"]
+    scans = []
+    for i in range(nScan):
+        rawData, mjd = source.acquireScan()
+        opd = rawData[:,0:nTel]
+        step = np.abs(opd[1]-opd[0])
+        opd += jitter*step*np.random.normal(size=opd.shape)
+        scans.append( (rawData, mjd) )
+    return scans
+
+
+def test_filter_masks_kept_with_opd_jitter(monkeypatch):
+    scans = jitteredScans()
+    calls = []
+    build = datacom.computing.computeFilterMasks
+    def computeFilterMasks(*args, **kwargs):
+        calls.append(1)
+        return build(*args, **kwargs)
+    monkeypatch.setattr(datacom.computing, "computeFilterMasks", computeFilterMasks)
+    dataCom = DataCommunication("test")
+    for recipy in list(dataCom.recipies):
+        dataCom.recipies[recipy] = recipy=="track"
+    dataCom.recipies["getdata"] = True
+    feedScans(dataCom, scans)
+    fre = []
+    for scan in scans:
+        dataCom.runRecipies()
+        fre.append(dataCom.data["FFT.SIGMA"][:,-1].copy())
+    assert len(set(tuple(f) for f in fre)) == len(scans)
+    assert len(calls) == 1
+
+
+def test_psd_buffer_kept_with_opd_jitter():
+    scans = jitteredScans()
+    dataCom = DataCommunication("test")
+    for recipy in list(dataCom.recipies):
+        dataCom.recipies[recipy] = recipy=="track"
+    dataCom.recipies["getdata"] = True
+    feedScans(dataCom, scans)
+    dataCom.runRecipies()
+    psdBuffer = dataCom.permanentData["DATA.BUFFER.PSD"]
+    psds = [np.array(dataCom.data["PSD.CMB"])]
+    for scan in scans[1:]:
+        dataCom.runRecipies()
+        psds.append(np.array(dataCom.data["PSD.CMB"]))
+    assert dataCom.permanentData["DATA.BUFFER.PSD"] is psdBuffer
+    assert psdBuffer.id == len(scans)-1
+    size = psdBuffer.size
+    assert np.allclose(dataCom.data["PSD.MEAN"], np.mean(psds[-size:], axis=0))
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from pndrtdscope import fftbackend
+
+
+@pytest.mark.parametrize("name", fftbackend.availableBackends())
+def test_backend_matches_numpy(name):
+    backend = fftbackend.FFTBackend(name, workers=2)
+    rng = np.random.RandomState(7)
+    data = rng.normal(size=(6, 128))
+    cdata = data + 1j*rng.normal(size=(6, 128))
+
+    assert np.allclose(backend.fft(cdata), np.fft.fft(cdata, axis=-1))
+    assert np.allclose(backend.ifft(cdata), np.fft.ifft(cdata, axis=-1))
+    assert np.allclose(backend.rfft(data), np.fft.rfft(data, axis=-1))
+    half = np.fft.rfft(data, axis=-1)
+    assert np.allclose(backend.irfft(half, n=128), data)
+    assert np.allclose(backend.fft(cdata, axis=0), np.fft.fft(cdata, axis=0))
+
+    ## the cached plan is reused and writes in out
+    out = np.empty( (6, 128), complex)
+    assert backend.fft(cdata, out=out) is out
+    assert np.allclose(out, np.fft.fft(cdata, axis=-1))
+    out = np.empty( (6, 65), complex)
+    assert backend.rfft(data, out=out) is out
+    assert np.allclose(out, half)
+
+
+def test_backend_unknown_name():
+    with pytest.raises(ValueError):
+        fftbackend.FFTBackend("nothing")
+
+
+def test_numpy_backend_keeps_single_precision():
+    backend = fftbackend.FFTBackend("numpy")
+    data = np.random.RandomState(8).normal(size=(2, 64)).astype(np.float32)
+    ft = backend.rfft(data)
+    assert ft.dtype == np.complex64
+    assert backend.irfft(ft, n=64).dtype == np.float32
+    assert np.allclose(backend.irfft(ft, n=64), data, atol=1e-5)
@@ -0,0 +1,68 @@
+import threading
+import numpy as np
+import pytest
+
+try:
+    from pndrtdscope import process
+except SyntaxError:
+    ## process.py is still written for python 2
+    process = None
+
+pytestmark = pytest.mark.skipif(process is None, reason="process.py needs python 2")
+
+
+class Scans(object):
+    """ a dataCom giving numbered scans, the first `nFail` acquisitions fail """
+    def __init__(self, nFail=0):
+        self.count = 0
+        self.nFail = nFail
+        self.lock = threading.Lock()
+
+    def acquireScan(self, timeout=1000):
+        with self.lock:
+            self.count += 1
+            if self.count <= self.nFail:
+                raise RuntimeError("Data Error")
+            return (np.full( (4, 2), self.count, float), 57000.0+self.count)
+
+
+def test_AcquisitionThread_keeps_every_scan_in_order():
+    dataCom = Scans()
+    acquisition = process.AcquisitionThread(dataCom, size=3, sleepTime=0.01)
+    acquisition.start()
+    try:
+        counts = [acquisition.queue.get(timeout=5.0)[1]-57000.0 for i in range(10)]
+    finally:
+        acquisition.stop()
+        acquisition.join(5.0)
+    assert not acquisition.is_alive()
+    assert counts == list(range(1, 11))
+    ## the thread waits when the queue is full: at most one scan pending 
+    assert dataCom.count <= 10+3+1
+
+
+def test_AcquisitionThread_gives_the_errors():
+    acquisition = process.AcquisitionThread(Scans(nFail=1), size=2, sleepTime=0.01)
+    acquisition.start()
+    try:
+        first = acquisition.queue.get(timeout=5.0)
+        second = acquisition.queue.get(timeout=5.0)
+    finally:
+        acquisition.stop()
+        acquisition.join(5.0)
+    assert isinstance(first, RuntimeError)
+    assert second[1] == 57002.0
+
+
+def test_getdata_reads_the_scan_queue():
+    dataCom = process.DataCommunication("test")
+    acquisition = process.AcquisitionThread(dataCom, size=2)
+    dataCom.scanQueue = acquisition.queue
+    acquisition.start()
+    try:
+        dataCom.runRecipy("getdata")
+        assert dataCom.data["SCAN.SCI"].shape[-1] == dataCom.config["N.OPL"]
+    finally:
+        acquisition.stop()
+        acquisition.join(5.0)
+        dataCom.scanQueue = None